@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Benchmark the canonical JSON encoders used to hash stories and suggestion contexts.
+
+Pass the paths to one or more Storium exports, e.g.
+
+> python benchmarks/json_hash.py data/*.json
+"""
+import json
+import timeit
+from argparse import ArgumentParser, Namespace
+from functools import partial
+
+from woolgatherer.db import utils
+
+
+def parse_args() -> Namespace:
+    """ Parse the command line arguments """
+    parser = ArgumentParser(description="Benchmark canonical JSON hashing")
+    parser.add_argument("stories", nargs="+", help="Paths to Storium exports")
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=10,
+        help="How many times to hash each story per measurement",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="How many measurements to take (the best is reported)",
+    )
+
+    return parser.parse_args()
+
+
+def hash_all(func, stories):
+    """ Hash all the stories using the given function """
+    return [func(story) for story in stories]
+
+
+def main():
+    """ Main entry-point for the script """
+    args = parse_args()
+
+    stories = []
+    for path in args.stories:
+        with open(path, "rt") as story_file:
+            stories.append(json.load(story_file))
+
+    total_bytes = sum(len(utils.normalized_json_str(s).encode()) for s in stories)
+    print(f"{len(stories)} stories, {total_bytes / 2 ** 20:.2f} MiB of canonical JSON")
+
+    expected = [utils.json_hash(s)[1] for s in stories]
+    for name in utils.CANONICAL_JSON_ENCODERS:
+        utils.set_canonical_json_encoder(name)
+        if [utils.json_digest(s) for s in stories] != expected:
+            print(f"{name}: produces different hashes!")
+
+        for func in (utils.json_hash, utils.json_digest):
+            seconds = min(
+                timeit.repeat(
+                    partial(hash_all, func, stories),
+                    number=args.number,
+                    repeat=args.repeat,
+                )
+            )
+            throughput = total_bytes * args.number / seconds / 2 ** 20
+            print(
+                f"{name:>8} {func.__name__:>12}: "
+                f"{1000 * seconds / args.number:8.2f} ms/iter {throughput:8.2f} MiB/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark constructing suggestions from query results, as is done when polling for a
+suggestion. The scene entries of the passed in Storium exports serve as the context and
+generated entries of the suggestions.
+
+> python benchmarks/suggestion_fetch.py data/*.json
+"""
+import json
+import timeit
+from argparse import ArgumentParser, Namespace
+from functools import partial
+from uuid import uuid4
+
+from woolgatherer.db_models.suggestion import Suggestion
+from woolgatherer.models.storium import SceneEntry
+from woolgatherer.models.suggestion import SuggestionStatus, SuggestionType
+
+
+def parse_args() -> Namespace:
+    """ Parse the command line arguments """
+    parser = ArgumentParser(description="Benchmark constructing suggestions")
+    parser.add_argument("stories", nargs="+", help="Paths to Storium exports")
+    parser.add_argument(
+        "-n",
+        "--number",
+        type=int,
+        default=10,
+        help="How many times to construct each suggestion per measurement",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="How many measurements to take (the best is reported)",
+    )
+
+    return parser.parse_args()
+
+
+def make_row(entry: SceneEntry):
+    """ Make a query result for a suggestion, as returned by the db driver """
+    entry_json = json.loads(entry.json())
+    return {
+        "id": 1,
+        "uuid": uuid4(),
+        "type": SuggestionType.scene_entry,
+        "status": SuggestionStatus.done,
+        "context_hash": "",
+        "story_hash": "",
+        "context": entry_json,
+        "generated": entry_json,
+        "finalized": None,
+    }
+
+
+def validated(row):
+    """ Construct the suggestion, validating the entries like before """
+    values = dict(row)
+    values["context"] = SceneEntry(**row["context"])
+    values["generated"] = SceneEntry(**row["generated"])
+    return Suggestion.construct(set(values), **values)
+
+
+def trusted(row):
+    """ Construct the suggestion without validating the entries """
+    return Suggestion.db_construct(row, lazy=False)
+
+
+def lazy(row):
+    """ Construct the suggestion, only decoding the generated entry """
+    return Suggestion.db_construct(row).generated
+
+
+def construct_all(func, rows):
+    """ Construct all the suggestions using the given function """
+    return [func(row) for row in rows]
+
+
+def main():
+    """ Main entry-point for the script """
+    args = parse_args()
+
+    rows = []
+    for path in args.stories:
+        with open(path, "rt") as story_file:
+            story = json.load(story_file)
+
+        for scene in story.get("scenes", []):
+            for entry in scene.get("entries", []):
+                rows.append(make_row(SceneEntry(**entry)))
+
+    print(f"{len(rows)} suggestions")
+    for func in (validated, trusted, lazy):
+        seconds = min(
+            timeit.repeat(
+                partial(construct_all, func, rows),
+                number=args.number,
+                repeat=args.repeat,
+            )
+        )
+        print(
+            f"{func.__name__:>10}: "
+            f"{1e6 * seconds / args.number / len(rows):8.2f} us/suggestion"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,9 @@ EXTRAS_REQUIRE["dev"] = [
     "requests",
 ]
 EXTRAS_REQUIRE["redis"] = ["aioredis==1.3.1"]
+EXTRAS_REQUIRE["compression"] = ["brotli==1.2.0", "zstandard==0.14.0"]
+EXTRAS_REQUIRE["orjson"] = ["orjson==3.4.6"]
+EXTRAS_REQUIRE["parquet"] = ["pyarrow==2.0.0"]
 EXTRAS_REQUIRE["build"] = ["docker-compose==1.25.5", "idna==2.7"]
 EXTRAS_REQUIRE["scipy"] = ["scipy==1.3.3"]
 EXTRAS_REQUIRE["sqlite"] = ["aiosqlite==0.10.0"]
@@ -75,6 +78,9 @@ setup(
     scripts=[
         "scripts/gw",
         "scripts/gw-model",
+        "scripts/gw-apikey",
+        "scripts/gw-export",
+        "scripts/gw-compress-static",
         "scripts/gw-tasks",
         "scripts/gw-createdb",
     ],
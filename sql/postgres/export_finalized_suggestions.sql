@@ -0,0 +1,49 @@
+SELECT
+  sg.id AS id,
+  jsonb_build_object(
+    'model_name', CAST(:model_name AS TEXT),
+    'game_pid', s.story->>'game_pid',
+    'generated_text', sg.generated->>'description',
+    'user_text', sg.finalized->>'description',
+    'suggestion_id', sg.uuid,
+    'comments', fm.response,
+    'fluency', ff.response,
+    'likeability', fl.response,
+    'relevance', fr.response,
+    'coherence', fc.response
+  )::text AS record
+FROM suggestion AS sg
+  INNER JOIN story AS s
+  ON sg.story_hash = s.hash
+
+  LEFT OUTER JOIN feedback AS fm
+  ON sg.uuid = fm.suggestion_id AND fm.type::text = 'comments'
+
+  LEFT OUTER JOIN feedback AS ff
+  ON sg.uuid = ff.suggestion_id AND ff.type::text = 'fluency'
+
+  LEFT OUTER JOIN feedback AS fl
+  ON sg.uuid = fl.suggestion_id AND fl.type::text = 'likeability'
+
+  LEFT OUTER JOIN feedback AS fr
+  ON sg.uuid = fr.suggestion_id AND fr.type::text = 'relevance'
+
+  LEFT OUTER JOIN feedback AS fc
+  ON sg.uuid = fc.suggestion_id AND fc.type::text = 'coherence'
+WHERE
+  sg.id > :after
+  AND sg.finalized::text != 'null'
+  AND EXISTS (
+    SELECT 1 FROM figmentator AS m
+      INNER JOIN figmentator_for_story AS ffs
+      ON m.id = ffs.model_id
+    WHERE
+      ffs.story_hash = sg.story_hash
+      AND m.name = :model_name
+      AND :status @> array[m.status]
+  )
+  AND NOT EXISTS (
+    SELECT 1 FROM blacklisted_game AS bg WHERE bg.game_pid = s.story->>'game_pid'
+  )
+ORDER BY sg.id
+LIMIT :limit;
@@ -0,0 +1,29 @@
+SELECT
+  sg.id AS id,
+  jsonb_build_object(
+    'suggestion_id', sg.id,
+    'model_name', CAST(:model_name AS TEXT),
+    'story', CASE WHEN s.chunked THEN assemble_story(s.story) ELSE s.story END,
+    'generated', sg.generated,
+    'finalized', sg.finalized
+  )::text AS record
+FROM suggestion AS sg
+  INNER JOIN story AS s
+  ON sg.story_hash = s.hash
+WHERE
+  sg.id > :after
+  AND sg.finalized::text != 'null'
+  AND EXISTS (
+    SELECT 1 FROM figmentator AS m
+      INNER JOIN figmentator_for_story AS ffs
+      ON m.id = ffs.model_id
+    WHERE
+      ffs.story_hash = sg.story_hash
+      AND m.name = :model_name
+      AND :status @> array[m.status]
+  )
+  AND NOT EXISTS (
+    SELECT 1 FROM blacklisted_game AS bg WHERE bg.game_pid = s.story->>'game_pid'
+  )
+ORDER BY sg.id
+LIMIT :limit;
@@ -36,5 +36,7 @@ FROM figmentator AS m
 WHERE
   sg.finalized::text != 'null'
   AND :status @> array[m.status]
-  AND s.story->>'game_pid' != ALL(:blacklist)
+  AND NOT EXISTS (
+    SELECT 1 FROM blacklisted_game AS bg WHERE bg.game_pid = s.story->>'game_pid'
+  )
 ORDER BY sg.context->>'created_at';
@@ -8,7 +8,7 @@ FROM (
   SELECT
     sg.id AS suggestion_id,
     m.name AS model_name,
-    s.story AS story,
+    CASE WHEN s.chunked THEN assemble_story(s.story) ELSE s.story END AS story,
     sg.generated AS generated,
     sg.finalized AS finalized,
     ROW_NUMBER() OVER (PARTITION BY m.name ORDER BY sg.id ASC) AS rno
@@ -24,7 +24,9 @@ FROM (
   WHERE
     sg.finalized::text != 'null'
     AND :status @> array[m.status]
-    AND s.story->>'game_pid' != ALL(:blacklist)
+    AND NOT EXISTS (
+      SELECT 1 FROM blacklisted_game AS bg WHERE bg.game_pid = s.story->>'game_pid'
+    )
   ORDER BY sg.id
 ) AS context
 WHERE context.rno::FLOAT4 <= :limit
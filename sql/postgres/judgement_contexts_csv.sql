@@ -0,0 +1,70 @@
+SELECT
+  context.suggestion_id AS suggestion_id,
+  context.model_name AS model_name,
+  context.generated->>'character_seq_id' AS character_id,
+  story_character.data->>'name' AS character_name,
+  story_character.data->>'description' AS character_description,
+  story_character.data IS NOT NULL AS has_character,
+  context.generated->'target_challenge_card'->>'name' AS challenge_name,
+  context.generated->'target_challenge_card'->>'description' AS challenge_text,
+  context.generated->'target_challenge_card'->>'success_stakes'
+    AS challenge_success_description,
+  context.generated->'target_challenge_card'->>'failure_stakes'
+    AS challenge_failure_description,
+  context.generated->'cards_played_on_challenge'->0 IS NOT NULL AS has_cards,
+  context.generated->'cards_played_on_challenge'->0->>'name' AS played_card_1_name,
+  context.generated->'cards_played_on_challenge'->0->>'description'
+    AS played_card_1_description,
+  COALESCE(CASE WHEN context.chunked THEN (
+    SELECT e.data->>'description' FROM story_chunk AS e
+    WHERE e.hash = context.story->'scenes'->-1->'entries'->>-1
+  ) ELSE context.story->'scenes'->-1->'entries'->-1->>'description' END, '')
+    AS previous_entry_text,
+  context.generated->>'description' AS suggestion_text
+FROM (
+  SELECT
+    sg.id AS suggestion_id,
+    m.name AS model_name,
+    s.story AS story,
+    s.chunked AS chunked,
+    sg.generated AS generated,
+    ROW_NUMBER() OVER (PARTITION BY m.name ORDER BY sg.id ASC) AS rno
+  FROM figmentator AS m
+    INNER JOIN figmentator_for_story AS ffs
+    ON m.id = ffs.model_id
+
+    INNER JOIN suggestion AS sg
+    ON sg.story_hash = ffs.story_hash
+
+    INNER JOIN story AS s
+    ON sg.story_hash = s.hash
+  WHERE
+    sg.finalized::text != 'null'
+    AND :status @> array[m.status]
+    AND NOT EXISTS (
+      SELECT 1 FROM blacklisted_game AS bg WHERE bg.game_pid = s.story->>'game_pid'
+    )
+  ORDER BY sg.id
+) AS context
+  LEFT JOIN LATERAL (
+    SELECT c.data AS data, ch.idx AS idx
+    FROM jsonb_array_elements_text(context.story->'characters')
+      WITH ORDINALITY AS ch(hash, idx)
+      INNER JOIN story_chunk AS c
+      ON c.hash = ch.hash
+    WHERE
+      context.chunked
+      AND c.data->'character_seq_id' = context.generated->'character_seq_id'
+    UNION ALL
+    SELECT ch.data AS data, ch.idx AS idx
+    FROM jsonb_array_elements(context.story->'characters')
+      WITH ORDINALITY AS ch(data, idx)
+    WHERE
+      NOT context.chunked
+      AND ch.data->'character_seq_id' = context.generated->'character_seq_id'
+    ORDER BY idx
+    LIMIT 1
+  ) AS story_character
+  ON TRUE
+WHERE context.rno::FLOAT4 <= :limit
+ORDER BY context.model_name;
@@ -0,0 +1,7 @@
+SELECT
+    COUNT(*) AS pending_count
+FROM
+    suggestion AS s
+WHERE
+    s.status = 'pending'
+    AND s.timestamp > CURRENT_TIMESTAMP - INTERVAL '15 minutes'
@@ -0,0 +1,7 @@
+SELECT
+    COUNT(*) AS pending_count
+FROM
+    suggestion AS s
+WHERE
+    s.status = 'pending'
+    AND s.timestamp > datetime('now', '-15 minutes')
@@ -1,24 +1,21 @@
 """
 Main entry point for woolgatherer. This is where we setup the app.
 """
-import urllib
-from typing import Any, Dict
+import math
 
-import aiocache
 from fastapi import Depends, FastAPI
 from fastapi.exceptions import HTTPException
 from fastapi.exception_handlers import http_exception_handler
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.authentication import AuthenticationMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from starlette.staticfiles import StaticFiles
 from starlette.status import (
     HTTP_401_UNAUTHORIZED,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
+    HTTP_429_TOO_MANY_REQUESTS,
     HTTP_503_SERVICE_UNAVAILABLE,
 )
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
@@ -27,9 +24,12 @@ from woolgatherer.db.session import open_connection_pool, close_connection_pool
 from woolgatherer.errors import (
     InvalidOperationError,
     InsufficientCapacityError,
+    RateLimitError,
     UnauthorizedError,
 )
 from woolgatherer.metrics import initialize_metrics
+from woolgatherer.ops.api_keys import api_keys
+from woolgatherer.ops.blacklist import blacklist
 from woolgatherer.routers import (
     account,
     dashboard,
@@ -40,14 +40,28 @@ from woolgatherer.routers import (
     suggestions,
 )
 from woolgatherer.utils.auth import Requires, TokenAuthBackend
+from woolgatherer.utils.cache import initialize_caches
+from woolgatherer.utils.compression import (
+    CompressionMiddleware,
+    PrecompressedStaticFiles,
+)
 from woolgatherer.utils.settings import Settings
 
 
 app = FastAPI(debug=Settings.debug)
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+app.mount("/static", PrecompressedStaticFiles(directory="static"), name="static")
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=1000,
+    # The judgement exports are large, so favor speed over ratio, while the dataset
+    # download is already compressed
+    profiles={"/judgement": "fast", "/data/download": "none"},
+)
 app.add_middleware(
-    AuthenticationMiddleware, backend=TokenAuthBackend(Settings.access_token)
+    AuthenticationMiddleware,
+    backend=TokenAuthBackend(
+        Settings.access_token, backend_paths=("/stories", "/suggestions")
+    ),
 )
 app.add_middleware(
     SessionMiddleware, secret_key=Settings.session_token.get_secret_value()
@@ -90,42 +104,18 @@ app.include_router(
     dependencies=[Depends(Requires("backend", status_code=HTTP_404_NOT_FOUND))],
 )
 
+app.add_event_handler("startup", initialize_caches)
 app.add_event_handler("startup", open_connection_pool)
+app.add_event_handler("startup", api_keys.start)
+app.add_event_handler("startup", blacklist.start)
+app.add_event_handler("shutdown", blacklist.stop)
+app.add_event_handler("shutdown", api_keys.stop)
 app.add_event_handler("shutdown", close_connection_pool)
 
 app.add_event_handler("startup", initialize_metrics)
 app.add_event_handler("startup", frontend.initialize)
 
 
-@app.on_event("startup")
-def initialize_caches():
-    """ Initialize the cache """
-    url = urllib.parse.urlparse(Settings.cache_url)
-    cache_config: Dict[str, Any] = dict(urllib.parse.parse_qsl(url.query))
-    cache_class = aiocache.Cache.get_scheme_class(url.scheme)
-
-    if url.path:
-        cache_config.update(cache_class.parse_uri_path(url.path))
-
-    if url.hostname:
-        cache_config["endpoint"] = url.hostname
-
-    if url.port:
-        cache_config["port"] = str(url.port)
-
-    if url.password:
-        cache_config["password"] = url.password
-
-    if cache_class == aiocache.Cache.REDIS:
-        cache_config["cache"] = "aiocache.RedisCache"
-        cache_config["serializer"] = {"class": "aiocache.serializers.PickleSerializer"}
-    elif cache_class == aiocache.Cache.MEMORY:
-        cache_config["cache"] = "aiocache.SimpleMemoryCache"
-        cache_config["serializer"] = {"class": "aiocache.serializers.NullSerializer"}
-
-    aiocache.caches.set_config({"default": cache_config})
-
-
 @app.exception_handler(InvalidOperationError)
 async def invalid_operation_exception_handler(
     request: Request, exception: InvalidOperationError  # pylint:disable=unused-argument
@@ -141,9 +131,17 @@ async def insufficent_capacity_exception_handler(
     request: Request,  # pylint:disable=unused-argument
     exception: InsufficientCapacityError,
 ):
-    """ A handler for invalid operation errors """
+    """ A handler for insufficient capacity errors, including rate limiting """
+    headers = {}
+    if exception.retry_after is not None:
+        headers["Retry-After"] = str(math.ceil(exception.retry_after))
+
     return JSONResponse(
-        status_code=HTTP_503_SERVICE_UNAVAILABLE, content={"message": str(exception)}
+        status_code=HTTP_429_TOO_MANY_REQUESTS
+        if isinstance(exception, RateLimitError)
+        else HTTP_503_SERVICE_UNAVAILABLE,
+        content={"message": str(exception)},
+        headers=headers,
     )
 
 
@@ -0,0 +1,85 @@
+"""
+Statements which are compiled once and executed many times. The models only issue a
+handful of distinct query shapes (e.g. select a suggestion by its uuid), so rather than
+building and compiling a SQLAlchemy expression for every query, each shape is compiled
+once per dialect and then bound to the parameters of each query.
+
+The databases package compiles each query it is given by calling its compile method,
+so a bound statement simply hands back the cached compilation along with its
+parameters. As the resulting SQL is identical for every query of the same shape,
+asyncpg is also able to reuse its prepared statement for the query.
+"""
+from typing import Any, Dict, Optional
+
+from sqlalchemy.engine.interfaces import Compiled, Dialect
+from sqlalchemy.sql import ClauseElement
+
+
+class Statement:
+    """ A query shape, which is compiled the first time it is executed """
+
+    def __init__(self, query: ClauseElement):
+        self.query = query
+        self.dialect: Optional[Dialect] = None
+        self.compiled: Optional[Compiled] = None
+        self.defaults: Dict[str, Any] = {}
+
+    def compile(self, dialect: Dialect) -> Compiled:
+        """ Compile the query for the dialect, reusing the prior compilation """
+        if self.compiled is None or self.dialect is not dialect:
+            self.compiled = self.query.compile(dialect=dialect)
+            self.dialect = dialect
+
+            # Positional dialects, e.g. sqlite, rely on the order of the parameters
+            self.defaults = {
+                name: bind.effective_value
+                for bind, name in self.compiled.bind_names.items()
+            }
+
+        return self.compiled
+
+    def bind(self, params: Dict[str, Any]) -> "BoundStatement":
+        """ Bind the parameters to the statement """
+        return BoundStatement(self, params)
+
+
+class BoundStatement:
+    """ A statement along with the parameters to execute it with """
+
+    def __init__(self, statement: Statement, params: Dict[str, Any]):
+        self.statement = statement
+        self.params = params
+
+    def compile(self, dialect: Dialect, **kwargs) -> "CompiledStatement":
+        """ Mimic the compile method of a SQLAlchemy expression """
+        assert not kwargs, "Unsupported compile arguments"
+        compiled = self.statement.compile(dialect)
+        return CompiledStatement(
+            compiled,
+            {
+                name: self.params.get(name, value)
+                for name, value in self.statement.defaults.items()
+            },
+        )
+
+
+class CompiledStatement:
+    """
+    Mimic a SQLAlchemy compiled expression, providing the attributes the databases
+    package relies upon to execute a query and process its results.
+    """
+
+    def __init__(self, compiled: Compiled, params: Dict[str, Any]):
+        self.string = compiled.string
+        self.params = params
+
+        # pylint:disable=protected-access
+        self._bind_processors = compiled._bind_processors
+        self._result_columns = compiled._result_columns
+        self._ordered_columns = compiled._ordered_columns
+        self._textual_ordered_columns = compiled._textual_ordered_columns
+        # pylint:enable=protected-access
+
+    def construct_params(self) -> Dict[str, Any]:
+        """ Return the parameters to execute the statement with """
+        return self.params
@@ -4,19 +4,24 @@ Cross driver wrapper for SQLAlchemy db types
 import json
 import uuid
 import datetime
+from copy import deepcopy
 from enum import Enum
-from typing import Any, Dict, Mapping, Union
+from typing import Any, Dict, Mapping, Type, Union
 import sqlalchemy as sa
 from sqlalchemy.types import TypeDecorator, CHAR
 from sqlalchemy.dialects.postgresql import UUID, JSONB as _JSONB
 from sqlalchemy.dialects.sqlite import JSON as _JSON
 
 from pydantic import BaseModel, Json
+from pydantic.fields import ModelField, SHAPE_MAPPING, SHAPE_SINGLETON
 from woolgatherer.db.utils import has_postgres
 
 JSON = _JSONB if has_postgres() else _JSON
 ModelMetaClass = type(BaseModel)
 
+# Types which never need to be copied
+ImmutableTypes = (type(None), bool, int, float, str, bytes, Enum)
+
 
 class GUID(TypeDecorator):
     """Platform-independent GUID type.
@@ -168,10 +173,69 @@ def to_db_type(obj: Any) -> Any:
     return obj
 
 
+def is_model_type(cls: type) -> bool:
+    """ Whether the type is a model, which is stored as JSON in the database """
+    return type(cls) is ModelMetaClass  # pylint:disable=unidiomatic-typecheck
+
+
+def construct_value(field: ModelField, value: Any) -> Any:
+    """ Construct the value of a field from trusted JSON data """
+    if value is None:
+        return value
+
+    if is_model_type(field.type_):
+        if field.shape == SHAPE_SINGLETON:
+            return construct_model(field.type_, value)
+
+        if field.shape == SHAPE_MAPPING:
+            return {k: construct_model(field.type_, v) for k, v in value.items()}
+
+        return [construct_model(field.type_, v) for v in value]
+
+    if field.sub_fields and isinstance(value, (dict, list)):
+        # A union, so use the first model type which can hold the value
+        for sub_field in field.sub_fields:
+            if is_model_type(sub_field.type_) and isinstance(value, dict) == (
+                sub_field.shape in (SHAPE_SINGLETON, SHAPE_MAPPING)
+            ):
+                return construct_value(sub_field, value)
+
+    return value
+
+
+def construct_model(cls: Type[BaseModel], data: Dict[str, Any]) -> BaseModel:
+    """
+    Construct the model from trusted JSON data, i.e. data we validated before writing
+    it to the database, so it is not validated again. Nested models are constructed,
+    while other values are left in their JSON form, e.g. enums as their values, which
+    serialize identically.
+    """
+    values = {}
+    fields_set = set()
+    for name, field in cls.__fields__.items():
+        if field.alias in data:
+            values[name] = construct_value(field, data[field.alias])
+            fields_set.add(name)
+        elif isinstance(field.default, ImmutableTypes):
+            # Avoid the deepcopy of all the defaults done by BaseModel.construct, which
+            # otherwise dominates the time needed to construct the model
+            values[name] = field.default
+        else:
+            values[name] = deepcopy(field.default)
+
+    model = cls.__new__(cls)
+    object.__setattr__(model, "__dict__", values)
+    object.__setattr__(model, "__fields_set__", fields_set)
+    return model
+
+
 def from_db_type(cls: type, obj: Any) -> Any:
-    """ Convert an object to a type acceptable by the database """
-    if type(cls) is ModelMetaClass:  # pylint:disable=unidiomatic-typecheck
-        if isinstance(obj, str):
-            return cls(**json.loads(obj))
+    """ Convert an object from the type stored in the database """
+    if is_model_type(cls):
+        if isinstance(obj, (str, bytes)):
+            obj = json.loads(obj)
+
+        if isinstance(obj, dict):
+            return construct_model(cls, obj)
 
     return obj
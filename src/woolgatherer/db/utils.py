@@ -3,6 +3,7 @@ DB utilities
 """
 import os
 import json
+import math
 import hashlib
 from uuid import UUID
 from functools import partial
@@ -11,7 +12,10 @@ from typing import Any, Dict, Tuple
 from importlib.util import find_spec
 
 import aiofiles
+import sqlalchemy as sa
 from async_lru import alru_cache as lru_cache
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql.expression import Insert
 
 try:
     from asyncpg.exceptions import (  # pylint: disable=unused-import
@@ -20,6 +24,11 @@ try:
 except ImportError:
     from sqlite3 import IntegrityError  # pylint: disable=unused-import
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def has_postgres() -> bool:
     """ Whether to use postgres """
@@ -36,6 +45,17 @@ async def load_query(filename: str) -> str:
         return await sql.read()
 
 
+def insert_ignore(table: sa.Table) -> Insert:
+    """
+    Create an insert statement which silently skips rows that violate a unique
+    constraint, e.g. rows that were concurrently inserted by another request.
+    """
+    if has_postgres():
+        return pg_insert(table).on_conflict_do_nothing()
+
+    return table.insert().prefix_with("OR IGNORE")
+
+
 class JSONEncoder(json.JSONEncoder):
     """ A custom JSON encoder which handles datetime objects """
 
@@ -57,6 +77,98 @@ def normalized_json_str(json_obj: Dict[str, Any]) -> str:
     return json_dumps(json_obj, sort_keys=True, ensure_ascii=False)
 
 
+class CanonicalJSONEncoder:
+    """
+    Encodes JSON into its canonical form, i.e. sorted keys, no extraneous space, and
+    utf-8 encoded, such that equal objects always produce the same bytes.
+    """
+
+    def encode(self, json_obj: Dict[str, Any]) -> bytes:
+        """ Encode the JSON object into its canonical form """
+        return normalized_json_str(json_obj).encode("utf-8")
+
+
+def has_exponent_floats(json_obj: Any) -> bool:
+    """
+    Whether the JSON object contains a float which the standard library encodes with
+    an exponent (e.g. 1e-05), or which is not finite (e.g. NaN)
+    """
+    stack = [json_obj]
+    while stack:
+        obj = stack.pop()
+        obj_type = type(obj)
+        if obj_type is dict:
+            stack.extend(obj.values())
+        elif obj_type is list:
+            stack.extend(obj)
+        elif obj_type is str or obj_type is int or obj is None:
+            continue
+        elif isinstance(obj, float):
+            if not math.isfinite(obj) or "e" in float.__repr__(obj):
+                return True
+        elif isinstance(obj, dict):
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+
+    return False
+
+
+class OrjsonCanonicalEncoder(CanonicalJSONEncoder):
+    """
+    A much faster canonical JSON encoder based on orjson, which produces exactly the
+    same bytes as the standard library encoder, since changing the encoding changes
+    the hashes of existing stories and contexts. The encoders only differ in how they
+    format floats that require an exponent and non-finite floats, in which case (or
+    anything else orjson cannot encode) the standard library encoder is used instead.
+    """
+
+    OPTIONS = (
+        orjson.OPT_SORT_KEYS
+        | orjson.OPT_PASSTHROUGH_DATACLASS
+        | orjson.OPT_PASSTHROUGH_DATETIME
+        if orjson
+        else 0
+    )
+
+    @staticmethod
+    def default(o):
+        """ Serialize datetime objects the same way as JSONEncoder """
+        if isinstance(o, datetime):
+            return o.isoformat(" ")
+
+        raise TypeError
+
+    def encode(self, json_obj: Dict[str, Any]) -> bytes:
+        """ Encode the JSON object into its canonical form """
+        if has_exponent_floats(json_obj):
+            return super().encode(json_obj)
+
+        try:
+            return orjson.dumps(json_obj, default=self.default, option=self.OPTIONS)
+        except orjson.JSONEncodeError:
+            # orjson is stricter than the standard library, e.g. it does not support
+            # integers larger than 64-bits or non-string keys, so fallback in that case
+            return super().encode(json_obj)
+
+
+CANONICAL_JSON_ENCODERS: Dict[str, CanonicalJSONEncoder] = {
+    "json": CanonicalJSONEncoder()
+}
+if orjson:
+    CANONICAL_JSON_ENCODERS["orjson"] = OrjsonCanonicalEncoder()
+
+canonical_json_encoder: CanonicalJSONEncoder = CANONICAL_JSON_ENCODERS[
+    "orjson" if orjson else "json"
+]
+
+
+def set_canonical_json_encoder(name: str):
+    """ Set the encoder used for generating canonical JSON """
+    global canonical_json_encoder  # pylint: disable=global-statement
+    canonical_json_encoder = CANONICAL_JSON_ENCODERS[name]
+
+
 def json_hash(json_obj: Dict[str, Any]) -> Tuple[str, str]:
     """
     Generate a consistent hash for a given JSON object. We need this in order
@@ -66,9 +178,17 @@ def json_hash(json_obj: Dict[str, Any]) -> Tuple[str, str]:
     go over!
     """
     hasher = hashlib.md5()
-    json_str = normalized_json_str(json_obj)
-    hasher.update(json_str.encode("utf-8"))
-    return json_str, hasher.hexdigest()
+    json_bytes = canonical_json_encoder.encode(json_obj)
+    hasher.update(json_bytes)
+    return json_bytes.decode("utf-8"), hasher.hexdigest()
+
+
+def json_digest(json_obj: Dict[str, Any]) -> str:
+    """
+    Generate the same hash as json_hash, but without decoding the normalized JSON,
+    which is all that is needed when deduplicating objects.
+    """
+    return hashlib.md5(canonical_json_encoder.encode(json_obj)).hexdigest()
 
 
 def uuid_str(uuid: UUID):
@@ -2,10 +2,24 @@
 Load all the models
 """
 from .base import DBBaseModel
-from .storium import Story
+from .api_key import ApiKey, ApiKeyStatus
+from .blacklist import BlacklistedGame
+from .storium import LatestStory, Story, StoryChunk, StoryChunkRef
 from .suggestion import Suggestion
 from .feedback import Feedback
 from .figmentator import Figmentator, FigmentatorStatus
 
 
-__all__ = ["DBBaseModel", "Story", "Feedback", "Figmentator", "FigmentatorStatus"]
+__all__ = [
+    "DBBaseModel",
+    "ApiKey",
+    "ApiKeyStatus",
+    "BlacklistedGame",
+    "LatestStory",
+    "Story",
+    "StoryChunk",
+    "StoryChunkRef",
+    "Feedback",
+    "Figmentator",
+    "FigmentatorStatus",
+]
@@ -0,0 +1,33 @@
+"""
+API keys which grant access to the backend endpoints
+"""
+from enum import auto
+
+from pydantic import Field
+
+from woolgatherer.db_models.base import DBBaseModel
+from woolgatherer.models.utils import AutoNamedEnum
+
+
+class ApiKeyStatus(AutoNamedEnum):
+    """
+    An enum denoting the states an api key can be in. One of:
+
+    - **active**: The key can be used to access the backend
+    - **revoked**: The key can no longer be used
+    """
+
+    active = auto()
+    revoked = auto()
+
+
+class ApiKey(DBBaseModel):
+    """
+    This is the db model for an api key. Only a hash of the key is stored, so the key
+    itself cannot be recovered from the db.
+    """
+
+    name: str = Field(..., unique=True)
+    key_hash: str = Field(..., unique=True)
+    status: ApiKeyStatus = Field(ApiKeyStatus.active)
+    request_count: int = Field(0, server_default="0")
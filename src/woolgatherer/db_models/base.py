@@ -1,10 +1,12 @@
 """
 The base class for all SQLAlchemy models
 """
+from functools import lru_cache
 from typing import (
     Any,
     ClassVar,
     Dict,
+    FrozenSet,
     List,
     Mapping,
     Tuple,
@@ -18,12 +20,15 @@ from typing import (
 )
 
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.schema import Constraint
-from sqlalchemy.sql.expression import select, and_
+from sqlalchemy.sql.expression import ClauseElement, and_, bindparam, select
 from databases import Database
 from pydantic import BaseConfig, BaseModel, Field, Json
 
 from woolgatherer.db import types
+from woolgatherer.db.statements import BoundStatement, Statement
+from woolgatherer.db.utils import has_postgres, insert_ignore
 from woolgatherer.errors import InvalidOperationError
 from woolgatherer.utils import snake_case
 
@@ -70,14 +75,19 @@ class DBBaseModel(BaseModel, metaclass=DBModelMetaClass):
 
     __table__: sa.Table
     __metadata__: sa.MetaData = sa.MetaData()
-    __slots__ = ('_modified',)
+    __slots__ = ("_modified", "_undecoded")
+
+    # The fields which hold models, and thus are stored as JSON in the db
+    __json_fields__: FrozenSet[str] = frozenset()
 
     # What if any fields have been updated after creation. This allows db update to only
     # set newly changed values.
     _modified: Dict[str, bool]
 
-    id: Optional[int] = Field(..., primary_key=True, autoincrement=True)
+    # The JSON of fields which have been loaded from the db, but have yet to be decoded
+    _undecoded: Dict[str, Any]
 
+    id: Optional[int] = Field(..., primary_key=True, autoincrement=True)
 
     @classmethod
     def __init_subclass__(cls, constraints: Sequence[Constraint] = tuple()) -> None:
@@ -121,6 +131,11 @@ class DBBaseModel(BaseModel, metaclass=DBModelMetaClass):
         cls.__table__ = sa.Table(
             snake_case(cls.__name__), DBBaseModel.__metadata__, *columns, *constraints
         )
+        cls.__json_fields__ = frozenset(
+            name
+            for name, field in cls.__fields__.items()
+            if types.is_model_type(field.type_)
+        )
 
     class Config(BaseConfig):
         """ Configure the pydantic model """
@@ -130,14 +145,57 @@ class DBBaseModel(BaseModel, metaclass=DBModelMetaClass):
     def __new__(cls: Type['DBBaseModel'], **kwargs) -> 'DBBaseModel':
         self = super().__new__(cls)
         object.__setattr__(self, "_modified", {})
+        object.__setattr__(self, "_undecoded", {})
 
         return self
 
     def __setattr__(self, key: str, value: Any):
         """ Set an attribute """
         super().__setattr__(key, value)
+        self._undecoded.pop(key, None)
         self._modified[key] = True
 
+    def __getattr__(self, key: str) -> Any:
+        """ Decode fields loaded from the db upon first access """
+        if key.startswith("_") or key not in self._undecoded:
+            raise AttributeError(
+                f"'{type(self).__name__}' object has no attribute '{key}'"
+            )
+
+        value = types.from_db_type(self.__fields__[key].type_, self._undecoded.pop(key))
+        self.__dict__[key] = value
+        return value
+
+    def decode_all(self):
+        """ Decode any fields which have yet to be decoded """
+        for key in tuple(self._undecoded):
+            getattr(self, key)
+
+    def dict(self, **kwargs) -> Dict[str, Any]:  # type: ignore
+        """ Generate a dictionary representation of the model """
+        self.decode_all()
+        return super().dict(**kwargs)
+
+    def copy(self, **kwargs) -> "DBBaseModel":  # type: ignore
+        """ Duplicate the model """
+        self.decode_all()
+        return super().copy(**kwargs)
+
+    def __iter__(self):
+        """ Iterate over the fields of the model """
+        self.decode_all()
+        return super().__iter__()
+
+    def __getstate__(self) -> Dict[str, Any]:
+        """ Get the state of the model for pickling """
+        self.decode_all()
+        return super().__getstate__()
+
+    def __repr_args__(self):
+        """ Get the fields to display in the repr of the model """
+        self.decode_all()
+        return super().__repr_args__()
+
     def db_dict(
         self,
         *,
@@ -202,24 +260,104 @@ class DBBaseModel(BaseModel, metaclass=DBModelMetaClass):
         )
         self._modified.clear()
 
+    @classmethod
+    async def insert_many(
+        cls: Type["DBModel"],
+        db: Database,
+        models: Sequence["DBModel"],
+        *,
+        include_columns: Optional[Union[str, Set[str]]] = None,
+        exclude_columns: Optional[Union[str, Set[str]]] = None,
+        ignore_conflicts: bool = False,
+    ):
+        """
+        Insert the models into the db using a single multi-row insert, rather than a
+        round-trip per model. Optionally skip rows which violate a unique constraint.
+        """
+        if not models:
+            return
+
+        table = cls.__table__
+        query = insert_ignore(table) if ignore_conflicts else table.insert()
+        await db.execute(
+            query=query.values(
+                [
+                    model.db_dict(
+                        include=include_columns, exclude=exclude_columns, defaults=True
+                    )
+                    for model in models
+                ]
+            )
+        )
+        for model in models:
+            model._modified.clear()  # pylint:disable=protected-access
+
+    @classmethod
+    async def upsert(
+        cls: Type["DBModel"],
+        db: Database,
+        models: Sequence["DBModel"],
+        *,
+        conflict_columns: Sequence[str],
+        update_columns: Optional[Sequence[str]] = None,
+    ):
+        """
+        Insert the models into the db. Rows which conflict with an existing row on the
+        conflict columns instead update the existing row's update columns, which
+        default to all the inserted columns. Pass empty update columns to leave
+        conflicting rows unchanged.
+        """
+        if not models:
+            return
+
+        table = cls.__table__
+        rows = [model.db_dict(defaults=True) for model in models]
+        if update_columns is None:
+            update_columns = [c for c in rows[0] if c not in conflict_columns]
+
+        if has_postgres():
+            query = pg_insert(table).values(rows)
+            if update_columns:
+                query = query.on_conflict_do_update(
+                    index_elements=conflict_columns,
+                    set_={c: query.excluded[c] for c in update_columns},
+                )
+            else:
+                query = query.on_conflict_do_nothing(index_elements=conflict_columns)
+
+            await db.execute(query=query)
+        else:
+            # SQLAlchemy cannot generate an upsert for sqlite, so insert the new rows,
+            # then update the existing ones
+            async with db.transaction():
+                await db.execute(query=insert_ignore(table).values(rows))
+                if update_columns:
+                    for row in rows:
+                        clauses = tuple(
+                            table.columns[c] == row[c] for c in conflict_columns
+                        )
+                        await db.execute(
+                            query=table.update(
+                                values={c: row[c] for c in update_columns}
+                            ).where(and_(*clauses))
+                        )
+
+        for model in models:
+            model._modified.clear()  # pylint:disable=protected-access
+
     async def delete(self, db: Database, *, where: Optional[Dict[str, Any]] = None):
         """
         Delete the current model from the db. Either and id or a where clause must be provided.
         """
-        table = type(self).__table__
-        query = table.delete()
+        if not where:
+            if self.id is None:
+                raise InvalidOperationError(
+                    f"Cowardly refusing to delete all {type(self).__name__}"
+                )
 
-        if where:
-            clauses = tuple(table.columns[c] == v for c, v in where.items())
-            query = query.where(and_(*clauses))
-        elif self.id is not None:
-            query = query.where(table.columns["id"] == self.id)
-        else:
-            raise InvalidOperationError(
-                f"Cowardly refusing to delete all {type(self).__name__}"
-            )
+            where = {"id": self.id}
 
-        await db.execute(query=query)
+        await db.execute(query=type(self)._query("delete", where=where))
         self._modified.clear()
 
     async def update(
@@ -235,65 +373,170 @@ class DBBaseModel(BaseModel, metaclass=DBModelMetaClass):
         Update the model the db. Make sure to only update values that have
         actually been set, or defaults if provided.
         """
-        table = type(self).__table__
-        query = table.update(
-            values=self.db_dict(
+        if not where:
+            if self.id is None:
+                raise InvalidOperationError(
+                    f"Cowardly refusing to update all {type(self).__name__}"
+                )
+
+            where = {"id": self.id}
+
+        values = self.db_dict(
+            include=include_columns,
+            exclude=exclude_columns,
+            modified_only=modified_only,
+        )
+        if values:
+            await db.execute(
+                query=type(self)._query("update", where=where, values=values)
+            )
+
+        self._modified.clear()
+
+    @classmethod
+    async def update_many(
+        cls: Type["DBModel"],
+        db: Database,
+        models: Sequence["DBModel"],
+        *,
+        where_columns: Sequence[str] = ("id",),
+        include_columns: Optional[Union[str, Set[str]]] = None,
+        exclude_columns: Optional[Union[str, Set[str]]] = None,
+        modified_only: bool = True,
+    ):
+        """
+        Update the models in the db within a single transaction, matching each model
+        to its row by the values of the where columns. Models with no values to update
+        are skipped.
+        """
+        table = cls.__table__
+        queries = []
+        for model in models:
+            values = model.db_dict(
                 include=include_columns,
                 exclude=exclude_columns,
                 modified_only=modified_only,
             )
-        )
+            if not values:
+                continue
 
-        if where:
-            clauses = tuple(table.columns[c] == v for c, v in where.items())
-            query = query.where(and_(*clauses))
-        elif self.id is not None:
-            query = query.where(table.columns["id"] == self.id)
-        else:
-            raise InvalidOperationError(
-                f"Cowardly refusing to update all {type(self).__name__}"
+            clauses = tuple(
+                table.columns[c] == types.to_db_type(getattr(model, c))
+                for c in where_columns
             )
+            queries.append(table.update(values=values).where(and_(*clauses)))
 
-        await db.execute(query=query)
-        self._modified.clear()
+        if queries:
+            async with db.transaction():
+                for query in queries:
+                    await db.execute(query=query)
+
+        for model in models:
+            model._modified.clear()  # pylint:disable=protected-access
 
     @classmethod
-    def _select_query(
+    @lru_cache(maxsize=None)
+    def _statement(
         cls: Type["DBModel"],
-        columns: Optional[Union[str, Sequence[str]]] = None,
-        where: Optional[Dict[str, Any]] = None,
-    ) -> Optional["DBModel"]:
-        """ Generate a select statement for the type """
+        operation: str,
+        columns: Tuple[str, ...],
+        where: Tuple[Tuple[str, bool], ...],
+    ) -> Statement:
+        """
+        Build the statement for a query shape. A shape is the operation, the columns
+        selected or updated, and the columns in the where clause along with whether
+        they are compared to null. As there are only a handful of distinct shapes,
+        each is only built and compiled once.
+        """
         table = cls.__table__
-        if columns:
-            if isinstance(columns, str):
-                columns = (columns,)
-
-            columns = tuple(table.columns[c] for c in columns)
-            query = select(columns=columns)
+        query: ClauseElement
+        if operation == "select":
+            if columns:
+                query = select(columns=tuple(table.columns[c] for c in columns))
+            else:
+                # Explicitly select all columns rather than empty `table.select()`, otherwise
+                # the databases package will return "raw" results, i.e. string result rather than
+                # converting to python types
+                query = select(columns=tuple(table.columns.values()))
+        elif operation == "update":
+            query = table.update(values={c: bindparam(f"value_{c}") for c in columns})
+        elif operation == "delete":
+            query = table.delete()
         else:
-            # Explicitly select all columns rather than empty `table.select()`, otherwise
-            # the databases package will return "raw" results, i.e. string result rather than
-            # converting to python types
-            query = select(columns=tuple(table.columns.values()))
+            raise ValueError(f"Unknown operation: {operation}")
 
         if where:
-            clauses = tuple(table.columns[c] == v for c, v in where.items())
+            clauses = tuple(
+                table.columns[c].is_(None)
+                if is_null
+                else table.columns[c] == bindparam(f"where_{c}")
+                for c, is_null in where
+            )
             query = query.where(and_(*clauses))
 
-        return query
+        return Statement(query)
 
     @classmethod
-    def db_construct(cls: Type["DBModel"], result) -> "DBModel":
-        """ Construct an object of the class from a query result """
-        return cls.construct(
-            set(result.keys()),
-            **{
-                k: types.from_db_type(cls.__fields__[k].type_, v)
-                for k, v in result.items()
-            },
+    def _query(
+        cls: Type["DBModel"],
+        operation: str,
+        *,
+        columns: Optional[Union[str, Sequence[str]]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        values: Optional[Dict[str, Any]] = None,
+    ) -> BoundStatement:
+        """ Generate a query for the type, reusing the statement for its shape """
+        if isinstance(columns, str):
+            columns = (columns,)
+
+        where = where or {}
+        values = values or {}
+        statement = cls._statement(
+            operation,
+            tuple(values) if operation == "update" else tuple(columns or ()),
+            tuple(sorted((c, v is None) for c, v in where.items())),
         )
 
+        params = {f"where_{c}": v for c, v in where.items()}
+        params.update((f"value_{c}", v) for c, v in values.items())
+        return statement.bind(params)
+
+    @classmethod
+    def _select_query(
+        cls: Type["DBModel"],
+        columns: Optional[Union[str, Sequence[str]]] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> BoundStatement:
+        """ Generate a select statement for the type """
+        return cls._query("select", columns=columns, where=where)
+
+    @classmethod
+    def db_construct(cls: Type["DBModel"], result, *, lazy: bool = True) -> "DBModel":
+        """
+        Construct an object of the class from a query result. The results are trusted,
+        as they were validated before being written to the db, so they are not
+        validated again. Unless lazy is False, fields stored as JSON are only decoded
+        into models upon first access.
+        """
+        values = {}
+        undecoded = {}
+        for key, value in result.items():
+            if key in cls.__json_fields__ and value is not None:
+                undecoded[key] = value
+            else:
+                values[key] = types.from_db_type(cls.__fields__[key].type_, value)
+
+        model = cls.construct(set(result.keys()), **values)
+        for key in undecoded:
+            # Remove any default, so the field is decoded upon access
+            model.__dict__.pop(key, None)
+
+        model._undecoded.update(undecoded)  # pylint:disable=protected-access
+        if not lazy:
+            model.decode_all()
+
+        return model
+
     @classmethod
     async def select(
         cls: Type["DBModel"],
@@ -0,0 +1,15 @@
+"""
+Blacklist database model
+"""
+from pydantic import Field
+
+from woolgatherer.db_models.base import DBBaseModel
+
+
+class BlacklistedGame(DBBaseModel):
+    """
+    A game whose suggestions are excluded from the dashboard and judgements. The table
+    mirrors static/game_blacklist.txt, such that queries can anti-join against it.
+    """
+
+    game_pid: str = Field(..., unique=True, index=True)
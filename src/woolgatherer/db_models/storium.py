@@ -1,6 +1,17 @@
 """
 Storium database models
 """
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import false
+from sqlalchemy.schema import DDL
+
+# pylint incorrectly complains about unused import for UniqueConstraint... not sure why
+from sqlalchemy.schema import (  # pylint:disable=unused-import
+    ForeignKey,
+    UniqueConstraint,
+)
 from pydantic import Field
 
 from woolgatherer.db_models.base import DBBaseModel
@@ -8,14 +19,112 @@ from woolgatherer.models.stories import StoryStatus
 from woolgatherer.models.utils import Json
 
 
+# The format of the exported_at column of stories, which sorts chronologically
+EXPORT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+
+# Reassemble a story from its manifest in SQL, such that queries which need the full
+# story (like exporting judgement contexts) do not need to round-trip through python.
+# Migration 3b9d6c1f2a7e has a frozen copy, so changes also need a new migration.
+ASSEMBLE_STORY = """
+CREATE OR REPLACE FUNCTION assemble_story(manifest jsonb) RETURNS jsonb AS $$
+  SELECT manifest
+    || jsonb_build_object('characters', COALESCE((
+      SELECT jsonb_agg(c.data ORDER BY ch.idx)
+      FROM jsonb_array_elements_text(manifest->'characters')
+        WITH ORDINALITY AS ch(hash, idx)
+        INNER JOIN story_chunk AS c
+        ON c.hash = ch.hash), '[]'::jsonb))
+    || jsonb_build_object('scenes', COALESCE((
+      SELECT jsonb_agg(sc.data || jsonb_build_object('entries', COALESCE((
+        SELECT jsonb_agg(e.data ORDER BY en.idx)
+        FROM jsonb_array_elements_text(s.ref->'entries')
+          WITH ORDINALITY AS en(hash, idx)
+          INNER JOIN story_chunk AS e
+          ON e.hash = en.hash), '[]'::jsonb)) ORDER BY s.idx)
+      FROM jsonb_array_elements(manifest->'scenes') WITH ORDINALITY AS s(ref, idx)
+        INNER JOIN story_chunk AS sc
+        ON sc.hash = s.ref->>'scene'), '[]'::jsonb))
+$$ LANGUAGE sql STABLE;
+"""
+
+
 class Story(DBBaseModel):
     """
     The base model for a story, which is currently just a JSON object with the
     structure defined in:
 
     https://storium.com/help/export/json/0.9.2
+
+    If the story is chunked, then the scenes, entries, and characters of the story are
+    replaced by the hashes of the StoryChunks which contain them.
+
+    The game_pid and exported_at of the story are copied into their own columns, such
+    that superseded versions of a game can be found through an index. The exported_at
+    column is in UTC, formatted with EXPORT_TIME_FORMAT, so it sorts chronologically.
     """
 
     story: Json = Field(...)
     hash: str = Field(..., unique=True, index=True)
     status: StoryStatus = Field(StoryStatus.pending, server_default=StoryStatus.pending)
+    chunked: bool = Field(False, server_default=false())
+    game_pid: Optional[str] = Field(None)
+    exported_at: Optional[str] = Field(None)
+
+
+class LatestStory(DBBaseModel):
+    """
+    The export time of the newest story for each game. Each story created for the game
+    increments the version, while cleaned_version is the version for which the
+    superseded stories of the game were last cleaned up.
+    """
+
+    game_pid: str = Field(..., unique=True, index=True)
+    exported_at: str = Field(...)
+    version: int = Field(1, server_default="1")
+    cleaned_version: int = Field(0, server_default="0")
+
+
+class StoryChunk(DBBaseModel):
+    """
+    A piece of a story, i.e. a scene, an entry, or a character. Consecutive exports of
+    a game share nearly all of their content, so each chunk is stored only once based
+    on the hash of its content.
+    """
+
+    data: Json = Field(...)
+    hash: str = Field(..., unique=True, index=True)
+
+
+class StoryChunkRef(
+    DBBaseModel, constraints=[UniqueConstraint("story_hash", "chunk_hash")]
+):
+    """
+    This table maps stories to the chunks they reference
+    """
+
+    story_hash: str = Field(...)
+    chunk_hash: str = Field(..., index=True, foriegn_key=ForeignKey("story_chunk.hash"))
+
+
+# Find the superseded versions of a game, i.e. those exported before the latest story
+sa.Index(
+    "ix_story_game_pid_exported_at",
+    Story.__table__.c.game_pid,
+    Story.__table__.c.exported_at,
+)
+
+# Find the games which have superseded stories to cleanup
+sa.Index(
+    "ix_latest_story_pending_cleanup",
+    LatestStory.__table__.c.id,
+    postgresql_where=(
+        LatestStory.__table__.c.version > LatestStory.__table__.c.cleaned_version
+    ),
+)
+
+sa.event.listen(
+    StoryChunk.__table__,
+    "after_create",
+    DDL(ASSEMBLE_STORY).execute_if(dialect="postgresql"),
+)
@@ -1,7 +1,7 @@
 """
 Exceptions specifc to feedback
 """
-from typing import Union
+from typing import Optional, Union
 
 from starlette.exceptions import HTTPException
 from starlette.responses import RedirectResponse
@@ -14,11 +14,23 @@ class InvalidOperationError(RuntimeError):
 class InsufficientCapacityError(RuntimeError):
     """ Do not have the capacity to complete a requested operation """
 
+    def __init__(self, *args, retry_after: Optional[float] = None):
+        super().__init__(*args)
+        self.retry_after = retry_after
+
+
+class RateLimitError(InsufficientCapacityError):
+    """ A client has made too many requests in a short period of time """
+
 
 class ProcessingError(ValueError):
     """ There was some error in figment generation """
 
 
+class InvalidStoryDeltaError(ValueError):
+    """ A story delta cannot be applied to its base story """
+
+
 class UnauthorizedError(HTTPException):
     """ User tried to access a resource without proper authorization """
 
@@ -0,0 +1,62 @@
+"""
+Defines the structure of dataset exports
+"""
+from enum import auto
+from typing import Dict, List
+
+from pydantic import BaseModel, Field
+
+from woolgatherer.models.utils import AutoNamedEnum
+
+
+class ExportKind(AutoNamedEnum):
+    """
+    What data to export:
+
+    - **judgement_contexts**: the stories, generated, and finalized suggestions
+    - **finalized_suggestions**: the generated and finalized text, along with feedback
+    """
+
+    judgement_contexts = auto()
+    finalized_suggestions = auto()
+
+
+class ExportFormat(AutoNamedEnum):
+    """
+    The file format of an export:
+
+    - **jsonl**: one JSON object per line
+    - **parquet**: columnar Parquet files (requires the parquet extra)
+    """
+
+    jsonl = auto()
+    parquet = auto()
+
+
+class ExportPartition(BaseModel):
+    """ The progress of exporting the suggestions of a single model """
+
+    model_name: str = Field(..., description="The name of the model")
+    last_id: int = Field(0, description="The id of the last exported suggestion")
+    rows: int = Field(0, description="How many rows have been exported")
+    complete: bool = Field(False, description="Whether the partition is complete")
+    files: List[str] = Field([], description="The files written for the partition")
+
+
+class ExportManifest(BaseModel):
+    """
+    Tracks the progress of an export, such that a partial export can be resumed
+    """
+
+    kind: ExportKind = Field(..., description="What data is exported")
+    format: ExportFormat = Field(..., description="The file format of the export")
+    status: List[str] = Field(..., description="The statuses of the exported models")
+    chunk_size: int = Field(..., description="The maximum rows per file")
+    partitions: Dict[str, ExportPartition] = Field(
+        {}, description="The partitions of the export, keyed by model name"
+    )
+
+    @property
+    def complete(self) -> bool:
+        """ Whether every partition of the export is complete """
+        return all(partition.complete for partition in self.partitions.values())
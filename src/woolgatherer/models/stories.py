@@ -2,6 +2,9 @@
 Models used for the stories endpoints
 """
 from enum import auto
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
 
 from woolgatherer.models.utils import AutoNamedEnum
 
@@ -19,3 +22,25 @@ class StoryStatus(AutoNamedEnum):
     pending = auto()
     ready = auto()
     failed = auto()
+
+
+class StoryDelta(BaseModel):
+    """
+    The changes to a story since it was last uploaded. Entries are appended to the
+    last scene of the base story, then any new scenes are appended after it.
+    """
+
+    entries: List[Dict[str, Any]] = Field(
+        [],
+        description="""Scene entries in the [Storium export format]
+        (https://storium.com/help/export/json/0.9.2) to append to the last scene of
+        the story.""",
+    )
+    scenes: List[Dict[str, Any]] = Field(
+        [],
+        description="""Scenes in the [Storium export format]
+        (https://storium.com/help/export/json/0.9.2) to append to the story.""",
+    )
+    exported_at: Optional[str] = Field(
+        None, description="The time the updated story was exported from Storium."
+    )
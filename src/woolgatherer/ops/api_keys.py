@@ -0,0 +1,139 @@
+"""
+Operations for managing the api keys used to access the backend. Authentication
+happens on every request, so the keys are cached in process and periodically reloaded
+from the db, rather than looked up on each request.
+"""
+import asyncio
+import hashlib
+import hmac
+import secrets
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from databases import Database
+
+from woolgatherer.db.session import get_async_db
+from woolgatherer.db_models.api_key import ApiKey, ApiKeyStatus
+from woolgatherer.utils.logging import get_logger
+from woolgatherer.utils.settings import Settings
+
+
+logger = get_logger()
+
+
+def hash_api_key(key: str) -> str:
+    """ Hash the api key, such that the key itself never needs to be stored """
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def generate_api_key() -> str:
+    """ Generate a new random api key """
+    return secrets.token_urlsafe(32)
+
+
+async def create_api_key(name: str, *, db: Database) -> Tuple[ApiKey, str]:
+    """ Create a new api key, returning the db model and the key itself """
+    key = generate_api_key()
+    api_key = ApiKey(name=name, key_hash=hash_api_key(key))
+    await api_key.insert(db)
+
+    return api_key, key
+
+
+class ApiKeyCache:
+    """
+    An in process cache of the active api keys. The cache is refreshed in the
+    background, which is also when the per key request counts are written to the db.
+    """
+
+    def __init__(self):
+        self.names: Dict[str, str] = {}
+        self.request_counts: Counter = Counter()
+        self.refresh_task: Optional[asyncio.Task] = None
+
+    def lookup(self, key: str) -> Optional[str]:
+        """
+        Return the name associated with the api key if it is valid. Keys are looked up
+        by their hash, so the timing of the lookup does not leak the key.
+        """
+        key_hash = hash_api_key(key)
+        name = self.names.get(key_hash)
+        if name is not None:
+            self.request_counts[key_hash] += 1
+
+        return name
+
+    async def refresh(self, *, db: Database):
+        """ Reload the active api keys and record the request counts in the db """
+        request_counts, self.request_counts = self.request_counts, Counter()
+        table = ApiKey.__table__
+        try:
+            async with db.transaction():
+                for key_hash, count in request_counts.items():
+                    await db.execute(
+                        table.update()
+                        .values(request_count=table.c.request_count + count)
+                        .where(table.c.key_hash == key_hash)
+                    )
+        except Exception:
+            # None of the counts were recorded, so merge them back in to try again on
+            # the next refresh, along with any requests made in the meantime
+            self.request_counts.update(request_counts)
+            raise
+
+        api_keys = await ApiKey.select_all(
+            db, ("name", "key_hash"), where={"status": ApiKeyStatus.active}
+        )
+        self.names = {api_key.key_hash: api_key.name for api_key in api_keys}
+
+    async def refresh_periodically(self):
+        """ Refresh the cache every api_key_refresh_interval seconds """
+        while True:
+            await asyncio.sleep(Settings.api_key_refresh_interval)
+            try:
+                async with get_async_db() as db:
+                    await self.refresh(db=db)
+            except Exception:  # pylint:disable=broad-except
+                logger.exception("Failed to refresh api keys")
+
+    async def start(self):
+        """ Load the api keys and start refreshing them in the background """
+        async with get_async_db() as db:
+            await self.refresh(db=db)
+
+        self.refresh_task = asyncio.ensure_future(self.refresh_periodically())
+
+    async def stop(self):
+        """ Stop refreshing the api keys, recording any outstanding request counts """
+        if self.refresh_task:
+            self.refresh_task.cancel()
+            self.refresh_task = None
+
+        async with get_async_db() as db:
+            await self.refresh(db=db)
+
+
+api_keys = ApiKeyCache()
+
+
+async def revoke_api_key(name: str, *, db: Database) -> bool:
+    """
+    Revoke the api key. The key is only revoked in the db, so running servers keep
+    accepting it until they next refresh their cache of api keys, i.e. for up to
+    api_key_refresh_interval seconds.
+    """
+    api_key = await ApiKey.select(db, "key_hash", where={"name": name})
+    if not api_key:
+        return False
+
+    api_key.status = ApiKeyStatus.revoked
+    await api_key.update(db, where={"name": name})
+
+    return True
+
+
+def constant_time_equals(value: Optional[str], expected: str) -> bool:
+    """ Compare the strings in constant time, to avoid leaking the expected value """
+    return value is not None and hmac.compare_digest(
+        value.encode("utf-8"), expected.encode("utf-8")
+    )
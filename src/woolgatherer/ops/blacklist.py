@@ -0,0 +1,115 @@
+"""
+Operations for the game blacklist. The blacklist is maintained in
+static/game_blacklist.txt and mirrored into the db, such that queries can exclude the
+blacklisted games with an anti-join, rather than reading the file on every request.
+"""
+import asyncio
+import os
+from typing import Optional, Set
+
+import aiofiles
+from databases import Database
+
+from woolgatherer.db.session import get_async_db
+from woolgatherer.db_models.blacklist import BlacklistedGame
+from woolgatherer.ops import dashboard as dashboard_ops
+from woolgatherer.utils.logging import get_logger
+
+
+logger = get_logger()
+
+BLACKLIST_PATH = os.path.join("static", "game_blacklist.txt")
+
+# How often (in seconds) to check whether the blacklist file has changed
+BLACKLIST_CHECK_INTERVAL = 60
+
+
+async def load_blacklist(path: str = BLACKLIST_PATH) -> Set[str]:
+    """ Load the game_pids from the blacklist file """
+    async with aiofiles.open(path, "rt") as blacklist_file:
+        return {
+            line.strip() for line in await blacklist_file.readlines() if line.strip()
+        }
+
+
+async def store_blacklist(game_pids: Set[str], *, db: Database) -> bool:
+    """ Make the blacklist in the db match the given game_pids """
+    existing = {
+        game.game_pid for game in await BlacklistedGame.select_all(db, ("game_pid",))
+    }
+    if existing == game_pids:
+        return False
+
+    table = BlacklistedGame.__table__
+    async with db.transaction():
+        removed = existing - game_pids
+        if removed:
+            await db.execute(table.delete().where(table.c.game_pid.in_(removed)))
+
+        await BlacklistedGame.insert_many(
+            db,
+            [BlacklistedGame(game_pid=game_pid) for game_pid in game_pids - existing],
+            ignore_conflicts=True,
+        )
+
+    return True
+
+
+class BlacklistSync:
+    """ Mirror the blacklist file into the db whenever the file changes """
+
+    def __init__(self, path: str = BLACKLIST_PATH):
+        self.path = path
+        self.mtime: Optional[float] = None
+        self.sync_task: Optional[asyncio.Task] = None
+
+    async def sync(self, *, db: Database) -> bool:
+        """
+        Store the blacklist in the db if the file changed since the last sync. Returns
+        whether the blacklist in the db changed.
+        """
+        mtime = os.stat(self.path).st_mtime
+        if mtime == self.mtime:
+            return False
+
+        changed = await store_blacklist(await load_blacklist(self.path), db=db)
+        if changed:
+            logger.info("Updated the game blacklist from %s", self.path)
+
+        self.mtime = mtime
+        return changed
+
+    async def update(self):
+        """ Sync the blacklist, then bump the dashboard data version if it changed """
+        changed = False
+        async with get_async_db() as db:
+            changed = await self.sync(db=db)
+
+        if changed:
+            # The blacklist determines which suggestions the dashboard covers. Only
+            # bump the version once committed, so the dashboard cannot be recomputed
+            # from the previous blacklist under the new version.
+            await dashboard_ops.bump_data_version()
+
+    async def sync_periodically(self):
+        """ Check the blacklist file every BLACKLIST_CHECK_INTERVAL seconds """
+        while True:
+            await asyncio.sleep(BLACKLIST_CHECK_INTERVAL)
+            try:
+                await self.update()
+            except Exception:  # pylint:disable=broad-except
+                logger.exception("Failed to sync the game blacklist")
+
+    async def start(self):
+        """ Sync the blacklist and start checking for changes in the background """
+        await self.update()
+        self.sync_task = asyncio.ensure_future(self.sync_periodically())
+
+    async def stop(self):
+        """ Stop checking for changes to the blacklist """
+        if self.sync_task:
+            self.sync_task.cancel()
+            self.sync_task = None
+
+
+blacklist = BlacklistSync()
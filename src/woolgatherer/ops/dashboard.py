@@ -0,0 +1,253 @@
+"""
+Operations for caching the dashboard. The dashboard aggregates every finalized
+suggestion, so rather than tracking which parts of the dashboard a write affects, each
+write that changes the dashboard data bumps a data version, and the dashboard is cached
+under keys which include the version.
+
+Computing the dashboard is expensive, so only one worker computes it at a time, while
+the others keep serving the dashboard for the previous version of the data.
+"""
+import asyncio
+import time
+import uuid
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+
+from aiocache import caches
+from aiocache.base import BaseCache
+from databases import Database
+
+from woolgatherer.db.session import get_async_db
+from woolgatherer.db_models.figmentator import FigmentatorStatus
+from woolgatherer.errors import InsufficientCapacityError
+from woolgatherer.utils.cache import is_shared
+from woolgatherer.utils.logging import get_logger
+from woolgatherer.utils.single_flight import SingleFlight
+
+
+logger = get_logger()
+
+DATA_VERSION_KEY = "dashboard:version"
+
+# Aggregates for previous data versions are only read while a newer version is being
+# computed, so let them expire
+AGGREGATE_TTL = 7 * 24 * 60 * 60
+
+# How long (in seconds) a worker may hold the lock for computing the dashboard
+COMPUTE_LOCK_TTL = 5 * 60
+
+# How often (in seconds) to check whether another worker finished the dashboard
+COMPUTE_POLL_INTERVAL = 0.5
+
+# How long (in seconds) a request waits for another worker to finish the dashboard,
+# when there is no previous version to serve, before asking the client to retry
+COMPUTE_WAIT_TIMEOUT = 10
+
+# Atomically release the lock, but only if it is still held by the given token, i.e.
+# it has not expired and been taken by another worker
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Concurrent requests within a process share a single lookup of the dashboard
+dashboard_lookups = SingleFlight()
+
+DashboardComputer = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+async def get_data_version(cache: Optional[BaseCache] = None) -> int:
+    """ Get the current version of the dashboard data """
+    cache = cache or caches.get("default")
+    return int(await cache.get(DATA_VERSION_KEY) or 0)
+
+
+async def bump_data_version(cache: Optional[BaseCache] = None):
+    """
+    Bump the version of the dashboard data, e.g. when a suggestion is finalized or
+    feedback is submitted
+    """
+    cache = cache or caches.get("default")
+    await cache.increment(DATA_VERSION_KEY)
+
+
+class DataVersionBump:
+    """
+    Bumps the version of the dashboard data once the transaction which changed the
+    data commits. Bumping any sooner allows a concurrent request to cache the dashboard
+    under the new version, computed from the data before the commit.
+    """
+
+    def __init__(self):
+        self.requested = False
+
+    def request(self):
+        """ Bump the version once the transaction commits """
+        self.requested = True
+
+
+async def bump_data_version_after_commit() -> AsyncGenerator[DataVersionBump, None]:
+    """
+    A dependency for routes which change the dashboard data. Dependencies are closed in
+    the reverse order they are opened, so it must be declared before the db dependency
+    for the bump to follow the commit.
+    """
+    bump = DataVersionBump()
+    yield bump
+    if bump.requested:
+        await bump_data_version()
+
+
+def aggregate_key(status: FigmentatorStatus, version: int, name: str) -> str:
+    """ The cache key for the dashboard aggregate """
+    return f"dashboard:{status.value}:{version}:{name}"
+
+
+def latest_version_key(status: FigmentatorStatus) -> str:
+    """ The cache key for the data version the dashboard was last computed for """
+    return f"dashboard:{status.value}:latest"
+
+
+async def get_dashboard(
+    status: FigmentatorStatus, compute: DashboardComputer, *, db: Database
+) -> Dict[str, Any]:
+    """
+    Get the dashboard for the current version of the data, computing it with
+    compute(status, db=db) if needed.
+    """
+    cache = caches.get("default")
+    version = await get_data_version(cache)
+    context = await cache.get(aggregate_key(status, version, "context"))
+    if context is not None:
+        return context
+
+    return await dashboard_lookups.run(
+        (status, version), lambda: _refresh_dashboard(status, version, compute, db=db)
+    )
+
+
+async def _refresh_dashboard(
+    status: FigmentatorStatus,
+    version: int,
+    compute: DashboardComputer,
+    *,
+    db: Database,
+) -> Dict[str, Any]:
+    """
+    Compute the dashboard unless another worker is already computing it. Serve the
+    dashboard for the previous version of the data while it is being computed, and
+    only wait for the computation when there is no previous version. Rather than
+    waiting indefinitely, raises an InsufficientCapacityError so the client retries.
+    """
+    cache = caches.get("default")
+    latest_version = await cache.get(latest_version_key(status))
+    stale = (
+        await cache.get(aggregate_key(status, latest_version, "context"))
+        if latest_version is not None
+        else None
+    )
+
+    lock_key = aggregate_key(status, version, "lock")
+    token = uuid.uuid4().hex
+    try:
+        await cache.add(lock_key, token, ttl=COMPUTE_LOCK_TTL)
+    except ValueError:
+        # Another worker is computing the dashboard
+        if stale is not None:
+            return stale
+
+        context = await _wait_for_dashboard(status, version)
+        if context is not None:
+            return context
+
+        raise InsufficientCapacityError(
+            "The dashboard is being computed", retry_after=COMPUTE_WAIT_TIMEOUT
+        )
+
+    if stale is not None:
+        asyncio.ensure_future(
+            _compute_dashboard_in_background(status, version, compute, lock_key, token)
+        )
+        return stale
+
+    try:
+        return await _compute_dashboard(status, version, compute, db=db)
+    finally:
+        await _release_lock(lock_key, token)
+
+
+async def _release_lock(lock_key: str, token: str):
+    """ Release the lock, unless it expired and is now held by another worker """
+    cache = caches.get("default")
+    if not is_shared(cache):
+        if await cache.get(lock_key) == token:
+            await cache.delete(lock_key)
+        return
+
+    await cache.raw(
+        "eval",
+        RELEASE_LOCK_SCRIPT,
+        [cache.build_key(lock_key)],
+        [cache.serializer.dumps(token)],
+    )
+
+
+async def _compute_dashboard(
+    status: FigmentatorStatus,
+    version: int,
+    compute: DashboardComputer,
+    *,
+    db: Database,
+) -> Dict[str, Any]:
+    """ Compute the dashboard and cache it as the latest version """
+    cache = caches.get("default")
+    context = await compute(status, db=db)
+    await cache.set(
+        aggregate_key(status, version, "context"), context, ttl=AGGREGATE_TTL
+    )
+
+    # A slow computation must not replace a newer version which finished first
+    latest_version = await cache.get(latest_version_key(status))
+    if latest_version is None or latest_version < version:
+        await cache.set(latest_version_key(status), version)
+
+    return context
+
+
+async def _compute_dashboard_in_background(
+    status: FigmentatorStatus,
+    version: int,
+    compute: DashboardComputer,
+    lock_key: str,
+    token: str,
+):
+    """ Compute the dashboard outside of a request, releasing the lock when done """
+    try:
+        async with get_async_db() as db:
+            await _compute_dashboard(status, version, compute, db=db)
+    except Exception:  # pylint:disable=broad-except
+        logger.exception("Failed to compute the dashboard")
+    finally:
+        await _release_lock(lock_key, token)
+
+
+async def _wait_for_dashboard(
+    status: FigmentatorStatus, version: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Briefly wait for another worker to compute the dashboard, while it holds the lock.
+    Returns None if the dashboard is not ready in time, or the other worker gave up.
+    """
+    cache = caches.get("default")
+    deadline = time.monotonic() + COMPUTE_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        await asyncio.sleep(COMPUTE_POLL_INTERVAL)
+        context = await cache.get(aggregate_key(status, version, "context"))
+        if context is not None:
+            return context
+
+        if not await cache.exists(aggregate_key(status, version, "lock")):
+            return await cache.get(aggregate_key(status, version, "context"))
+
+    return None
@@ -0,0 +1,224 @@
+"""
+Operations for exporting the dataset. Exports are written to chunked files under
+dataset/<name>, with each model exported as a separate partition in parallel. A manifest
+records the progress of each partition, such that an interrupted export resumes from
+the last chunk it wrote rather than starting over.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+from databases import Database
+
+from woolgatherer.db.utils import load_query
+from woolgatherer.db_models.figmentator import Figmentator, FigmentatorStatus
+from woolgatherer.errors import InvalidOperationError
+from woolgatherer.models.exports import (
+    ExportFormat,
+    ExportKind,
+    ExportManifest,
+    ExportPartition,
+)
+from woolgatherer.utils.logging import get_logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+logger = get_logger()
+
+EXPORT_DIR = "dataset"
+MANIFEST_FILENAME = "manifest.json"
+
+EXPORT_QUERIES = {
+    ExportKind.judgement_contexts: "export_judgement_contexts.sql",
+    ExportKind.finalized_suggestions: "export_finalized_suggestions.sql",
+}
+
+
+def export_path(name: str) -> str:
+    """ The directory holding the export with the given name """
+    if os.path.basename(name) != name or name.startswith("."):
+        raise InvalidOperationError(f"Invalid export name: {name}")
+
+    return os.path.join(EXPORT_DIR, name)
+
+
+def load_manifest(name: str) -> Optional[ExportManifest]:
+    """ Load the manifest of the export, if it exists """
+    path = os.path.join(export_path(name), MANIFEST_FILENAME)
+    if not os.path.isfile(path):
+        return None
+
+    with open(path, "rt") as manifest_file:
+        return ExportManifest(**json.load(manifest_file))
+
+
+def save_manifest(name: str, manifest: ExportManifest):
+    """ Atomically replace the manifest of the export """
+    path = os.path.join(export_path(name), MANIFEST_FILENAME)
+    with open(f"{path}.tmp", "wt") as manifest_file:
+        manifest_file.write(manifest.json(indent=2))
+
+    os.replace(f"{path}.tmp", path)
+
+
+def write_jsonl(path: str, records: Sequence[str]):
+    """ Write the records, which are already encoded as JSON, one per line """
+    with open(path, "wt") as jsonl_file:
+        for record in records:
+            jsonl_file.write(record)
+            jsonl_file.write("\n")
+
+
+def write_parquet(path: str, records: Sequence[str]):
+    """ Write the records as a Parquet file, encoding nested values as JSON """
+    loads = orjson.loads if orjson else json.loads
+    rows = [loads(record) for record in records]
+    columns: Dict[str, List[Any]] = {key: [] for key in rows[0]}
+    for row in rows:
+        for key, values in columns.items():
+            value = row.get(key)
+            values.append(
+                json.dumps(value) if isinstance(value, (dict, list)) else value
+            )
+
+    pyarrow.parquet.write_table(pyarrow.Table.from_pydict(columns), path)
+
+
+WRITERS = {ExportFormat.jsonl: write_jsonl, ExportFormat.parquet: write_parquet}
+
+
+def write_chunk(path: str, export_format: ExportFormat, records: Sequence[str]):
+    """ Write the chunk to a temporary file, then move it into place """
+    WRITERS[export_format](f"{path}.tmp", records)
+    os.replace(f"{path}.tmp", path)
+
+
+def chunk_filename(
+    manifest: ExportManifest, partition: ExportPartition, index: int
+) -> str:
+    """ The filename of a chunk of the partition """
+    model_name = re.sub(r"[^\w.-]+", "_", partition.model_name)
+    return f"{manifest.kind.value}-{model_name}-{index:05d}.{manifest.format.value}"
+
+
+async def export_partition(
+    name: str,
+    manifest: ExportManifest,
+    partition: ExportPartition,
+    *,
+    db: Database,
+    semaphore: asyncio.Semaphore,
+):
+    """ Export the partition one chunk at a time, resuming after its last chunk """
+    query = await load_query(EXPORT_QUERIES[manifest.kind])
+    status = tuple(FigmentatorStatus(status) for status in manifest.status)
+    loop = asyncio.get_event_loop()
+
+    async with semaphore:
+        while not partition.complete:
+            rows = await db.fetch_all(
+                query,
+                {
+                    "model_name": partition.model_name,
+                    "status": status,
+                    "after": partition.last_id,
+                    "limit": manifest.chunk_size,
+                },
+            )
+            if rows:
+                filename = chunk_filename(manifest, partition, len(partition.files))
+                await loop.run_in_executor(
+                    None,
+                    write_chunk,
+                    os.path.join(export_path(name), filename),
+                    manifest.format,
+                    [row["record"] for row in rows],
+                )
+
+                partition.files.append(filename)
+                partition.rows += len(rows)
+                partition.last_id = rows[-1]["id"]
+
+            partition.complete = len(rows) < manifest.chunk_size
+            save_manifest(name, manifest)
+
+    logger.info(
+        "Exported %d rows for model %s to %s",
+        partition.rows,
+        partition.model_name,
+        export_path(name),
+    )
+
+
+async def export(
+    name: str,
+    kind: ExportKind,
+    export_format: ExportFormat = ExportFormat.jsonl,
+    status: Sequence[FigmentatorStatus] = (FigmentatorStatus.active,),
+    chunk_size: int = 10000,
+    jobs: int = 4,
+    *,
+    db: Database,
+) -> ExportManifest:
+    """
+    Export the data to dataset/<name>, exporting up to jobs models in parallel. If a
+    partial export with the same name exists, it is resumed.
+    """
+    if export_format == ExportFormat.parquet and not pyarrow:
+        raise InvalidOperationError("Exporting to parquet requires pyarrow")
+
+    os.makedirs(export_path(name), exist_ok=True)
+    manifest = load_manifest(name)
+    if manifest is None:
+        manifest = ExportManifest(
+            kind=kind,
+            format=export_format,
+            status=sorted(s.value for s in status),
+            chunk_size=chunk_size,
+        )
+    elif (manifest.kind, manifest.format, manifest.status) != (
+        kind,
+        export_format,
+        sorted(s.value for s in status),
+    ):
+        raise InvalidOperationError(
+            f"Export {name} already exists with different options"
+        )
+
+    # Resuming continues the existing partitions and picks up any new models
+    for figmentator in await Figmentator.select_all(db, ("name", "status")):
+        if figmentator.status in status and figmentator.name not in manifest.partitions:
+            manifest.partitions[figmentator.name] = ExportPartition(
+                model_name=figmentator.name
+            )
+
+    save_manifest(name, manifest)
+
+    # databases binds a connection to the context of the task which first uses it, so
+    # run each partition in a fresh context, such that each gets its own connection
+    semaphore = asyncio.Semaphore(jobs)
+    await asyncio.gather(
+        *(
+            contextvars.Context().run(
+                asyncio.ensure_future,
+                export_partition(name, manifest, partition, db=db, semaphore=semaphore),
+            )
+            for partition in manifest.partitions.values()
+            if not partition.complete
+        )
+    )
+
+    return manifest
@@ -25,10 +25,13 @@ async def submit_feedback(
     """
     Register the feedback for the suggestion. It assumes you have already verified the
     suggestion is in the database, otherwise an exception for a constraint violation
-    will be raised.
+    will be raised. The caller must bump the dashboard data version once the
+    transaction commits.
     """
     logger.debug("Registering feedback for suggestion_id: %s", suggestion_id)
-    suggestion = await suggestion_ops.get_suggestion(suggestion_id, db=db)
+    suggestion = await suggestion_ops.get_suggestion(
+        suggestion_id, db=db, columns=("uuid", "status")
+    )
     if not suggestion:
         raise InvalidOperationError("Unknown suggestion")
 
@@ -39,12 +42,17 @@ async def submit_feedback(
     validate_feedback(responses)
 
     try:
-        for response in responses:
-            await Feedback(
-                type=response.type,
-                response=response.response,
-                suggestion_id=suggestion.uuid,
-            ).insert(db)
+        await Feedback.insert_many(
+            db,
+            [
+                Feedback(
+                    type=response.type,
+                    response=response.response,
+                    suggestion_id=suggestion.uuid,
+                )
+                for response in responses
+            ],
+        )
     except IntegrityError:
         raise InvalidOperationError("Cannot submit feedback more than once!")
 
@@ -8,11 +8,16 @@ from databases import Database
 from aiohttp import ClientSession, client_exceptions
 
 from woolgatherer.db.utils import load_query
-from woolgatherer.db_models.figmentator import Figmentator, FigmentatorForStory
+from woolgatherer.db_models.figmentator import (
+    Figmentator,
+    FigmentatorForStory,
+    FigmentatorStatus,
+)
 from woolgatherer.db_models.storium import Story, StoryStatus
 from woolgatherer.db_models.suggestion import Suggestion
 from woolgatherer.errors import InsufficientCapacityError
 from woolgatherer.models.range import compute_next_range
+from woolgatherer.ops import storage as storage_ops
 from woolgatherer.utils.logging import get_logger
 
 
@@ -27,6 +32,24 @@ async def select_figmentators(*, db: Database) -> List[Figmentator]:
     return [Figmentator.db_construct(row) for row in results]
 
 
+async def select_story_figmentators(
+    story_hash: str, *, db: Database
+) -> List[Figmentator]:
+    """ Select the active figmentators which have preprocessed the given story """
+    logger.debug("Selecting figmentators for story_id: %s", story_hash)
+    figmentators = []
+    for mapping in await FigmentatorForStory.select_all(
+        db, where={"story_hash": story_hash}
+    ):
+        figmentator = await Figmentator.select(
+            db, where={"id": mapping.model_id, "status": FigmentatorStatus.active}
+        )
+        if figmentator:
+            figmentators.append(figmentator)
+
+    return figmentators
+
+
 async def preprocess(
     context: Dict[str, Any], figmentator: Figmentator, *, session: ClientSession
 ) -> Tuple[bool, Figmentator]:
@@ -39,6 +62,36 @@ async def preprocess(
         return False, figmentator
 
 
+async def preprocess_delta(
+    context: Dict[str, Any],
+    delta_context: Dict[str, Any],
+    figmentator: Figmentator,
+    *,
+    session: ClientSession,
+) -> Tuple[bool, Figmentator]:
+    """
+    Make an incremental preprocess request, which only contains the scenes and entries
+    added since the base story. If the figmentator does not support incremental
+    snapshots (or no longer has the base story), fall back to a full preprocess request.
+    """
+    try:
+        url = URL(figmentator.url)
+        async with session.post(
+            url / "story/snapshot/delta", json=delta_context
+        ) as response:
+            if response.status == 200:
+                return True, figmentator
+    except client_exceptions.ClientError:
+        pass
+
+    logger.debug(
+        "Incremental preprocess failed for story=%s, figmentator=%s",
+        delta_context["story_id"],
+        figmentator.id,
+    )
+    return await preprocess(context, figmentator, session=session)
+
+
 async def reassign_figmentator(
     suggestion: Suggestion,
     figmentator: Figmentator,
@@ -59,7 +112,10 @@ async def reassign_figmentator(
         raise InsufficientCapacityError("No preprocessors available")
 
     story.status = StoryStatus.ready
-    context = {"story_id": story.hash, "story": story.story}
+    context = {
+        "story_id": story.hash,
+        "story": await storage_ops.load_story(story, db=db),
+    }
     completed, new_figmentator = await preprocess(
         context, figmentators.pop(), session=session
     )
@@ -67,9 +123,16 @@ async def reassign_figmentator(
         if completed:
             where = {"model_id": figmentator.id, "story_hash": story.hash}
             await FigmentatorForStory(**where).delete(db, where=where)
-            await FigmentatorForStory(
-                model_id=new_figmentator.id, story_hash=story.hash
-            ).insert(db)
+            await FigmentatorForStory.upsert(
+                db,
+                [
+                    FigmentatorForStory(
+                        model_id=new_figmentator.id, story_hash=story.hash
+                    )
+                ],
+                conflict_columns=("model_id", "story_hash"),
+                update_columns=(),
+            )
         else:
             story.status = StoryStatus.failed
         await story.update(db)
@@ -0,0 +1,200 @@
+"""
+Operations for the content-addressed storage of stories. Rather than storing each
+version of a story in full, the scenes, entries, and characters of a story are stored
+once by hash, while the story itself only stores a manifest of those hashes.
+"""
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+from databases import Database
+from sqlalchemy.sql.expression import exists, select
+
+from woolgatherer.db.utils import insert_ignore, json_digest
+from woolgatherer.db_models.storium import Story, StoryChunk, StoryChunkRef
+from woolgatherer.utils.logging import get_logger
+
+
+logger = get_logger()
+
+# How many chunks to delete per statement, which keeps the number of bound parameters
+# well below the limit of the db driver
+CHUNK_DELETE_BATCH_SIZE = 1000
+
+
+def _add_chunk(chunk: Dict[str, Any], chunks: Dict[str, Dict[str, Any]]) -> str:
+    """ Add the chunk to the mapping of chunks and return its hash """
+    chunk_hash = json_digest(chunk)
+    chunks[chunk_hash] = chunk
+    return chunk_hash
+
+
+def split_story(
+    story_dict: Dict[str, Any]
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Split the story into a manifest and the chunks it references. In the manifest each
+    character is replaced by the hash of its chunk, while each scene is replaced by an
+    object of the form {"scene": <hash>, "entries": [<hash>, ...]}.
+    """
+    chunks: Dict[str, Dict[str, Any]] = {}
+    manifest = dict(story_dict)
+    if "characters" in story_dict:
+        manifest["characters"] = [
+            _add_chunk(character, chunks) for character in story_dict["characters"]
+        ]
+
+    if "scenes" in story_dict:
+        scene_refs = []
+        for scene in story_dict["scenes"]:
+            scene = dict(scene)
+            scene_ref: Dict[str, Any] = {}
+            if "entries" in scene:
+                scene_ref["entries"] = [
+                    _add_chunk(entry, chunks) for entry in scene.pop("entries")
+                ]
+
+            scene_ref["scene"] = _add_chunk(scene, chunks)
+            scene_refs.append(scene_ref)
+        manifest["scenes"] = scene_refs
+
+    return manifest, chunks
+
+
+def manifest_hashes(manifest: Dict[str, Any]) -> List[str]:
+    """ Return the hashes of all the chunks referenced by the manifest """
+    hashes = list(manifest.get("characters", []))
+    for scene_ref in manifest.get("scenes", []):
+        hashes.append(scene_ref["scene"])
+        hashes.extend(scene_ref.get("entries", []))
+
+    return hashes
+
+
+def assemble_story(
+    manifest: Dict[str, Any], chunks: Dict[str, Dict[str, Any]]
+) -> Dict[str, Any]:
+    """ Reassemble the story from its manifest and the chunks it references """
+    story_dict = dict(manifest)
+    if "characters" in manifest:
+        story_dict["characters"] = [chunks[h] for h in manifest["characters"]]
+
+    if "scenes" in manifest:
+        scenes = []
+        for scene_ref in manifest["scenes"]:
+            scene = dict(chunks[scene_ref["scene"]])
+            if "entries" in scene_ref:
+                scene["entries"] = [chunks[h] for h in scene_ref["entries"]]
+            scenes.append(scene)
+        story_dict["scenes"] = scenes
+
+    return story_dict
+
+
+async def select_chunks(
+    hashes: Iterable[str], *, db: Database
+) -> Dict[str, Dict[str, Any]]:
+    """ Select the chunks with the given hashes """
+    hashes = list(hashes)
+    if not hashes:
+        return {}
+
+    table = StoryChunk.__table__
+    query = select([table.c.hash, table.c.data]).where(table.c.hash.in_(hashes))
+    return {row["hash"]: row["data"] for row in await db.fetch_all(query)}
+
+
+async def store_chunks(
+    story_hash: str, chunks: Dict[str, Dict[str, Any]], *, db: Database
+):
+    """
+    Store the chunks of a story. Only chunks which are not already in the db are
+    written, which for consecutive versions of a story is typically just the newest
+    entries. This must be called within a transaction.
+    """
+    if not chunks:
+        return
+
+    # Lock the existing chunks until the transaction ends, so a concurrent cleanup
+    # cannot delete a chunk before the refs to it are committed. A chunk deleted before
+    # it could be locked is not returned, so it is simply stored again below.
+    table = StoryChunk.__table__
+    query = (
+        select([table.c.hash])
+        .where(table.c.hash.in_(list(chunks)))
+        .order_by(table.c.hash)
+        .with_for_update(read=True, key_share=True)
+    )
+    existing = {row["hash"] for row in await db.fetch_all(query)}
+    new_chunks = [
+        {"hash": chunk_hash, "data": chunk}
+        for chunk_hash, chunk in chunks.items()
+        if chunk_hash not in existing
+    ]
+
+    logger.debug(
+        "Storing %d of %d chunks for story_id: %s",
+        len(new_chunks),
+        len(chunks),
+        story_hash,
+    )
+    if new_chunks:
+        await db.execute(insert_ignore(table).values(new_chunks))
+
+    await db.execute(
+        insert_ignore(StoryChunkRef.__table__).values(
+            [{"story_hash": story_hash, "chunk_hash": h} for h in chunks]
+        )
+    )
+
+
+async def load_manifest(manifest: Dict[str, Any], *, db: Database) -> Dict[str, Any]:
+    """ Load the full story described by the manifest """
+    chunks = await select_chunks(set(manifest_hashes(manifest)), db=db)
+    return assemble_story(manifest, chunks)
+
+
+async def load_story(story: Story, *, db: Database) -> Dict[str, Any]:
+    """ Load the full story, reassembling it from its chunks if needed """
+    if not story.chunked:
+        return story.story
+
+    return await load_manifest(story.story, db=db)
+
+
+async def delete_stories(story_hashes: Sequence[str], *, db: Database):
+    """
+    Delete the stories, along with their chunks which are no longer referenced by any
+    other story. This must be called within a transaction.
+    """
+    if not story_hashes:
+        return
+
+    stories = Story.__table__
+    refs = StoryChunkRef.__table__
+    chunks = StoryChunk.__table__
+
+    query = select([refs.c.chunk_hash]).where(refs.c.story_hash.in_(story_hashes))
+    chunk_hashes = list({row["chunk_hash"] for row in await db.fetch_all(query)})
+
+    await db.execute(stories.delete().where(stories.c.hash.in_(story_hashes)))
+    await db.execute(refs.delete().where(refs.c.story_hash.in_(story_hashes)))
+    for idx in range(0, len(chunk_hashes), CHUNK_DELETE_BATCH_SIZE):
+        batch = chunk_hashes[idx : idx + CHUNK_DELETE_BATCH_SIZE]
+
+        # Lock the chunks before checking for refs to them. Once locked, a concurrent
+        # store_chunks waits for this transaction to end before referencing them, while
+        # the refs of any which committed first are visible to the delete below. The
+        # delete cannot do both at once, as it would check for refs as of when it
+        # started, rather than after waiting for the lock.
+        await db.fetch_all(
+            select([chunks.c.hash])
+            .where(chunks.c.hash.in_(batch))
+            .order_by(chunks.c.hash)
+            .with_for_update()
+        )
+        await db.execute(
+            chunks.delete()
+            .where(chunks.c.hash.in_(batch))
+            .where(~exists().where(refs.c.chunk_hash == chunks.c.hash))
+        )
+
+    logger.debug("Deleted %d stories and their unreferenced chunks", len(story_hashes))
@@ -1,24 +1,85 @@
 """
 Operations which can be conducted on stories
 """
-from typing import Any, Dict, Optional
+import hashlib
+import time
+from datetime import timezone
+from typing import Any, Dict, List, Optional
 
+import sqlalchemy as sa
+from aiocache import caches
 from databases import Database
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql.expression import and_, exists, select
 
-from woolgatherer.db_models.storium import Story, StoryStatus
-from woolgatherer.db.utils import json_hash, load_query
-from woolgatherer.errors import InsufficientCapacityError
+from woolgatherer.db_models.storium import (
+    EXPORT_TIME_FORMAT,
+    LatestStory,
+    Story,
+    StoryStatus,
+)
+from woolgatherer.db_models.suggestion import Suggestion
+from woolgatherer.db.utils import has_postgres, json_digest
+from woolgatherer.errors import InsufficientCapacityError, InvalidStoryDeltaError
+from woolgatherer.models.stories import StoryDelta
+from woolgatherer.models.utils import Datetime
 from woolgatherer.tasks import stories
-from woolgatherer.ops import figmentator as figmentator_ops
+from woolgatherer.ops import figmentator as figmentator_ops, storage as storage_ops
+from woolgatherer.utils.cache import story_status_cache
 from woolgatherer.utils.logging import get_logger
+from woolgatherer.utils.settings import Settings
 
 
 logger = get_logger()
 
+# How long to remember the story_id for the raw bytes of a story upload
+STORY_UPLOAD_TTL = 24 * 60 * 60
 
-async def create_story(story_dict: Dict[str, Any], *, db: Database) -> str:
-    """ Create a story in the db """
-    story_json, story_hash = json_hash(story_dict)
+
+def story_upload_key(story_bytes: bytes) -> str:
+    """ The cache key for the raw bytes of a story upload """
+    return f"story:upload:{hashlib.md5(story_bytes).hexdigest()}"
+
+
+async def is_story_available(story_hash: str, *, db: Database) -> bool:
+    """ Whether the story exists and has not failed preprocessing """
+    status = await get_story_status(story_hash, db=db)
+    return bool(status) and status != StoryStatus.failed
+
+
+async def find_story_upload(story_bytes: bytes, *, db: Database) -> Optional[str]:
+    """
+    Find the story_id of a story from the raw bytes of its upload, without needing to
+    parse the story. Clients frequently upload the exact same story multiple times, so
+    this avoids parsing, hashing, and storing multi-megabyte stories needlessly.
+    """
+    story_hash = await caches.get("default").get(story_upload_key(story_bytes))
+    if story_hash and await is_story_available(story_hash, db=db):
+        logger.debug("Found existing story upload for story_id: %s", story_hash)
+        return story_hash
+
+    return None
+
+
+async def remember_story_upload(story_bytes: bytes, story_hash: str):
+    """ Remember the story_id for the raw bytes of a story upload """
+    await caches.get("default").set(
+        story_upload_key(story_bytes), story_hash, ttl=STORY_UPLOAD_TTL
+    )
+
+
+async def create_story(
+    story_dict: Dict[str, Any],
+    *,
+    db: Database,
+    base_hash: Optional[str] = None,
+    delta: Optional[StoryDelta] = None,
+) -> str:
+    """
+    Create a story in the db. If the story was created by applying a delta to a base
+    story, then figmentators that preprocessed the base story only need the delta.
+    """
+    story_hash = json_digest(story_dict)
     status = await get_story_status(story_hash, db=db)
     if not status or status == StoryStatus.failed:
         # When receiving a story we want to select the suggestion generators that will
@@ -30,35 +91,236 @@ async def create_story(story_dict: Dict[str, Any], *, db: Database) -> str:
         if not figmentators:
             raise InsufficientCapacityError("No preprocessors available")
 
-        story = Story(story=story_json, hash=story_hash, status=StoryStatus.pending)
-        if not status:
-            logger.debug("Creating story for story_id: %s", story_hash)
-            await story.insert(db)
-        else:
-            logger.debug(
-                "Updating story status to pending for story_id: %s", story_hash
+        if base_hash:
+            # Prefer the figmentators which preprocessed the base story, since they
+            # only need to be sent the delta rather than the full story
+            figmentators_by_type = {f.type: f for f in figmentators}
+            figmentators_by_type.update(
+                {
+                    f.type: f
+                    for f in await figmentator_ops.select_story_figmentators(
+                        base_hash, db=db
+                    )
+                }
             )
-            await story.update(db, where={"hash": story_hash})
+            figmentators = list(figmentators_by_type.values())
+
+        manifest, chunks = storage_ops.split_story(story_dict)
+        story = Story(
+            story=manifest,
+            hash=story_hash,
+            status=StoryStatus.pending,
+            chunked=True,
+            game_pid=story_dict.get("game_pid"),
+            exported_at=story_export_time(story_dict),
+        )
+        async with db.transaction():
+            if not status:
+                logger.debug("Creating story for story_id: %s", story_hash)
+                await story.insert(db)
+                await record_latest_story(story, db=db)
+            else:
+                logger.debug(
+                    "Updating story status to pending for story_id: %s", story_hash
+                )
+                await story.update(db, where={"hash": story_hash})
+
+            # Only store the chunks of the story that are not already in the db, as
+            # consecutive versions of a story share nearly all of their content
+            await storage_ops.store_chunks(story_hash, chunks, db=db)
 
-        task = stories.process.delay(story_hash, [f.dict() for f in figmentators])
+        if status:
+            await story_status_cache.invalidate(story_hash)
+
+        task = stories.process.delay(
+            story_hash,
+            [f.dict() for f in figmentators],
+            base_hash,
+            delta.dict() if delta else None,
+        )
         logger.debug("Started task %s", task.id)
 
     return story_hash
 
 
+async def create_story_delta(
+    base_hash: str, delta: StoryDelta, *, db: Database
+) -> Optional[str]:
+    """
+    Create a story in the db by applying the delta to an existing story. Returns None
+    if the base story does not exist, in which case the full story must be uploaded.
+    """
+    base_story = await Story.select(db, ("story", "chunked"), {"hash": base_hash})
+    if not base_story:
+        return None
+
+    logger.debug("Applying delta to story_id: %s", base_hash)
+    story_dict = await storage_ops.load_story(base_story, db=db)
+    story_dict = apply_story_delta(story_dict, delta)
+    return await create_story(story_dict, db=db, base_hash=base_hash, delta=delta)
+
+
+def apply_story_delta(story_dict: Dict[str, Any], delta: StoryDelta) -> Dict[str, Any]:
+    """
+    Apply the delta to the story. Entries are appended to the last scene in the story
+    before any new scenes are appended. Raises InvalidStoryDeltaError if the delta
+    cannot be applied to the story.
+    """
+    scenes = story_dict.setdefault("scenes", [])
+    if delta.entries:
+        if not scenes:
+            raise InvalidStoryDeltaError("Cannot append entries without a scene")
+
+        scenes[-1].setdefault("entries", []).extend(delta.entries)
+
+    scenes.extend(delta.scenes)
+    if delta.exported_at:
+        story_dict["exported_at"] = delta.exported_at
+
+    return story_dict
+
+
 async def get_story_status(story_hash: str, *, db: Database) -> Optional[StoryStatus]:
     """ Get the current story status """
     logger.debug("Getting story status for story_id: %s", story_hash)
-    story = await Story.select(db, "status", {"hash": story_hash})
-    return story.status if story else None
+
+    async def load_status() -> Optional[str]:
+        story = await Story.select(db, "status", {"hash": story_hash})
+        return story.status.value if story else None
+
+    status = await story_status_cache.get(story_hash, load_status)
+    return StoryStatus(status) if status else None
+
+
+def story_export_time(story_dict: Dict[str, Any]) -> Optional[str]:
+    """ The time the story was exported from Storium in UTC, as stored in the db """
+    try:
+        exported_at = Datetime.validate(story_dict["exported_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    if exported_at.tzinfo:
+        exported_at = exported_at.astimezone(timezone.utc)
+
+    return exported_at.strftime(EXPORT_TIME_FORMAT)
+
+
+async def record_latest_story(story: Story, *, db: Database):
+    """
+    Record the export time of the newest story for the game, marking the game as
+    needing its superseded stories cleaned up
+    """
+    if not story.game_pid or not story.exported_at:
+        return
+
+    table = LatestStory.__table__
+    if has_postgres():
+        query = pg_insert(table).values(
+            game_pid=story.game_pid,
+            exported_at=story.exported_at,
+            version=1,
+            cleaned_version=1,
+        )
+        await db.execute(
+            query.on_conflict_do_update(
+                index_elements=["game_pid"],
+                set_={
+                    "exported_at": sa.func.greatest(
+                        table.c.exported_at, query.excluded.exported_at
+                    ),
+                    "version": table.c.version + 1,
+                },
+            )
+        )
+    else:
+        # SQLAlchemy cannot generate an upsert for sqlite, so select the existing row
+        async with db.transaction():
+            latest = await LatestStory.select(
+                db, "exported_at", {"game_pid": story.game_pid}
+            )
+            if not latest:
+                await LatestStory(
+                    game_pid=story.game_pid,
+                    exported_at=story.exported_at,
+                    cleaned_version=1,
+                ).insert(db)
+            else:
+                await db.execute(
+                    table.update()
+                    .where(table.c.game_pid == story.game_pid)
+                    .values(
+                        exported_at=max(latest.exported_at, story.exported_at),
+                        version=table.c.version + 1,
+                    )
+                )
+
+
+async def cleanup_stories_batch(batch_size: int, *, db: Database) -> int:
+    """
+    Delete up to batch_size superseded stories, i.e. those exported before the latest
+    story of their game, which no suggestion references. Only games which had a story
+    created since they were last cleaned up are considered. Returns how many games
+    were considered.
+    """
+    latest = LatestStory.__table__
+    stories = Story.__table__
+    suggestions = Suggestion.__table__
+    async with db.transaction():
+        # Skip games locked by a concurrent cleanup
+        games = await db.fetch_all(
+            select([latest.c.game_pid, latest.c.version])
+            .where(latest.c.version > latest.c.cleaned_version)
+            .order_by(latest.c.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        if not games:
+            return 0
+
+        game_pids = [game["game_pid"] for game in games]
+        story_hashes: List[str] = [
+            row["hash"]
+            for row in await db.fetch_all(
+                select([stories.c.hash])
+                .select_from(
+                    stories.join(
+                        latest,
+                        and_(
+                            latest.c.game_pid == stories.c.game_pid,
+                            stories.c.exported_at < latest.c.exported_at,
+                        ),
+                    )
+                )
+                .where(latest.c.game_pid.in_(game_pids))
+                .where(~exists().where(suggestions.c.story_hash == stories.c.hash))
+                .limit(batch_size)
+            )
+        ]
+        await storage_ops.delete_stories(story_hashes, db=db)
+
+        if len(story_hashes) < batch_size:
+            # All the superseded stories of the games are cleaned up, though games
+            # with more stories created since are left pending
+            cleaned_versions = {game["game_pid"]: game["version"] for game in games}
+            await db.execute(
+                latest.update()
+                .where(latest.c.game_pid.in_(game_pids))
+                .values(
+                    cleaned_version=sa.case(cleaned_versions, value=latest.c.game_pid)
+                )
+            )
+
+    return len(games)
 
 
 async def cleanup_stories(*, db: Database):
-    """ Cleanup unused stories """
-    query = await load_query("cleanup_stories.sql")
-
-    # Because encode/databases uses a fetch (which causes a prepared statement
-    # error in PostgreSQL since the query has multiple statements) rather than
-    # an execute when calling db.execute, need to use db.execute_many instead
-    # since it actually does an execute.
-    await db.execute_many(query, [None])
+    """
+    Cleanup superseded stories in batches, each in its own short transaction, until
+    there are none left. Stop once the next cleanup is due, leaving any stories which
+    remain for it, so that cleanups never pile up when there is a large backlog.
+    """
+    deadline = time.monotonic() + Settings.story_cleanup_interval
+    while await cleanup_stories_batch(Settings.story_cleanup_batch_size, db=db):
+        if time.monotonic() >= deadline:
+            logger.info("Stopping the story cleanup until the next scheduled run")
+            break
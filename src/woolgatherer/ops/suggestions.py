@@ -1,28 +1,89 @@
 """
 Operations which can be conducted on suggestions
 """
+import time
 from uuid import uuid4, UUID
 from functools import singledispatch
-from typing import Optional, Sequence, Tuple, Union
+from typing import Dict, Optional, Sequence, Tuple, Union
 
 from databases import Database
+from sqlalchemy import Text
+from sqlalchemy.sql.expression import bindparam, cast, select
 
-from woolgatherer.errors import InvalidOperationError
+from woolgatherer.errors import InsufficientCapacityError, InvalidOperationError
 from woolgatherer.tasks import suggestions
 from woolgatherer.models.storium import SceneEntry
 from woolgatherer.models.feedback import FeedbackPrompt
-from woolgatherer.db.utils import json_hash
+from woolgatherer.db.statements import Statement
+from woolgatherer.db.utils import has_postgres, insert_ignore, json_digest, load_query
 from woolgatherer.db_models.suggestion import (
     Suggestion,
     SuggestionStatus,
     SuggestionType,
 )
+from woolgatherer.utils.cache import suggestion_cache
 from woolgatherer.utils.settings import Settings
 from woolgatherer.utils.logging import get_logger
+from woolgatherer.utils.rate_limit import TokenBucket
+from woolgatherer.utils.single_flight import SingleFlight
 
 
 logger = get_logger()
 
+# Every request to create a suggestion takes a token from the client's bucket
+suggestion_rate_limiter = TokenBucket(
+    "suggestion", Settings.suggestion_rate, Settings.suggestion_burst
+)
+
+# Concurrent requests to create the same suggestion share a single create
+suggestion_creates = SingleFlight()
+
+# How long (in seconds) to reuse the count of pending suggestions, such that a burst
+# of requests does not result in a burst of queries
+PENDING_COUNT_TTL = 1.0
+
+# How long (in seconds) clients should wait before retrying when at capacity
+PENDING_RETRY_AFTER = 5.0
+
+_pending_count: Tuple[int, float] = (0, 0.0)
+
+# Select the generated suggestion as the JSON text stored in the db
+_suggestion_json = Statement(
+    select(
+        [
+            cast(Suggestion.__table__.c.generated, Text).label("generated"),
+            Suggestion.__table__.c.status,
+        ]
+    ).where(Suggestion.__table__.c.uuid == bindparam("uuid"))
+)
+
+
+async def count_pending_suggestions(*, db: Database) -> int:
+    """ Count the suggestions which are waiting to be generated """
+    global _pending_count  # pylint:disable=global-statement
+    count, expires = _pending_count
+    if time.monotonic() < expires:
+        return count
+
+    count = await db.fetch_val(await load_query("pending_suggestions.sql"))
+    _pending_count = (count, time.monotonic() + PENDING_COUNT_TTL)
+    return count
+
+
+async def check_capacity(*, db: Database):
+    """
+    Make sure there is capacity to generate another suggestion. Rather than queueing
+    an unbounded number of tasks when the figmentators are saturated, tell the client
+    to retry later.
+    """
+    if Settings.max_pending_suggestions < 0:
+        return
+
+    if await count_pending_suggestions(db=db) >= Settings.max_pending_suggestions:
+        raise InsufficientCapacityError(
+            "Too many pending suggestions", retry_after=PENDING_RETRY_AFTER
+        )
+
 
 async def get_or_create_suggestion(
     story_hash: str,
@@ -31,26 +92,81 @@ async def get_or_create_suggestion(
     *,
     db: Database,
 ) -> Tuple[Optional[Suggestion], Sequence[FeedbackPrompt]]:
-    """ Create a suggestion. First mark it in the db, then create a task. """
+    """
+    Create a suggestion. First mark it in the db, then create a task. Clients often
+    retry requests, so concurrent requests for the same suggestion are coalesced such
+    that they share a single row in the db and a single task.
+    """
     if context.description:
         return None, Settings.user_feedback
 
-    _, context_hash = json_hash(context.dict())
-    suggestion = await get_suggestion(
-        story_hash, context_or_hash=context_hash, suggestion_type=suggestion_type, db=db
+    context_hash = json_digest(context.dict())
+    suggestion = await suggestion_creates.run(
+        (story_hash, context_hash, suggestion_type),
+        lambda: _get_or_create_suggestion(
+            story_hash, context, context_hash, suggestion_type, db=db
+        ),
     )
-    if suggestion:
-        if suggestion.status == SuggestionStatus.failed:
-            suggestion.status = SuggestionStatus.pending
-            await suggestion.update(db)
 
-            task = suggestions.create.delay(story_hash, context_hash, suggestion_type)
-            logger.debug("Started task %s", task.id)
+    return suggestion, Settings.user_feedback
 
-            return suggestion, Settings.user_feedback
 
-        return suggestion, Settings.user_feedback
+async def _get_or_create_suggestion(
+    story_hash: str,
+    context: SceneEntry,
+    context_hash: str,
+    suggestion_type: SuggestionType,
+    *,
+    db: Database,
+) -> Suggestion:
+    """
+    Get the suggestion if it exists, otherwise create it. This is shared by concurrent
+    requests, so rather than being part of the transaction of the request which
+    started it, it commits its own transaction before starting the task to generate
+    the suggestion and returning it.
+    """
+    async with db.transaction():
+        suggestion, start_task = await _select_or_insert_suggestion(
+            story_hash, context, context_hash, suggestion_type, db=db
+        )
+
+    if start_task:
+        task = suggestions.create.delay(story_hash, context_hash, suggestion_type)
+        logger.debug("Started task %s", task.id)
+
+    return suggestion
+
 
+async def _select_or_insert_suggestion(
+    story_hash: str,
+    context: SceneEntry,
+    context_hash: str,
+    suggestion_type: SuggestionType,
+    *,
+    db: Database,
+) -> Tuple[Suggestion, bool]:
+    """
+    Get the suggestion if it exists, otherwise insert it. Returns the suggestion and
+    whether a task needs to be started to generate it.
+    """
+    suggestion = await get_suggestion(
+        story_hash,
+        context_or_hash=context_hash,
+        suggestion_type=suggestion_type,
+        db=db,
+        columns=("id", "uuid", "status"),
+    )
+    if suggestion:
+        if suggestion.status != SuggestionStatus.failed:
+            return suggestion, False
+
+        await check_capacity(db=db)
+        suggestion.status = SuggestionStatus.pending
+        await suggestion.update(db)
+        await suggestion_cache.invalidate(suggestion.uuid)
+        return suggestion, True
+
+    await check_capacity(db=db)
     logger.debug("Creating suggestion for story_id: %s", story_hash)
     suggestion = Suggestion(
         uuid=uuid4(),
@@ -60,33 +176,97 @@ async def get_or_create_suggestion(
         story_hash=story_hash,
         context_hash=context_hash,
     )
-    await suggestion.insert(db)
-    task = suggestions.create.delay(story_hash, context_hash, suggestion_type)
-    logger.debug("Started task %s", task.id)
+    if not await insert_suggestion(suggestion, db=db):
+        # Another process created the suggestion concurrently, so it already started
+        # a task to generate the suggestion
+        logger.debug("Suggestion already created for story_id: %s", story_hash)
+        suggestion = await get_suggestion(
+            story_hash,
+            context_or_hash=context_hash,
+            suggestion_type=suggestion_type,
+            db=db,
+            columns=("uuid",),
+        )
+        return suggestion, False
+
+    return suggestion, True
 
-    return suggestion, Settings.user_feedback
+
+async def insert_suggestion(suggestion: Suggestion, *, db: Database) -> bool:
+    """
+    Insert the suggestion unless an identical suggestion already exists. Returns
+    whether the suggestion was inserted.
+    """
+    table = Suggestion.__table__
+    query = insert_ignore(table).values(suggestion.db_dict(defaults=True))
+    if has_postgres():
+        return await db.execute(query.returning(table.c.uuid)) is not None
+
+    await db.execute(query)
+    existing = await Suggestion.select(
+        db,
+        "uuid",
+        where={
+            "context_hash": suggestion.context_hash,
+            "story_hash": suggestion.story_hash,
+            "type": suggestion.type,
+        },
+    )
+    return existing is not None and existing.uuid == suggestion.uuid
 
 
 @singledispatch
 async def get_suggestion(
-    suggestion_id: UUID, *, db: Database, **kwargs  # pylint:disable=unused-argument
+    suggestion_id: UUID,
+    *,
+    db: Database,
+    columns: Optional[Sequence[str]] = None,
+    **kwargs,  # pylint:disable=unused-argument
 ) -> Optional[Suggestion]:
-    """ Get the current suggestion """
+    """
+    Get the current suggestion. Optionally only load the given columns, which avoids
+    loading and decoding the large JSON columns when they are not needed.
+    """
     logger.debug("Getting suggestion for suggestion_id: %s", suggestion_id)
-    suggestion = await Suggestion.select(db, where={"uuid": suggestion_id})
+    suggestion = await Suggestion.select(db, columns, where={"uuid": suggestion_id})
     return suggestion
 
 
+async def get_suggestion_json(
+    suggestion_id: UUID, *, db: Database
+) -> Optional[Tuple[str, SuggestionStatus]]:
+    """
+    Get the generated suggestion as JSON along with its status. The JSON is returned
+    as stored in the db, rather than decoding it only for it to be encoded again.
+    """
+    logger.debug("Getting suggestion json for suggestion_id: %s", suggestion_id)
+
+    async def load_json() -> Optional[Dict[str, str]]:
+        row = await db.fetch_one(_suggestion_json.bind({"uuid": suggestion_id}))
+        if not row:
+            return None
+
+        status = SuggestionStatus(row["status"])
+        return {"generated": row["generated"], "status": status.value}
+
+    result = await suggestion_cache.get(suggestion_id, load_json)
+    return (result["generated"], SuggestionStatus(result["status"])) if result else None
+
+
 async def get_suggestion_with_context(
     story_hash: str,
     *,
     suggestion_type: SuggestionType,
     context_or_hash: Union[SceneEntry, str],
     db: Database,
+    columns: Optional[Sequence[str]] = None,
 ) -> Optional[Suggestion]:
-    """ Get the current suggestion """
+    """
+    Get the current suggestion. Optionally only load the given columns, which avoids
+    loading and decoding the large JSON columns when they are not needed.
+    """
     if isinstance(context_or_hash, SceneEntry):
-        _, context_hash = json_hash(context_or_hash.dict())
+        context_hash = json_digest(context_or_hash.dict())
     else:
         context_hash = context_or_hash
 
@@ -96,6 +276,7 @@ async def get_suggestion_with_context(
 
     return await Suggestion.select(
         db,
+        columns,
         where={
             "context_hash": context_hash,
             "story_hash": story_hash,
@@ -112,9 +293,12 @@ get_suggestion.register(str, get_suggestion_with_context)
 async def finalize_suggestion(
     suggestion_id: UUID, entry: SceneEntry, *, db: Database
 ) -> None:
-    """ Get the current suggestion """
+    """
+    Finalize the suggestion. The caller must bump the dashboard data version once the
+    transaction commits.
+    """
     logger.debug("Finalizing suggestion for suggestion_id: %s", suggestion_id)
-    suggestion = await get_suggestion(suggestion_id, db=db)
+    suggestion = await get_suggestion(suggestion_id, db=db, columns=("finalized",))
     if not suggestion:
         raise InvalidOperationError("Unknown suggestion")
 
@@ -1,14 +1,13 @@
 """
 This router handles the dashboard endpoints.
 """
-import os
+import math
 import statistics
-from asyncio import gather
-from typing import Any, AsyncGenerator, Dict, List, Mapping, Sequence
+from typing import Any, AsyncGenerator, Dict, List, Mapping, Sequence, Tuple
 from itertools import combinations, groupby
 
-import aiofiles
 from aiocache import caches
+from aiocache.base import BaseCache
 from databases import Database
 from fastapi import APIRouter, Depends
 from scipy.stats import pearsonr
@@ -19,6 +18,7 @@ from woolgatherer.db.utils import load_query
 from woolgatherer.db_models.figmentator import FigmentatorStatus
 from woolgatherer.metrics import get_diff_score, remove_stopwords, rouge
 from woolgatherer.models.range import split_sentences
+from woolgatherer.ops import dashboard as dashboard_ops
 from woolgatherer.utils.auth import parse_scopes
 from woolgatherer.utils.routing import CompressibleRoute
 from woolgatherer.utils.templating import TemplateResponse
@@ -27,6 +27,9 @@ from woolgatherer.utils import ngram_overlaps
 
 MAX_PUBLIC_EDITS = 10
 
+# How many finalized suggestions to look up metrics for in a single cache request
+METRICS_PAGE_SIZE = 100
+
 
 router = APIRouter()
 router.route_class = CompressibleRoute
@@ -35,21 +38,81 @@ router.route_class = CompressibleRoute
 async def get_finalized_suggestions(
     db: Database, status: Sequence[FigmentatorStatus] = (FigmentatorStatus.active,)
 ) -> AsyncGenerator[Mapping, None]:
-    """ Load the finalized suggestions """
-    async with aiofiles.open(
-        os.path.join("static", "game_blacklist.txt"), "rt"
-    ) as blacklist_file:
-        blacklist = [l.strip() for l in await blacklist_file.readlines()]
-
+    """ Load the finalized suggestions, excluding blacklisted games """
     async for row in db.iterate(
-        await load_query("finalized_suggestions.sql"),
-        {"status": status, "blacklist": blacklist},
+        await load_query("finalized_suggestions.sql"), {"status": status}
     ):
         yield row
 
 
-# TODO: refactor to make this function more modular
-# pylint:disable=too-many-locals
+async def with_suggestion_metrics(
+    rows: AsyncGenerator[Mapping, None], cache: BaseCache
+) -> AsyncGenerator[Tuple[Mapping, Dict[str, Any]], None]:
+    """
+    Pair each finalized suggestion with its metrics. The rows are processed in pages,
+    such that each page needs a single cache lookup for the metrics of its
+    suggestions, and a single cache update for any metrics which had to be computed.
+    """
+    page: List[Mapping] = []
+    async for row in rows:
+        page.append(row)
+        if len(page) >= METRICS_PAGE_SIZE:
+            for item in await get_suggestion_metrics(page, cache):
+                yield item
+            page = []
+
+    if page:
+        for item in await get_suggestion_metrics(page, cache):
+            yield item
+
+
+async def get_suggestion_metrics(
+    page: Sequence[Mapping], cache: BaseCache
+) -> List[Tuple[Mapping, Dict[str, Any]]]:
+    """ Get the metrics for a page of finalized suggestions, computing any misses """
+    cache_keys = [f"suggestion:{row['suggestion_id']}:metrics" for row in page]
+    all_metrics = await cache.multi_get(cache_keys)
+
+    misses = []
+    for idx, row in enumerate(page):
+        if all_metrics[idx] is None:
+            all_metrics[idx] = compute_suggestion_metrics(
+                row["generated_text"], row["user_text"]
+            )
+            misses.append((cache_keys[idx], all_metrics[idx]))
+
+    if misses:
+        await cache.multi_set(misses)
+
+    return list(zip(page, all_metrics))
+
+
+def compute_suggestion_metrics(generated: str, finalized: str) -> Dict[str, Any]:
+    """ Compute the metrics comparing the generated and finalized suggestion """
+    diff, diff_score = get_diff_score(generated, finalized)
+    rouge_scores = rouge.get_scores(
+        [" ".join(remove_stopwords(generated))],
+        [" ".join(remove_stopwords(finalized))],
+    )
+
+    return {
+        "diff": diff,
+        "diff_score": diff_score,
+        "rouge_scores": rouge_scores,
+        "finalized_sentences": split_sentences(finalized),
+        "generated_sentences": split_sentences(generated),
+    }
+
+
+def correlate(x: Dict[int, float], y: Dict[int, float]) -> Dict[str, Any]:
+    """ Correlate the ratings the two rating types share """
+    r, p = pearsonr([x[k] for k in y if k in x], [y[k] for k in x if k in y])
+
+    # The correlation is undefined when either rating is constant, which cannot be
+    # represented in JSON
+    return {"r": None, "p": None} if math.isnan(r) else {"r": r, "p": p}
+
+
 @router.get("/", summary="Get the main dashboard for the woolgatherer service")
 async def get_dashboard(
     request: Request,
@@ -60,6 +123,19 @@ async def get_dashboard(
     This method returns a template for the main dashboard of the woolgatherer
     service.
     """
+    context = await dashboard_ops.get_dashboard(status, compute_dashboard, db=db)
+    if "user_edits" not in parse_scopes(request):
+        context = {**context, "edits": context["edits"][:MAX_PUBLIC_EDITS]}
+
+    return TemplateResponse(request, "dashboard/index.html", context)
+
+
+# TODO: refactor to make this function more modular
+# pylint:disable=too-many-locals
+async def compute_dashboard(
+    status: FigmentatorStatus, *, db: Database
+) -> Dict[str, Any]:
+    """ Compute the template context for the dashboard """
     query = await load_query("suggestion_counts_by_user.sql")
     suggestion_counts = {}
     for c in [1, 5, 10, 20, float("inf")]:
@@ -69,7 +145,7 @@ async def get_dashboard(
         if not result:
             continue
 
-        suggestion_counts[c] = result["unique_user_count"]
+        suggestion_counts[str(c)] = result["unique_user_count"]
 
     edits: List[Dict[str, Any]] = []
     ratings: Dict[str, Dict[int, float]] = {
@@ -88,17 +164,14 @@ async def get_dashboard(
 
     idx = -1
     all_models = set()
-    cache_updates = []
     cache = caches.get("default")
-    scopes = parse_scopes(request)
     ratings_by_model: Dict[str, Dict[str, Dict[int, float]]] = {}
-    async for row in get_finalized_suggestions(db, status=(status,)):
+    async for row, suggestion_metrics in with_suggestion_metrics(
+        get_finalized_suggestions(db, status=(status,)), cache
+    ):
         idx += 1
         game_pid = row["game_pid"]
-        finalized = row["user_text"]
-        generated = row["generated_text"]
         model_name = row["model_name"]
-        suggestion_id = row["suggestion_id"]
 
         all_models.add(model_name)
 
@@ -119,27 +192,6 @@ async def get_dashboard(
             },
         )
 
-        cache_key = f"suggestion:{suggestion_id}:metrics"
-        suggestion_metrics = await cache.get(cache_key)
-        if suggestion_metrics is None:
-            suggestion_metrics = {}
-            diff, diff_score = get_diff_score(generated, finalized)
-
-            finalized_sentences = split_sentences(finalized)
-            generated_sentences = split_sentences(generated)
-
-            rouge_scores = rouge.get_scores(
-                [" ".join(remove_stopwords(generated))],
-                [" ".join(remove_stopwords(finalized))],
-            )
-
-            suggestion_metrics["diff"] = diff
-            suggestion_metrics["diff_score"] = diff_score
-            suggestion_metrics["rouge_scores"] = rouge_scores
-            suggestion_metrics["finalized_sentences"] = finalized_sentences
-            suggestion_metrics["generated_sentences"] = generated_sentences
-            cache_updates.append(cache.set(cache_key, suggestion_metrics))
-
         diff = suggestion_metrics["diff"]
         diff_score = suggestion_metrics["diff_score"]
         rouge_scores = suggestion_metrics["rouge_scores"]
@@ -187,95 +239,58 @@ async def get_dashboard(
             model_scores[idx] = precision
             model_ratings[rouge_type] = model_scores
 
-        if "user_edits" in scopes or len(edits) < MAX_PUBLIC_EDITS:
-            edits.append(edit)
+        edits.append(edit)
 
         ratings_by_model[model_name] = model_ratings
 
-    cache_key = f"suggestion:*:metrics:correlations"
-    all_correlations: Dict[str, Dict[str, Dict[str, float]]] = await cache.get(
-        cache_key
-    )
-    if cache_updates or all_correlations is None:
-        all_correlations = {k: {} for k in ratings}
-
-        for (k1, v1), (k2, v2) in combinations(ratings.items(), 2):
-            r, p = pearsonr(
-                [v1[k] for k in v2 if k in v1], [v2[k] for k in v1 if k in v2]
-            )
-
-            all_correlations[k1][k2] = {"r": r, "p": p}
+    all_correlations: Dict[str, Dict[str, Dict[str, Any]]] = {k: {} for k in ratings}
+    for (k1, v1), (k2, v2) in combinations(ratings.items(), 2):
+        all_correlations[k1][k2] = correlate(v1, v2)
 
-        cache_updates.append(cache.set(cache_key, all_correlations))
+    correlations_by_model: Dict[str, Dict[str, Dict[str, Dict[str, Any]]]] = {
+        model_name: {k: {} for k in ratings} for model_name in ratings_by_model
+    }
+    for model_name, model_ratings in ratings_by_model.items():
+        for (k1, v1), (k2, v2) in combinations(model_ratings.items(), 2):
+            correlations_by_model[model_name][k1][k2] = correlate(v1, v2)
 
-    cache_key = f"suggestion:*:metrics:correlations:by_model"
-    correlations_by_model: Dict[
-        str, Dict[str, Dict[str, Dict[str, float]]]
-    ] = await cache.get(cache_key)
-    if cache_updates or correlations_by_model is None:
-        correlations_by_model = {
-            model_name: {k: {} for k in ratings} for model_name in ratings_by_model
-        }
+    avg_ratings = await db.fetch_all(
+        await load_query("avg_ratings.sql"), {"status": (status,)}
+    )
 
+    # Convert to an actual dict, since the rows are returned in a "Record"
+    avg_ratings = [dict(row) for row in avg_ratings]
+    for key in ("user", "rouge-l", "rouge-w") + tuple(
+        f"rouge-{i}" for i in range(1, rouge.max_n + 1)
+    ):
         for model_name, model_ratings in ratings_by_model.items():
-            for (k1, v1), (k2, v2) in combinations(model_ratings.items(), 2):
-                r, p = pearsonr(
-                    [v1[k] for k in v2 if k in v1], [v2[k] for k in v1 if k in v2]
-                )
-
-                correlations_by_model[model_name][k1][k2] = {"r": r, "p": p}
-
-        cache_updates.append(cache.set(cache_key, correlations_by_model))
-
-    cache_key = f"suggestion:*:metrics:ratings:avg"
-    avg_ratings = await cache.get(cache_key)
-    if cache_updates or avg_ratings is None:
-        avg_ratings = await db.fetch_all(
-            await load_query("avg_ratings.sql"), {"status": (status,)}
-        )
-
-        # Convert to an actual dict, since the rows are returned in a "Record"
-        avg_ratings = [dict(row) for row in avg_ratings]
-        for key in ("user", "rouge-l", "rouge-w") + tuple(
-            f"rouge-{i}" for i in range(1, rouge.max_n + 1)
-        ):
-            for model_name, model_ratings in ratings_by_model.items():
-                scores = model_ratings[key]
-                mean = statistics.mean(scores.values())
-                stddev = statistics.stdev(scores.values())
-                avg_ratings.append(
-                    {
-                        "type": key,
-                        "model_name": model_name,
-                        "avg_rating": f"{mean:.2f}",
-                        "rating_stddev": f"{stddev:.2f}",
-                        "feedback_count": len(scores),
-                    }
-                )
-
-        cache_updates.append(cache.set(cache_key, avg_ratings))
+            scores = model_ratings[key]
+            mean = statistics.mean(scores.values())
+            stddev = statistics.stdev(scores.values())
+            avg_ratings.append(
+                {
+                    "type": key,
+                    "model_name": model_name,
+                    "avg_rating": f"{mean:.2f}",
+                    "rating_stddev": f"{stddev:.2f}",
+                    "feedback_count": len(scores),
+                }
+            )
 
     ratings_by_type = {
         t: [{k: v for k, v in r.items() if k != "type"} for r in g]
         for t, g in groupby(avg_ratings, lambda x: x["type"])
     }
 
-    if cache_updates:
-        await gather(*cache_updates)
-
-    return TemplateResponse(
-        request,
-        "dashboard/index.html",
-        {
-            "edits": edits,
-            "models": all_models,
-            "ratings": avg_ratings,
-            "all_correlations": all_correlations,
-            "correlations_by_model": correlations_by_model,
-            "ratings_by_type": ratings_by_type,
-            "suggestion_counts": suggestion_counts,
-        },
-    )
+    return {
+        "edits": edits,
+        "models": sorted(all_models),
+        "ratings": avg_ratings,
+        "all_correlations": all_correlations,
+        "correlations_by_model": correlations_by_model,
+        "ratings_by_type": ratings_by_type,
+        "suggestion_counts": suggestion_counts,
+    }
 
 
 # pylint:enable=too-many-locals
@@ -4,19 +4,24 @@ This router handles the website frontend
 import os
 
 from fastapi import APIRouter, HTTPException
+from starlette.requests import Request
 from starlette.status import HTTP_404_NOT_FOUND
-from starlette.responses import FileResponse
 
+from woolgatherer.errors import InvalidOperationError
+from woolgatherer.models.exports import ExportManifest
+from woolgatherer.ops import exports as export_ops
+from woolgatherer.utils.downloads import download_file
 from woolgatherer.utils.settings import Settings
 
 
 router = APIRouter()
 
 
-@router.get("/download", summary="Download the dataset")
-async def download():
+@router.api_route("/download", methods=["GET", "HEAD"], summary="Download the dataset")
+async def download(request: Request):
     """
-    Initiate a download if the user is logged in and authorized
+    Initiate a download if the user is logged in and authorized. Supports resuming
+    the download with a Range request.
     """
     if not Settings.dataset:
         raise HTTPException(HTTP_404_NOT_FOUND, "Dataset path not specified")
@@ -25,4 +30,47 @@ async def download():
     if not os.path.isfile(dataset_path):
         raise HTTPException(HTTP_404_NOT_FOUND, f"Cannot find {Settings.dataset}")
 
-    return FileResponse(dataset_path, filename=Settings.dataset)
+    return await download_file(request, dataset_path, Settings.dataset)
+
+
+def load_export_manifest(name: str) -> ExportManifest:
+    """ Load the manifest of the export, raising a 404 if it does not exist """
+    try:
+        manifest = export_ops.load_manifest(name)
+    except InvalidOperationError:
+        manifest = None
+
+    if manifest is None:
+        raise HTTPException(HTTP_404_NOT_FOUND, f"Cannot find export {name}")
+
+    return manifest
+
+
+@router.get(
+    "/exports/{name}",
+    summary="Get the manifest of a dataset export",
+    response_model=ExportManifest,
+)
+async def get_export(name: str):
+    """
+    Return the manifest of the export, which lists the files of each partition
+    """
+    return load_export_manifest(name)
+
+
+@router.api_route(
+    "/exports/{name}/{filename}",
+    methods=["GET", "HEAD"],
+    summary="Download a file of a dataset export",
+)
+async def download_export(request: Request, name: str, filename: str):
+    """
+    Download one of the files listed in the manifest of the export
+    """
+    manifest = load_export_manifest(name)
+    if not any(filename in p.files for p in manifest.partitions.values()):
+        raise HTTPException(HTTP_404_NOT_FOUND, f"Cannot find {filename} in {name}")
+
+    return await download_file(
+        request, os.path.join(export_ops.export_path(name), filename), filename
+    )
@@ -4,10 +4,8 @@ This router handles the website frontend
 import csv
 import io
 import json
-import os
-from typing import Any, AsyncGenerator, Dict, Mapping, Sequence
+from typing import AsyncGenerator, Mapping, Sequence
 
-import aiofiles
 from databases import Database
 from fastapi import APIRouter, Depends, Header, HTTPException
 from starlette.responses import PlainTextResponse, StreamingResponse
@@ -21,25 +19,35 @@ from woolgatherer.utils.logging import get_logger
 logger = get_logger()
 router = APIRouter()
 
+# The columns of the judgement contexts CSV, in order
+CSV_FIELDS = (
+    "suggestion_id",
+    "model_name",
+    "character_name",
+    "character_description",
+    "challenge_name",
+    "challenge_text",
+    "challenge_success_description",
+    "challenge_failure_description",
+    "played_card_1_name",
+    "played_card_1_description",
+    "previous_entry_text",
+    "suggestion_text",
+)
+
+# How large (in characters) the CSV buffer may grow before it is sent to the client
+CSV_FLUSH_SIZE = 64 * 1024
+
 
 async def select_judgement_contexts(
     db: Database,
     limit: int = 0,
     status: Sequence[FigmentatorStatus] = (FigmentatorStatus.active,),
 ) -> AsyncGenerator[Mapping, None]:
-    """ Load the finalized suggestions """
-    async with aiofiles.open(
-        os.path.join("static", "game_blacklist.txt"), "rt"
-    ) as blacklist_file:
-        blacklist = [l.strip() for l in await blacklist_file.readlines()]
-
+    """ Load the finalized suggestions, excluding blacklisted games """
     async for row in db.iterate(
         await load_query("judgement_contexts.sql"),
-        {
-            "status": status,
-            "blacklist": blacklist,
-            "limit": float("inf") if not limit else limit,
-        },
+        {"status": status, "limit": float("inf") if not limit else limit},
     ):
         yield row
 
@@ -79,86 +87,34 @@ async def get_judgement_contexts_csv(
 ):
     """ Get judgement contexts as CSV """
 
-    def create_csv_row():
-        csv_row = io.StringIO()
-        writer = csv.DictWriter(
-            csv_row,
-            fieldnames=[
-                "suggestion_id",
-                "model_name",
-                "character_name",
-                "character_description",
-                "challenge_name",
-                "challenge_text",
-                "challenge_success_description",
-                "challenge_failure_description",
-                "played_card_1_name",
-                "played_card_1_description",
-                "previous_entry_text",
-                "suggestion_text",
-            ],
-        )
-        return csv_row, writer
-
     async def get_as_csv():
-        """ Iteratively yield CSV """
-        csv_row, writer = create_csv_row()
-        writer.writeheader()
-        yield csv_row.getvalue()
-
-        async for row in select_judgement_contexts(db, limit=limit, status=(status,)):
-            csv_row, writer = create_csv_row()
-            story = json.loads(row["story"])
-            generated = json.loads(row["generated"])
-            model_name = row["model_name"]
+        """ Iteratively yield CSV, flushing the buffer once it reaches a threshold """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_FIELDS)
+
+        query = await load_query("judgement_contexts_csv.sql")
+        values = {"status": (status,), "limit": float("inf") if not limit else limit}
+        async for row in db.iterate(query, values):
             suggestion_id = row["suggestion_id"]
-
-            scenes = story["scenes"]
-            previous_entry: Dict[str, Any] = {}
-            if scenes:
-                entries = scenes[-1]["entries"]
-                if entries:
-                    previous_entry = entries[-1]
-
-            character: Dict[str, Any] = {}
-            character_id = generated["character_seq_id"]
-            challenge = generated["target_challenge_card"]
-            cards = generated["cards_played_on_challenge"]
-            for character_info in story["characters"]:
-                if character_id == character_info["character_seq_id"]:
-                    character = character_info
-                    break
-
-            if not cards:
+            if not row["has_cards"]:
                 logger.fatal(f"Missing card data in suggestion {suggestion_id}")
                 continue
 
-            if not character:
+            if not row["has_character"]:
                 logger.fatal(
-                    f"Missing character data for {character_id}"
+                    f"Missing character data for {row['character_id']}"
                     f" in suggestion {suggestion_id}"
                 )
                 continue
 
-            row_data = {}
-            row_data["model_name"] = model_name
-            row_data["suggestion_id"] = suggestion_id
-            row_data["character_name"] = character["name"]
-            row_data["character_description"] = character["description"]
-            row_data["challenge_name"] = challenge["name"]
-            row_data["challenge_text"] = challenge["description"]
-            row_data["challenge_success_description"] = challenge["success_stakes"]
-            row_data["challenge_failure_description"] = challenge["failure_stakes"]
-            row_data["played_card_1_name"] = cards[0]["name"]
-            row_data["played_card_1_description"] = cards[0]["description"]
-            row_data["suggestion_text"] = generated["description"]
-            row_data["previous_entry_text"] = (
-                previous_entry["description"] if previous_entry else ""
-            )
-
-            writer.writerow(row_data)
+            writer.writerow([row[field] for field in CSV_FIELDS])
+            if buffer.tell() >= CSV_FLUSH_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
 
-            yield csv_row.getvalue()
+        yield buffer.getvalue()
 
     return StreamingResponse(
         get_as_csv(),
@@ -1,21 +1,39 @@
 """
 This router handles the stories endpoints.
 """
-from typing import Any, Dict
+import json
+from typing import Any, Callable, Dict
 
 from databases import Database
 from pydantic import BaseModel, Field
-from fastapi import APIRouter, Body, Path, HTTPException, Depends
-from starlette.status import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+)
+from fastapi.dependencies.utils import get_body_field, get_dependant
+from starlette.status import (
+    HTTP_202_ACCEPTED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_404_NOT_FOUND,
+    HTTP_422_UNPROCESSABLE_ENTITY,
+)
 from starlette.requests import Request
 from starlette.responses import Response
 
 from woolgatherer.db.session import get_db
-from woolgatherer.models.stories import StoryStatus
+from woolgatherer.errors import InvalidStoryDeltaError
+from woolgatherer.models.stories import StoryDelta, StoryStatus
 from woolgatherer.ops import stories as story_ops
+from woolgatherer.utils.logging import get_logger
 from woolgatherer.utils.routing import CompressibleRoute
 
 
+logger = get_logger()
+
 router = APIRouter()
 router.route_class = CompressibleRoute
 
@@ -32,23 +50,38 @@ class StoryStatusResponse(BaseModel):
     status: StoryStatus = Field(..., description="The status of the story")
 
 
-@router.post(
-    "/create",
-    status_code=HTTP_202_ACCEPTED,
-    summary="Upload a Story",
-    response_description="""On success, you should expect to receive an HTTP 202
-    response denoting that the story upload has completed and a long running
-    preprocess job has been accepted, along with a Location that can be used to query
-    the preprocessing status of the story.""",
-    response_model=StoryCreatedResponse,
-)
-async def create_story(
-    request: Request,
-    response: Response,
+def story_body(
     story: Dict[str, Any] = Body(
         ...,
         description="""A story in the [Storium export format]
         (https://storium.com/help/export/json/0.9.2).""",
+    )
+):
+    """ Only used to document the body of a story upload """
+
+
+class StoryUploadRoute(CompressibleRoute):
+    """
+    A route where the endpoint reads the story from the request body itself, rather
+    than having it parsed and validated up front, which allows skipping parsing
+    stories that were previously uploaded. The expected body is still documented.
+    """
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        self.body_field = get_body_field(
+            dependant=get_dependant(path=path, call=story_body), name=self.unique_id
+        )
+
+
+async def create_story(
+    request: Request,
+    response: Response,
+    x_story_id: str = Header(
+        None,
+        description="""The story_id of the story being uploaded, if known. It is only
+        honored if this exact upload was previously made for the story, otherwise the
+        upload is processed in full and its actual story_id is returned.""",
     ),
     db: Database = Depends(get_db),
 ):
@@ -59,13 +92,95 @@ async def create_story(
     suggestions. Therefore it may make sense to upload stories well in advance of
     requesting a suggestion. This may help reduce latency in generating a suggestion.
     """
-    story_id = await story_ops.create_story(story, db=db)
+    story_bytes = await request.body()
+    story_id = await story_ops.find_story_upload(story_bytes, db=db)
+    if x_story_id and story_id != x_story_id:
+        # A client supplied story_id is never trusted on its own, e.g. the client may
+        # have cached the story_id of a previous version of the story
+        logger.debug("Ignoring the client supplied story_id: %s", x_story_id)
+
+    if not story_id:
+        try:
+            story = json.loads(story_bytes)
+        except ValueError:
+            raise HTTPException(
+                HTTP_400_BAD_REQUEST, detail="There was an error parsing the body"
+            )
+
+        if not isinstance(story, dict):
+            raise HTTPException(
+                HTTP_422_UNPROCESSABLE_ENTITY, detail="The story must be an object"
+            )
+
+        story_id = await story_ops.create_story(story, db=db)
+        await story_ops.remember_story_upload(story_bytes, story_id)
+
     base_path = request.url.path.rstrip("/create")
     response.headers["Location"] = f"{base_path}/{story_id}/status"
 
     return StoryCreatedResponse(story_id=story_id)
 
 
+router.add_api_route(
+    "/create",
+    create_story,
+    methods=["POST"],
+    status_code=HTTP_202_ACCEPTED,
+    summary="Upload a Story",
+    response_description="""On success, you should expect to receive an HTTP 202
+    response denoting that the story upload has completed and a long running
+    preprocess job has been accepted, along with a Location that can be used to query
+    the preprocessing status of the story.""",
+    response_model=StoryCreatedResponse,
+    route_class_override=StoryUploadRoute,
+)
+
+
+@router.post(
+    "/{story_id}/delta",
+    status_code=HTTP_202_ACCEPTED,
+    summary="Upload the changes to a Story",
+    response_description="""On success, you should expect to receive an HTTP 202
+    response denoting that the updated story has been created and a long running
+    preprocess job has been accepted, along with a Location that can be used to query
+    the preprocessing status of the updated story.""",
+    response_model=StoryCreatedResponse,
+)
+async def create_story_delta(
+    request: Request,
+    response: Response,
+    story_id: str = Path(
+        ...,
+        description="""The story_id of a previously uploaded story which the changes
+        are relative to.""",
+    ),
+    delta: StoryDelta = Body(
+        ..., description="""The scenes and entries added since the story upload."""
+    ),
+    db: Database = Depends(get_db),
+):
+    """
+    Use this method to upload only the changes to a story that was previously uploaded,
+    rather than uploading the full story again. This creates a new story with its own
+    story_id, which **MUST** be used when requesting a suggestion for the updated story.
+    If the story being changed is unknown, an HTTP 404 is returned and the full story
+    must be uploaded instead, while an HTTP 422 is returned if the changes cannot be
+    applied to the story, e.g. entries are added to a story without any scenes.
+    """
+    try:
+        new_story_id = await story_ops.create_story_delta(story_id, delta, db=db)
+    except InvalidStoryDeltaError as error:
+        raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, detail=str(error))
+
+    if new_story_id is None:
+        raise HTTPException(HTTP_404_NOT_FOUND, detail="Unknown story")
+
+    base_path = request.url.path.rsplit("/", 2)[0]
+    response.headers["Location"] = f"{base_path}/{new_story_id}/status"
+
+    return StoryCreatedResponse(story_id=new_story_id)
+
+
 @router.get(
     "/{story_id}/status",
     summary="Check the status of a Story upload",
@@ -1,11 +1,14 @@
 """
 This router handles the suggestion endpoints.
 """
+import json
 from uuid import UUID
 from typing import List
 from pydantic import BaseModel, Field
 from databases import Database
 from fastapi import APIRouter, Body, Path, HTTPException, Depends
+from starlette.requests import Request
+from starlette.responses import Response
 from starlette.status import HTTP_202_ACCEPTED, HTTP_404_NOT_FOUND, HTTP_400_BAD_REQUEST
 
 from woolgatherer.db.session import get_db
@@ -15,6 +18,7 @@ from woolgatherer.models.storium import SceneEntry
 from woolgatherer.models.feedback import FeedbackPrompt, FeedbackResponse
 from woolgatherer.models.suggestion import SuggestionType, SuggestionStatus
 from woolgatherer.ops import (
+    dashboard as dashboard_ops,
     feedback as feedback_ops,
     stories as story_ops,
     suggestions as suggestion_ops,
@@ -59,6 +63,7 @@ class SuggestionResponse(BaseModel):
     response_model_exclude_unset=True,
 )
 async def create_suggestion(
+    request: Request,
     story_id: str = Body(
         ..., description="""The id of the story to create a suggestion for"""
     ),
@@ -75,6 +80,11 @@ async def create_suggestion(
     suggestion is a long running process. You **MUST** upload the story in full before
     invoking this endpoint.
     """
+    # Rate limit each user of each client separately
+    await suggestion_ops.suggestion_rate_limiter.acquire(
+        f"{request.user.display_name}:{context.user_pid}"
+    )
+
     story_status = await story_ops.get_story_status(story_id, db=db)
     if story_status is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail="Unknown story")
@@ -112,15 +122,19 @@ async def get_suggestion(
     return the suggestion. Otherwise it will return a status message indicating the
     suggestion is still pending.
     """
-    suggestion = await suggestion_ops.get_suggestion(UUID(suggestion_id), db=db)
-    if suggestion is None:
+    result = await suggestion_ops.get_suggestion_json(UUID(suggestion_id), db=db)
+    if result is None:
         raise HTTPException(HTTP_404_NOT_FOUND, detail="Unknown suggestion")
 
-    # For some reason FastAPI doesn't like it if I return the SuggestionResponse
-    # directly, but if I return it as a dict and have it convert to a SuggestionResponse
-    # then it works fine... don't have time to figure out why this is happening right
-    # now.
-    return {"suggestion": suggestion.generated, "status": suggestion.status}
+    # This is the most frequently polled endpoint, so rather than decoding the
+    # suggestion into a SceneEntry, only to have the response model validate and encode
+    # it again, pass the stored JSON through as is. The response model is kept for the
+    # docs, though it is bypassed when directly returning a response.
+    generated, status = result
+    return Response(
+        content=f'{{"status":{json.dumps(status)},"suggestion":{generated}}}',
+        media_type="application/json",
+    )
 
 
 @router.post("/{suggestion_id}/feedback", summary="Submit feedback")
@@ -131,6 +145,9 @@ async def submit_feedback(
     feedback: List[FeedbackResponse] = Body(
         ..., description="""The responses to the required feedback."""
     ),
+    data_version: dashboard_ops.DataVersionBump = Depends(
+        dashboard_ops.bump_data_version_after_commit
+    ),
     db: Database = Depends(get_db),
 ):
     """
@@ -139,6 +156,7 @@ async def submit_feedback(
     Suggestion was generated.
     """
     await feedback_ops.submit_feedback(UUID(suggestion_id), feedback, db=db)
+    data_version.request()
 
 
 @router.post("/{suggestion_id}/finalize", summary="Finalize a Suggestion")
@@ -147,6 +165,9 @@ async def finalize_suggestion(
         ..., description="""The suggestion_id for the suggestion the user evaluated."""
     ),
     entry: SceneEntry = Body(..., description="""The move that the user submitted."""),
+    data_version: dashboard_ops.DataVersionBump = Depends(
+        dashboard_ops.bump_data_version_after_commit
+    ),
     db: Database = Depends(get_db),
 ):
     """
@@ -155,3 +176,4 @@ async def finalize_suggestion(
     context.
     """
     await suggestion_ops.finalize_suggestion(UUID(suggestion_id), entry, db=db)
+    data_version.request()
@@ -3,6 +3,10 @@ Initialize the celery task queue
 """
 from celery import Celery
 
+from woolgatherer.utils.cache import initialize_caches
 from woolgatherer.utils.settings import Settings
 
 app = Celery("woolgatherer", broker=Settings.broker_url)
+
+# The workers never run the startup events of the app, so configure the cache here
+initialize_caches()
@@ -2,26 +2,31 @@
 Story preprocessing tasks
 """
 from asyncio import as_completed
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from aiohttp import ClientSession
 from databases import Database
 from asgiref.sync import async_to_sync
-from celery.schedules import crontab
 from celery.utils.log import get_task_logger
 
 from woolgatherer.db_models.storium import Story, StoryStatus
 from woolgatherer.db_models.figmentator import Figmentator, FigmentatorForStory
-from woolgatherer.ops import figmentator as figmentator_ops
+from woolgatherer.ops import figmentator as figmentator_ops, storage as storage_ops
 from woolgatherer.ops import stories as story_ops  # pylint:disable=cyclic-import
 from woolgatherer.tasks import app
+from woolgatherer.utils.cache import story_status_cache, task_cache
 from woolgatherer.utils.settings import Settings
 
 
 logger = get_task_logger(__name__)
 
 
-async def _process(story_id: str, figmentators: List[Figmentator]):
+async def _process(
+    story_id: str,
+    figmentators: List[Figmentator],
+    base_story_id: Optional[str] = None,
+    delta: Optional[Dict[str, Any]] = None,
+):
     """ Do the actual processing... """
     async with Database(Settings.dsn) as db:
         where = {"hash": story_id}
@@ -32,25 +37,57 @@ async def _process(story_id: str, figmentators: List[Figmentator]):
             # happened, like dropping entries from the database...
             raise LookupError(f"Cannot find story for id={story_id}!")
 
+        # Only figmentators which already preprocessed the base story can make use of
+        # a delta, the rest need the full story
+        delta_model_ids = set()
+        if base_story_id and delta:
+            delta_model_ids = {
+                mapping.model_id
+                for mapping in await FigmentatorForStory.select_all(
+                    db, where={"story_hash": base_story_id}
+                )
+            }
+
         async with ClientSession() as session:
             requests = []
-            context = {"story_id": story.hash, "story": story.story}
+            context = {
+                "story_id": story.hash,
+                "story": await storage_ops.load_story(story, db=db),
+            }
+            delta_context = {
+                "story_id": story.hash,
+                "base_story_id": base_story_id,
+                "delta": delta,
+            }
             for figmentator in figmentators:
-                requests.append(
-                    figmentator_ops.preprocess(context, figmentator, session=session)
-                )
+                if figmentator.id in delta_model_ids:
+                    request = figmentator_ops.preprocess_delta(
+                        context, delta_context, figmentator, session=session
+                    )
+                else:
+                    request = figmentator_ops.preprocess(
+                        context, figmentator, session=session
+                    )
+                requests.append(request)
 
             story.status = StoryStatus.ready
+            mappings = []
             for result in as_completed(requests):
                 completed, figmentator = await result
                 if completed:
-                    await FigmentatorForStory(
-                        model_id=figmentator.id, story_hash=story_id
-                    ).insert(db)
+                    mappings.append(
+                        FigmentatorForStory(
+                            model_id=figmentator.id, story_hash=story_id
+                        )
+                    )
                 else:
                     story.status = StoryStatus.failed
 
+        await FigmentatorForStory.insert_many(db, mappings)
         await story.update(db, where=where)
+        async with task_cache() as cache:
+            await story_status_cache.invalidate(story_id, cache=cache)
+
         logger.info("Processed story=%s, status=%s", story_id, story.status)
 
 
@@ -63,19 +100,27 @@ async def _cleanup_stories():
 @app.task(
     autoretry_for=(LookupError,), retry_kwargs={"max_retries": 3}, retry_backoff=0.25
 )
-def process(story_id: str, figmentators: List[Dict[str, Any]]):
-    """ Preprocess a story """
-    async_to_sync(_process)(story_id, [Figmentator(**f) for f in figmentators])
+def process(
+    story_id: str,
+    figmentators: List[Dict[str, Any]],
+    base_story_id: Optional[str] = None,
+    delta: Optional[Dict[str, Any]] = None,
+):
+    """ Preprocess a story, optionally as a delta from a base story """
+    async_to_sync(_process)(
+        story_id, [Figmentator(**f) for f in figmentators], base_story_id, delta
+    )
 
 
 @app.task
 def cleanup_stories():
-    """ Cleanup unused stories """
+    """ Cleanup superseded stories which are not referenced by any suggestions """
     async_to_sync(_cleanup_stories)()
 
 
 @app.on_after_configure.connect
 def setup_periodic_tasks(sender, **kwargs):  # pylint:disable=unused-argument
     """ Schedules periodic tasks """
-    # Executes every day at midnight
-    sender.add_periodic_task(crontab(hour=0, minute=0), cleanup_stories.s())
+    # Stories are cleaned up incrementally in small batches, so run frequently rather
+    # than as one large nightly cleanup
+    sender.add_periodic_task(Settings.story_cleanup_interval, cleanup_stories.s())
@@ -25,7 +25,8 @@ from woolgatherer.errors import ProcessingError
 from woolgatherer.tasks import app
 from woolgatherer.models.range import compute_full_range, split_sentences, RangeUnits
 from woolgatherer.models.storium import SceneEntry
-from woolgatherer.ops import figmentator as figmentator_ops
+from woolgatherer.ops import figmentator as figmentator_ops, storage as storage_ops
+from woolgatherer.utils.cache import story_status_cache, suggestion_cache, task_cache
 from woolgatherer.utils.settings import Settings
 from woolgatherer.db.utils import json_dumps, load_query
 
@@ -74,11 +75,17 @@ async def _create(story_id: str, context_hash: str, suggestion_type: SuggestionT
                     suggestion, figmentator, db=db, session=session
                 )
 
+            # Reassigning reprocesses the story, which changes its status
+            async with task_cache() as cache:
+                await story_status_cache.invalidate(suggestion.story_hash, cache=cache)
+
         if not figmentator:
             raise ProcessingError("Cannot not reassign figmentator")
 
         suggestion.status = SuggestionStatus.executing
         await suggestion.update(db)
+        async with task_cache() as cache:
+            await suggestion_cache.invalidate(suggestion.uuid, cache=cache)
 
         figmentate.delay(suggestion.dict(), figmentator.dict())
 
@@ -125,6 +132,8 @@ async def _figmentate(suggestion: Suggestion, figmentator: Figmentator):
 
                 success = True
                 await suggestion.update(db)
+                async with task_cache() as cache:
+                    await suggestion_cache.invalidate(suggestion.uuid, cache=cache)
                 if suggestion.status != SuggestionStatus.done:
                     # This indicates we received a partial result, so we need to queue
                     # up another task in order finish generating the suggestion.
@@ -147,7 +156,10 @@ async def _figmentate(suggestion: Suggestion, figmentator: Figmentator):
                     # entries from the database...
                     raise LookupError(f"Cannot find story for id={story_id}!")
                 success, figmentator = await figmentator_ops.preprocess(
-                    {"story_id": story_id, "story": story.story},
+                    {
+                        "story_id": story_id,
+                        "story": await storage_ops.load_story(story, db=db),
+                    },
                     figmentator,
                     session=session,
                 )
@@ -162,6 +174,8 @@ async def _figmentate(suggestion: Suggestion, figmentator: Figmentator):
                 )
                 suggestion.status = SuggestionStatus.failed
                 await suggestion.update(db)
+                async with task_cache() as cache:
+                    await suggestion_cache.invalidate(suggestion.uuid, cache=cache)
 
 
 @app.task(
@@ -23,12 +23,21 @@ from starlette.authentication import (
 from starlette.status import HTTP_303_SEE_OTHER, HTTP_403_FORBIDDEN
 
 from woolgatherer.errors import UnauthorizedError
+from woolgatherer.ops.api_keys import api_keys, constant_time_equals
 from woolgatherer.utils.settings import Settings
+from woolgatherer.utils.single_flight import SingleFlight
 from woolgatherer.utils.logging import get_logger
 
 
 logger = get_logger()
 
+# How long to cache the OIDC server metadata, including the keys used to verify tokens
+SERVER_METADATA_TTL = 60 * 60
+
+# How long to share the result of a token refresh with requests that still send the
+# previous refresh token, e.g. requests that were issued concurrently by the browser
+REFRESH_GRACE_PERIOD = 30
+
 
 OAUTH_CLIENT_ARGS: Dict[str, Any] = {"scope": "openid email profile roles"}
 if Settings.debug:
@@ -91,9 +100,22 @@ def keycloak_revoke_token_fix(url, headers, body):
     return url, headers, add_params_to_qs("", params)
 
 
+async def load_server_metadata() -> Dict[str, Any]:
+    """
+    Load the OIDC server metadata. The metadata is cached by authlib, but it never
+    expires, so force it to be reloaded once it is older than SERVER_METADATA_TTL.
+    """
+    metadata = oauth.storium.server_metadata
+    if time.time() - metadata.get("_loaded_at", 0) > SERVER_METADATA_TTL:
+        metadata.pop("_loaded_at", None)
+        metadata.pop("jwks", None)
+
+    return await oauth.storium.load_server_metadata()
+
+
 async def keycloak_revoke_token(refresh_token):
     """ Wrapper function to implement the revoke token for keycloak """
-    metadata = await oauth.storium.load_server_metadata()
+    metadata = await load_server_metadata()
     async with oauth.storium._get_oauth_client(  # pylint:disable=protected-access
         **metadata
     ) as client:
@@ -111,6 +133,43 @@ async def keycloak_revoke_token(refresh_token):
 oauth.storium.revoke_token = keycloak_revoke_token
 
 
+# Token refreshes are shared for a grace period after completing
+token_refreshes = SingleFlight(grace_period=REFRESH_GRACE_PERIOD)
+
+
+async def perform_token_refresh(
+    conn: HTTPConnection, refresh_token: str
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """ Refresh the token, returning the new refresh token and the user if successful """
+    metadata = await load_server_metadata()
+    async with oauth.storium._get_oauth_client(  # pylint:disable=protected-access
+        **metadata
+    ) as client:
+        try:
+            token = await client.refresh_token(
+                metadata["token_endpoint"], refresh_token
+            )
+            user = await oauth.storium.parse_id_token(conn, token)
+            return token.get("refresh_token"), dict(user)
+        except OAuthError as exc:
+            # The refresh token has likely expired
+            logger.error(exc)
+            return None
+
+
+async def single_flight_token_refresh(
+    conn: HTTPConnection, refresh_token: str
+) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """
+    Refresh the token, such that concurrent requests from the same session only
+    refresh once. Otherwise each request would make a round trip to the auth server,
+    and since refresh tokens are single use, all but the first refresh would fail.
+    """
+    return await token_refreshes.run(
+        refresh_token, lambda: perform_token_refresh(conn, refresh_token)
+    )
+
+
 async def validate_refresh_token(conn: HTTPConnection):
     """ Validate the refresh token """
     user = conn.session.get("user", {})
@@ -122,22 +181,10 @@ async def validate_refresh_token(conn: HTTPConnection):
         # The token is expired, try to refresh
         refresh_token = conn.session.get("refresh_token")
         if refresh_token:
-            metadata = await oauth.storium.load_server_metadata()
-            async with oauth.storium._get_oauth_client(  # pylint:disable=protected-access
-                **metadata
-            ) as client:
-                try:
-                    token = await client.refresh_token(
-                        metadata["token_endpoint"], refresh_token
-                    )
-                    conn.session["refresh_token"] = token.get("refresh_token")
-
-                    # Refresh was successful, set user session
-                    user = await oauth.storium.parse_id_token(conn, token)
-                    conn.session["user"] = dict(user)
-                except OAuthError as exc:
-                    # The refresh token has likely expired
-                    logger.error(exc)
+            refreshed = await single_flight_token_refresh(conn, refresh_token)
+            if refreshed:
+                # Refresh was successful, set user session
+                conn.session["refresh_token"], conn.session["user"] = refreshed
 
 
 def parse_scopes(conn: HTTPConnection):
@@ -179,30 +226,62 @@ class Requires:
             raise HTTPException(self.status_code)
 
 
-class TokenAuthBackend(AuthenticationBackend):
-    """ Backend that uses a shared token for authentication """
+def get_token(conn: HTTPConnection) -> Optional[str]:
+    """
+    Get the token from the request. It can be passed as a bearer token in the
+    Authorization header, in the X-API-Key header, or as the token query param.
+    """
+    scheme, _, token = conn.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token.strip()
+
+    return conn.headers.get("X-API-Key") or conn.query_params.get("token")
+
 
-    def __init__(self, token: Optional[SecretStr]):
+class TokenAuthBackend(AuthenticationBackend):
+    """
+    Backend that uses either a shared token or an api key for authentication. Requests
+    to the backend_paths are only ever authenticated by a token, so they skip the
+    session entirely, which avoids potentially refreshing the session's token with the
+    auth server.
+    """
+
+    def __init__(self, token: Optional[SecretStr], backend_paths: Sequence[str] = ()):
         self.token = token
+        self.backend_paths = tuple(backend_paths)
+
+    def authenticate_token(self, conn: HTTPConnection) -> Optional[str]:
+        """ Return the username associated with the token if it is valid """
+        if self.token is None:
+            return "backend"
+
+        token = get_token(conn)
+        if not token:
+            return None
+
+        if constant_time_equals(token, self.token.get_secret_value()):
+            return "backend"
+
+        return api_keys.lookup(token)
 
     async def authenticate(
         self, conn: HTTPConnection
     ) -> Tuple[AuthCredentials, BaseUser]:
-        """ Perform authentication using a shared token or oauth """
+        """ Perform authentication using a shared token, an api key, or oauth """
         roles: List[str] = []
+        username: Optional[str] = None
 
-        # See if there is a logged in user and what roles they have
-        await validate_refresh_token(conn)
-        roles.extend(parse_scopes(conn))
-        username = conn.session.get("user", {}).get("username")
+        if not conn.scope["path"].startswith(self.backend_paths):
+            # See if there is a logged in user and what roles they have
+            await validate_refresh_token(conn)
+            roles.extend(parse_scopes(conn))
+            username = conn.session.get("user", {}).get("username")
 
-        # See if the correct token has been passed as a query param
-        if (
-            self.token is None
-            or conn.query_params.get("token") == self.token.get_secret_value()
-        ):
+        # See if a valid token has been passed with the request
+        token_username = self.authenticate_token(conn)
+        if token_username:
             if not username:
-                username = "backend"
+                username = token_username
             roles.append("backend")
 
         credentials = AuthCredentials(roles)
@@ -0,0 +1,164 @@
+"""
+Cache configuration and helpers shared by the app and the task workers
+"""
+import json
+import urllib
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, Optional
+from uuid import UUID
+
+try:
+    from contextlib import asynccontextmanager  # type: ignore
+except ImportError:
+    from async_generator import asynccontextmanager
+
+import aiocache
+from aiocache import caches
+from aiocache.base import BaseCache
+from aiocache.serializers import BaseSerializer
+
+from woolgatherer.utils.settings import Settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class OrjsonSerializer(BaseSerializer):
+    """
+    Serialize cached values as JSON using orjson, falling back to the standard
+    library when it is not installed. It is both faster and more compact than
+    pickling, though values are limited to JSON types (tuples come back as lists).
+    """
+
+    # orjson encodes to bytes, so have the backend return the raw bytes
+    DEFAULT_ENCODING = None
+
+    @staticmethod
+    def default(o):
+        """ Serialize the types cached values commonly contain beyond plain JSON """
+        if isinstance(o, Enum):
+            return o.value
+
+        if isinstance(o, UUID):
+            return str(o)
+
+        if isinstance(o, Decimal):
+            return float(o)
+
+        if hasattr(o, "item"):
+            # numpy scalars, e.g. the correlations computed by scipy
+            return o.item()
+
+        if hasattr(o, "isoformat"):
+            return o.isoformat()
+
+        raise TypeError(f"Cannot serialize {type(o).__name__}")
+
+    def dumps(self, value):
+        """ Serialize the value """
+        if orjson:
+            return orjson.dumps(value, default=self.default)
+
+        return json.dumps(value, default=self.default, separators=(",", ":"))
+
+    def loads(self, value):
+        """ Deserialize the value """
+        if value is None:
+            return None
+
+        try:
+            return orjson.loads(value) if orjson else json.loads(value)
+        except ValueError:
+            # Treat values written by a previous serializer, i.e. pickle, as misses
+            return None
+
+
+def initialize_caches():
+    """ Initialize the cache """
+    url = urllib.parse.urlparse(Settings.cache_url)
+    cache_config: Dict[str, Any] = dict(urllib.parse.parse_qsl(url.query))
+    cache_class = aiocache.Cache.get_scheme_class(url.scheme)
+
+    if url.path:
+        cache_config.update(cache_class.parse_uri_path(url.path))
+
+    if url.hostname:
+        cache_config["endpoint"] = url.hostname
+
+    if url.port:
+        cache_config["port"] = str(url.port)
+
+    if url.password:
+        cache_config["password"] = url.password
+
+    if cache_class == aiocache.Cache.REDIS:
+        cache_config["cache"] = "woolgatherer.utils.tiered_cache.TieredRedisCache"
+        cache_config["serializer"] = {
+            "class": "woolgatherer.utils.cache.OrjsonSerializer"
+        }
+    elif cache_class == aiocache.Cache.MEMORY:
+        cache_config["cache"] = "aiocache.SimpleMemoryCache"
+        cache_config["serializer"] = {"class": "aiocache.serializers.NullSerializer"}
+
+    aiocache.caches.set_config({"default": cache_config})
+
+
+def is_shared(cache: BaseCache) -> bool:
+    """ Whether the cache is shared by all the processes, rather than in process """
+    return cache.NAME == "redis"
+
+
+@asynccontextmanager
+async def task_cache():
+    """
+    A cache for use within a task. Tasks are run on their own event loop, so they
+    cannot share the connection pool of the default cache.
+    """
+    cache = caches.create("default")
+    try:
+        yield cache
+    finally:
+        await cache.close()
+
+
+class ReadThroughCache:
+    """
+    A read-through cache for frequently polled state. Values are loaded on a miss and
+    cached for state_cache_ttl seconds, while whoever changes the state invalidates
+    it. The state is changed by the task workers, which cannot reach the in process
+    caches of the app, so the cache is only used when it is shared.
+    """
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+
+    def key(self, key: Any) -> str:
+        """ The cache key for the given key """
+        return f"{self.namespace}:{key}"
+
+    async def get(self, key: Any, load: Callable[[], Awaitable[Any]]) -> Any:
+        """ Get the cached value for the key, loading it on a miss """
+        cache = caches.get("default")
+        if not is_shared(cache):
+            return await load()
+
+        value = await cache.get(self.key(key))
+        if value is None:
+            value = await load()
+            if value is not None:
+                await cache.set(self.key(key), value, ttl=Settings.state_cache_ttl)
+
+        return value
+
+    async def invalidate(self, key: Any, *, cache: Optional[BaseCache] = None):
+        """ Invalidate the cached value for the key """
+        cache = cache or caches.get("default")
+        if is_shared(cache):
+            await cache.delete(self.key(key))
+
+
+story_status_cache = ReadThroughCache("story:status")
+suggestion_cache = ReadThroughCache("suggestion:json")
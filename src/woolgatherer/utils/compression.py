@@ -0,0 +1,394 @@
+"""
+Compression of responses. This replaces starlette's GZipMiddleware, adding support
+for negotiating brotli and zstd (when the optional dependencies are installed),
+per-path compression levels, buffering of streamed responses into larger blocks, and
+serving precompressed static files.
+"""
+import stat
+import zlib
+from typing import Dict, List, Optional, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from woolgatherer.utils.downloads import ZEROCOPY_EXTENSION
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# The compression profiles which can be assigned to a path
+PROFILES = ("none", "fast", "default", "best")
+
+# Content types which are already compressed, so compressing them again is a waste
+COMPRESSED_TYPES = (
+    "application/gzip",
+    "application/vnd.apache.parquet",
+    "application/x-7z-compressed",
+    "application/x-brotli",
+    "application/x-bzip2",
+    "application/x-gzip",
+    "application/x-xz",
+    "application/zip",
+    "application/zstd",
+    "image/gif",
+    "image/jpeg",
+    "image/png",
+    "image/webp",
+)
+
+
+class Encoder:
+    """ Incrementally compress a response body """
+
+    # The compression level to use for each profile
+    LEVELS: Dict[str, int] = {}
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress the data, which may be buffered by the compressor """
+        raise NotImplementedError()
+
+    def flush(self) -> bytes:
+        """ Flush the compressed data such that the client can decompress it """
+        raise NotImplementedError()
+
+    def finish(self) -> bytes:
+        """ Finish compressing """
+        raise NotImplementedError()
+
+
+class GZipEncoder(Encoder):
+    """ A gzip encoder """
+
+    LEVELS = {"fast": 1, "default": 6, "best": 9}
+
+    def __init__(self, profile: str):
+        self.compressor = zlib.compressobj(
+            self.LEVELS[profile], zlib.DEFLATED, 16 + zlib.MAX_WBITS
+        )
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress the data, which may be buffered by the compressor """
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """ Flush the compressed data such that the client can decompress it """
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """ Finish compressing """
+        return self.compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder(Encoder):
+    """ A brotli encoder """
+
+    LEVELS = {"fast": 1, "default": 4, "best": 11}
+
+    def __init__(self, profile: str):
+        self.compressor = brotli.Compressor(quality=self.LEVELS[profile])
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress the data, which may be buffered by the compressor """
+        return self.compressor.process(data)
+
+    def flush(self) -> bytes:
+        """ Flush the compressed data such that the client can decompress it """
+        return self.compressor.flush()
+
+    def finish(self) -> bytes:
+        """ Finish compressing """
+        return self.compressor.finish()
+
+
+class ZstdEncoder(Encoder):
+    """ A zstd encoder """
+
+    LEVELS = {"fast": 1, "default": 3, "best": 19}
+
+    def __init__(self, profile: str):
+        self.compressor = zstandard.ZstdCompressor(
+            level=self.LEVELS[profile]
+        ).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        """ Compress the data, which may be buffered by the compressor """
+        return self.compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """ Flush the compressed data such that the client can decompress it """
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        """ Finish compressing """
+        return self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+# The supported encoders in order of preference
+ENCODERS = {}
+if brotli:
+    ENCODERS["br"] = BrotliEncoder
+
+if zstandard:
+    ENCODERS["zstd"] = ZstdEncoder
+
+ENCODERS["gzip"] = GZipEncoder
+
+
+def accepted_encodings(
+    headers: Headers, encodings: Sequence[str] = tuple(ENCODERS)
+) -> List[str]:
+    """
+    Return the encodings the client accepts based on the Accept-Encoding header, from
+    most to least preferred. Encodings are ordered by their quality value, with ties
+    broken by the order of the given encodings.
+    """
+    qualities: Dict[str, float] = {}
+    for value in headers.get("Accept-Encoding", "").split(","):
+        encoding, *params = [part.strip() for part in value.lower().split(";")]
+        quality = 1.0
+        for param in params:
+            name, _, param_value = param.partition("=")
+            if name == "q":
+                try:
+                    quality = float(param_value)
+                except ValueError:
+                    quality = 0.0
+
+        if encoding:
+            qualities[encoding] = quality
+
+    default_quality = qualities.get("*", 0.0)
+    ranked = [
+        (-qualities.get(encoding, default_quality), idx, encoding)
+        for idx, encoding in enumerate(encodings)
+    ]
+    return [encoding for quality, _, encoding in sorted(ranked) if quality < 0]
+
+
+def negotiate_encoding(
+    headers: Headers, encodings: Sequence[str] = tuple(ENCODERS)
+) -> Optional[str]:
+    """ Select the encoding to use based on the Accept-Encoding header """
+    accepted = accepted_encodings(headers, encodings)
+    return accepted[0] if accepted else None
+
+
+class CompressionMiddleware:
+    """
+    Compress responses using the best encoding the client accepts. Each path prefix
+    can be assigned a compression profile, e.g. to use fast compression for large
+    exports, or to disable compression for downloads. Streamed responses are buffered
+    into blocks of block_size before being compressed and flushed to the client.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        block_size: int = 64 * 1024,
+        profiles: Dict[str, str] = None,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.block_size = block_size
+
+        # Sort by length such that the longest matching prefix is found first
+        self.profiles = sorted(
+            (profiles or {}).items(), key=lambda item: len(item[0]), reverse=True
+        )
+        for _, profile in self.profiles:
+            assert profile in PROFILES, f"Unknown compression profile: {profile}"
+
+    def get_profile(self, path: str) -> str:
+        """ Get the compression profile for the path """
+        for prefix, profile in self.profiles:
+            if path.startswith(prefix):
+                return profile
+
+        return "default"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http":
+            profile = self.get_profile(scope["path"])
+            encoding = negotiate_encoding(Headers(scope=scope))
+            if encoding and profile != "none":
+                responder = CompressionResponder(
+                    self.app,
+                    encoding,
+                    profile,
+                    minimum_size=self.minimum_size,
+                    block_size=self.block_size,
+                )
+                await responder(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class CompressionResponder:
+    """ Compress a single response """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        encoding: str,
+        profile: str,
+        *,
+        minimum_size: int,
+        block_size: int,
+    ):
+        self.app = app
+        self.encoding = encoding
+        self.profile = profile
+        self.minimum_size = minimum_size
+        self.block_size = block_size
+
+        self.send: Send
+        self.encoder: Optional[Encoder] = None
+        self.initial_message: Message = {}
+        self.started = False
+        self.passthrough = False
+        self.buffer: List[bytes] = []
+        self.buffer_size = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_compressed)
+
+    def should_compress(self) -> bool:
+        """ Whether the response should be compressed based on its headers """
+        headers = Headers(raw=self.initial_message["headers"])
+        if "content-encoding" in headers:
+            # Do not compress responses that are already encoded, e.g. precompressed
+            # static files
+            return False
+
+        if "accept-ranges" in headers:
+            # Byte ranges refer to the unencoded file, so compressing a response which
+            # offers them would break resuming the download
+            return False
+
+        content_type = headers.get("content-type", "").split(";")[0].strip()
+        return content_type not in COMPRESSED_TYPES
+
+    def start_compression(self, body: bytes, more_body: bool) -> bytes:
+        """ Update the headers to denote the response is compressed """
+        self.encoder = ENCODERS[self.encoding](self.profile)
+
+        headers = MutableHeaders(raw=self.initial_message["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if more_body:
+            del headers["Content-Length"]
+            return self.buffer_body(body, more_body)
+
+        body = self.encoder.compress(body) + self.encoder.finish()
+        headers["Content-Length"] = str(len(body))
+        return body
+
+    def buffer_body(self, body: bytes, more_body: bool) -> bytes:
+        """
+        Buffer the body of a streamed response. Once a full block is buffered (or the
+        response is complete), the block is compressed and flushed.
+        """
+        assert self.encoder
+        if body:
+            self.buffer.append(body)
+            self.buffer_size += len(body)
+
+        if more_body and self.buffer_size < self.block_size:
+            return b""
+
+        data = b"".join(self.buffer)
+        self.buffer = []
+        self.buffer_size = 0
+
+        compressed = self.encoder.compress(data)
+        if more_body:
+            return compressed + self.encoder.flush()
+
+        return compressed + self.encoder.finish()
+
+    async def send_compressed(self, message: Message) -> None:
+        """ Compress the response before sending it """
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            # Don't send the initial message until we've determined how to modify the
+            # outgoing headers correctly
+            self.initial_message = message
+        elif message_type == "http.response.body" and not self.started:
+            self.started = True
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if not self.should_compress() or (
+                len(body) < self.minimum_size and not more_body
+            ):
+                self.passthrough = True
+                await self.send(self.initial_message)
+                await self.send(message)
+                return
+
+            message["body"] = self.start_compression(body, more_body)
+            await self.send(self.initial_message)
+            if message["body"] or not more_body:
+                await self.send(message)
+        elif message_type == ZEROCOPY_EXTENSION and not self.started:
+            # Files sent with sendfile are never compressed
+            self.started = self.passthrough = True
+            await self.send(self.initial_message)
+            await self.send(message)
+        elif message_type == "http.response.body" and not self.passthrough:
+            more_body = message.get("more_body", False)
+            message["body"] = self.buffer_body(message.get("body", b""), more_body)
+            if message["body"] or not more_body:
+                await self.send(message)
+        else:
+            await self.send(message)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Serve static files, preferring precompressed variants of a file (e.g. app.js.br or
+    app.js.gz alongside app.js) when the client accepts the encoding. This avoids
+    compressing the same static files on every request.
+    """
+
+    # The file extension of the precompressed variants in order of preference
+    EXTENSIONS = {"br": ".br", "zstd": ".zst", "gzip": ".gz"}
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """ Override the original get response to serve precompressed files """
+        response = await super().get_response(path, scope)
+        if not isinstance(response, FileResponse) or response.status_code != 200:
+            return response
+
+        request_headers = Headers(scope=scope)
+        response.headers.add_vary_header("Accept-Encoding")
+        for encoding in accepted_encodings(request_headers, tuple(self.EXTENSIONS)):
+            full_path, stat_result = await self.lookup_path(
+                path + self.EXTENSIONS[encoding]
+            )
+            if stat_result and stat.S_ISREG(stat_result.st_mode):
+                compressed_response = FileResponse(
+                    full_path,
+                    headers={"Content-Encoding": encoding, "Vary": "Accept-Encoding"},
+                    media_type=response.media_type,
+                    stat_result=stat_result,
+                    method=scope["method"],
+                )
+                if self.is_not_modified(compressed_response.headers, request_headers):
+                    return NotModifiedResponse(compressed_response.headers)
+
+                return compressed_response
+
+        return response
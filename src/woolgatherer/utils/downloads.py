@@ -0,0 +1,258 @@
+"""
+File downloads which support conditional and byte range requests, such that clients can
+cache large downloads and resume them after an interruption. Files are sent with
+sendfile when the server supports the ASGI zero copy send extension.
+"""
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.status import (
+    HTTP_404_NOT_FOUND,
+    HTTP_412_PRECONDITION_FAILED,
+    HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+)
+from starlette.types import Receive, Scope, Send
+
+
+# The ASGI extension for sending files with sendfile
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+# Media types for compressed files, which mimetypes reports as an encoding of another
+# type (e.g. a .tar.gz is a gzip encoded tar), and for files mimetypes does not know
+MEDIA_TYPES = {
+    "gzip": "application/gzip",
+    "bzip2": "application/x-bzip2",
+    "xz": "application/x-xz",
+    "br": "application/x-brotli",
+    ".parquet": "application/vnd.apache.parquet",
+    ".jsonl": "application/x-ndjson",
+    ".zst": "application/zstd",
+}
+
+
+def download_media_type(filename: str) -> str:
+    """ The media type of a file, treating compressed files as their compression """
+    media_type, encoding = mimetypes.guess_type(filename)
+    if encoding:
+        return MEDIA_TYPES.get(encoding, "application/octet-stream")
+
+    extension = os.path.splitext(filename)[1]
+    return media_type or MEDIA_TYPES.get(extension, "application/octet-stream")
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse the Range header into an inclusive (start, end) byte range. Returns None if
+    the header should be ignored, i.e. it is malformed or requests multiple ranges, and
+    raises ValueError if the range cannot be satisfied.
+    """
+    units, _, byte_range = header.partition("=")
+    if units.strip().lower() != "bytes" or "," in byte_range:
+        return None
+
+    start, _, end = byte_range.strip().partition("-")
+    if not start:
+        # A suffix range, e.g. bytes=-500 are the final 500 bytes
+        if not end.isdigit():
+            return None
+
+        suffix = int(end)
+        if not suffix or not size:
+            raise ValueError("Empty suffix range")
+
+        return max(size - suffix, 0), size - 1
+
+    if not start.isdigit() or (end and not end.isdigit()):
+        return None
+
+    first = int(start)
+    if first >= size:
+        raise ValueError("Range starts after the end of the file")
+
+    last = min(int(end), size - 1) if end else size - 1
+    if first > last:
+        return None
+
+    return first, last
+
+
+def etag_matches(header: str, etag: str, weak: bool = True) -> bool:
+    """ Whether the etag matches any in the header, e.g. If-None-Match """
+    if header.strip() == "*":
+        return True
+
+    for value in header.split(","):
+        value = value.strip()
+        if value.startswith("W/"):
+            if not weak:
+                continue
+            value = value[2:]
+
+        if value == etag:
+            return True
+
+    return False
+
+
+def precondition_failed(response_headers: Headers, request_headers: Headers) -> bool:
+    """ Whether the file changed since the client's copy, so a 412 must be returned """
+    if "if-match" in request_headers:
+        # If-Match takes precedence over If-Unmodified-Since
+        return not etag_matches(
+            request_headers["if-match"], response_headers["etag"], weak=False
+        )
+
+    try:
+        unmodified_since = parsedate_to_datetime(request_headers["if-unmodified-since"])
+        last_modified = parsedate_to_datetime(response_headers["last-modified"])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    return last_modified > unmodified_since
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """ Whether the client's cached copy is current, so a 304 can be returned """
+    if "if-none-match" in request_headers:
+        # If-None-Match takes precedence over If-Modified-Since
+        return etag_matches(request_headers["if-none-match"], response_headers["etag"])
+
+    try:
+        modified_since = parsedate_to_datetime(request_headers["if-modified-since"])
+        last_modified = parsedate_to_datetime(response_headers["last-modified"])
+    except (KeyError, TypeError, ValueError):
+        return False
+
+    return last_modified <= modified_since
+
+
+def range_applies(response_headers: Headers, request_headers: Headers) -> bool:
+    """ Whether the If-Range precondition allows serving a range """
+    if_range = request_headers.get("if-range")
+    if if_range is None:
+        return True
+
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return etag_matches(if_range, response_headers["etag"], weak=False)
+
+    return if_range == response_headers["last-modified"]
+
+
+class DownloadResponse(FileResponse):
+    """ A file response which can send a byte range of the file """
+
+    chunk_size = 256 * 1024
+
+    def __init__(self, path: str, stat_result: os.stat_result, **kwargs):
+        self.offset = 0
+        self.count = stat_result.st_size
+        super().__init__(path, stat_result=stat_result, **kwargs)
+
+    def set_stat_headers(self, stat_result: os.stat_result) -> None:
+        """ Set the headers derived from the file, quoting the etag """
+        etag_base = f"{stat_result.st_mtime}-{stat_result.st_size}"
+        etag = hashlib.md5(etag_base.encode()).hexdigest()
+
+        self.headers.setdefault("content-length", str(stat_result.st_size))
+        self.headers.setdefault(
+            "last-modified", formatdate(stat_result.st_mtime, usegmt=True)
+        )
+        self.headers.setdefault("etag", f'"{etag}"')
+        self.headers.setdefault("accept-ranges", "bytes")
+
+    def set_range(self, start: int, end: int):
+        """ Only send the inclusive byte range of the file """
+        self.offset = start
+        self.count = end - start + 1
+        self.status_code = 206
+        self.headers["content-length"] = str(self.count)
+        size = self.stat_result.st_size
+        self.headers["content-range"] = f"bytes {start}-{end}/{size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if self.send_header_only or not self.count:
+            await send({"type": "http.response.body"})
+        elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": self.offset,
+                        "count": self.count,
+                    }
+                )
+        else:
+            async with aiofiles.open(self.path, mode="rb") as file:
+                await file.seek(self.offset)
+                remaining = self.count
+                while remaining:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    remaining = remaining - len(chunk) if chunk else 0
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": bool(remaining),
+                        }
+                    )
+
+        if self.background is not None:
+            await self.background()
+
+
+async def download_file(
+    request: Request, path: str, filename: str, media_type: Optional[str] = None
+) -> Response:
+    """
+    Respond with the file, honoring conditional (If-Match, If-Unmodified-Since,
+    If-None-Match, If-Modified-Since) and byte range (Range, If-Range) requests
+    """
+    try:
+        stat_result = await aiofiles.os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(HTTP_404_NOT_FOUND, f"Cannot find {filename}")
+
+    response = DownloadResponse(
+        path,
+        stat_result,
+        filename=filename,
+        media_type=media_type or download_media_type(filename),
+        method=request.method,
+    )
+    if precondition_failed(response.headers, request.headers):
+        return Response(status_code=HTTP_412_PRECONDITION_FAILED)
+
+    if is_not_modified(response.headers, request.headers):
+        return NotModifiedResponse(response.headers)
+
+    if "range" in request.headers and range_applies(response.headers, request.headers):
+        try:
+            byte_range = parse_range(request.headers["range"], stat_result.st_size)
+        except ValueError:
+            return Response(
+                status_code=HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={"content-range": f"bytes */{stat_result.st_size}"},
+            )
+
+        if byte_range:
+            response.set_range(*byte_range)
+
+    return response
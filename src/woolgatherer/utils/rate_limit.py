@@ -0,0 +1,95 @@
+"""
+Rate limiting using token buckets. When the cache is backed by redis the buckets are
+shared by all the workers, otherwise each process keeps its own buckets.
+"""
+import time
+from typing import Dict, Tuple
+
+from aiocache import caches
+
+from woolgatherer.errors import RateLimitError
+
+
+# The number of in process buckets to hold before pruning idle buckets
+MAX_LOCAL_BUCKETS = 10000
+
+# Atomically refill the bucket based on the elapsed time, then try to take a token.
+# Returns whether a token was taken and, if not, how long until one is available.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'timestamp', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+class TokenBucket:
+    """
+    A token bucket rate limiter. Each key has a bucket which holds up to capacity
+    tokens and refills at rate tokens per second. Each request takes a token.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.buckets: Dict[str, Tuple[float, float]] = {}
+
+    def take_local(self, key: str, now: float) -> Tuple[bool, float]:
+        """ Try to take a token from the in process bucket """
+        if len(self.buckets) > MAX_LOCAL_BUCKETS:
+            # Buckets that have been idle long enough to refill are the same as new ones
+            idle = now - self.capacity / self.rate
+            self.buckets = {k: v for k, v in self.buckets.items() if v[1] > idle}
+
+        tokens, timestamp = self.buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + max(0, now - timestamp) * self.rate)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return True, 0
+
+        self.buckets[key] = (tokens, now)
+        return False, (1 - tokens) / self.rate
+
+    async def take(self, key: str) -> Tuple[bool, float]:
+        """
+        Try to take a token from the bucket for the key. Returns whether a token was
+        taken, and if not, how many seconds until a token will be available.
+        """
+        now = time.time()
+        cache = caches.get("default")
+        if cache.NAME != "redis":
+            return self.take_local(key, now)
+
+        allowed, retry_after = await cache.raw(
+            "eval",
+            TOKEN_BUCKET_SCRIPT,
+            [f"rate_limit:{self.name}:{key}"],
+            [self.capacity, self.rate, now],
+        )
+        return bool(allowed), float(retry_after)
+
+    async def acquire(self, key: str):
+        """ Take a token from the bucket for the key, or raise a RateLimitError """
+        allowed, retry_after = await self.take(key)
+        if not allowed:
+            raise RateLimitError(
+                f"Too many {self.name} requests", retry_after=retry_after
+            )
@@ -1,33 +1,275 @@
 """
 Utilities useful for routing
 """
-import gzip
 import zlib
-from typing import Callable
+from typing import Callable, Dict, List, Type
 
+from fastapi import HTTPException
 from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
 from starlette.requests import Request
 from starlette.responses import Response
+from starlette.status import (
+    HTTP_400_BAD_REQUEST,
+    HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+)
+
+from woolgatherer.utils.settings import Settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class BodyTooLargeError(Exception):
+    """ Raised when the decompressed body exceeds the maximum allowed size """
+
+
+class Decoder:
+    """
+    Incrementally decode a compressed body. At most max_size bytes are produced, which
+    guards against decompression bombs.
+    """
+
+    def __init__(self, max_size: int):
+        self.remaining = max_size
+
+    def _consume(self, data: bytes) -> bytes:
+        """ Account for the decompressed data """
+        self.remaining -= len(data)
+        if self.remaining < 0:
+            raise BodyTooLargeError()
+
+        return data
+
+    def decompress(self, data: bytes) -> bytes:
+        """ Decompress the next chunk of data """
+        raise NotImplementedError()
+
+    def flush(self) -> bytes:
+        """ Return any remaining decompressed data """
+        return b""
+
+
+class ZlibDecoder(Decoder):
+    """ A decoder for gzip and deflate encoded bodies """
+
+    def __init__(self, max_size: int, wbits: int):
+        super().__init__(max_size)
+        self.wbits = wbits
+        self.decompressor = zlib.decompressobj(wbits)
+
+    def decompress(self, data: bytes) -> bytes:
+        """ Decompress the next chunk of data """
+        output: List[bytes] = []
+        while data:
+            # Limit the output to one more byte than allowed, such that it is not
+            # possible to decompress more than the max size into memory
+            output.append(
+                self._consume(self.decompressor.decompress(data, self.remaining + 1))
+            )
+            if self.decompressor.eof:
+                # A gzip body can contain multiple members, each of which needs a new
+                # decompressor
+                data = self.decompressor.unused_data
+                if data:
+                    self.decompressor = zlib.decompressobj(self.wbits)
+            else:
+                data = self.decompressor.unconsumed_tail
+
+        return b"".join(output)
+
+    def flush(self) -> bytes:
+        """ Return any remaining decompressed data """
+        if not self.decompressor.eof:
+            raise zlib.error("Incomplete compressed data")
+
+        return self._consume(self.decompressor.flush())
+
+
+class BrotliDecoder(Decoder):
+    """ A decoder for brotli encoded bodies """
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> bytes:
+        """ Decompress the next chunk of data """
+        # Limit the output to one more byte than allowed, such that it is not possible
+        # to decompress more than the max size into memory. Once the limit is reached,
+        # the rest of the input is buffered by the decompressor, so keep draining it.
+        output = [
+            self._consume(
+                self.decompressor.process(data, output_buffer_limit=self.remaining + 1)
+            )
+        ]
+        while not self.decompressor.can_accept_more_data():
+            output.append(
+                self._consume(
+                    self.decompressor.process(
+                        b"", output_buffer_limit=self.remaining + 1
+                    )
+                )
+            )
+
+        return b"".join(output)
+
+    def flush(self) -> bytes:
+        """ Return any remaining decompressed data """
+        if not self.decompressor.is_finished():
+            raise brotli.error("Incomplete compressed data")
+
+        return b""
+
+
+class ZstdDecoder(Decoder):
+    """ A decoder for zstd encoded bodies """
+
+    # A zstd block decompresses to at most 128KiB, but takes at least 4 bytes to
+    # encode, which bounds how much a slice of the input can decompress to
+    MAX_RATIO = 128 * 1024 // 4
+
+    # The smallest slice of input to decompress at once, which bounds how far past the
+    # max size the output can grow to 2MiB
+    MIN_SLICE_SIZE = 64
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.decompressor = zstandard.ZstdDecompressor().decompressobj()
+
+    def decompress(self, data: bytes) -> bytes:
+        """ Decompress the next chunk of data """
+        if not data:
+            # The decompressor cannot be used again after reaching the end of a frame
+            return b""
+
+        # The decompressor does not support limiting its output, so instead feed it
+        # slices of the input which cannot decompress to much more than the max size
+        output: List[bytes] = []
+        view = memoryview(data)
+        while view:
+            slice_size = max(self.remaining // self.MAX_RATIO, self.MIN_SLICE_SIZE)
+            output.append(
+                self._consume(self.decompressor.decompress(view[:slice_size]))
+            )
+            view = view[slice_size:]
+
+        return b"".join(output)
+
+
+DECODERS: Dict[str, Callable[[int], Decoder]] = {
+    "gzip": lambda max_size: ZlibDecoder(max_size, 16 + zlib.MAX_WBITS),
+    "x-gzip": lambda max_size: ZlibDecoder(max_size, 16 + zlib.MAX_WBITS),
+    "deflate": lambda max_size: ZlibDecoder(max_size, zlib.MAX_WBITS),
+}
+if brotli:
+    DECODERS["br"] = BrotliDecoder
+
+if zstandard:
+    DECODERS["zstd"] = ZstdDecoder
+
+# The errors that can be raised while decoding a malformed body
+DECODE_ERRORS: List[Type[Exception]] = [zlib.error]
+if brotli:
+    DECODE_ERRORS.append(brotli.error)
+
+if zstandard:
+    DECODE_ERRORS.append(zstandard.ZstdError)
 
 
 class CompressedRequest(Request):
-    """ Allow the body of the request to be compressed with gzip or zlib """
+    """
+    Allow the body of the request to be compressed with gzip, zlib, and if the
+    optional dependencies are installed brotli or zstd. The body is decompressed as it
+    is received, so the full compressed body is never held in memory.
+    """
+
+    def decoders(self) -> List[Decoder]:
+        """ Get the decoders needed to decode the body, in the order to apply them """
+        encodings = [
+            encoding.strip().lower()
+            for header in self.headers.getlist("Content-Encoding")
+            for encoding in header.split(",")
+        ]
+
+        decoders = []
+        for encoding in reversed(encodings):
+            if encoding == "identity":
+                continue
+
+            if encoding not in DECODERS:
+                raise HTTPException(
+                    HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                    detail=f"Unsupported Content-Encoding: {encoding}",
+                )
+
+            decoders.append(DECODERS[encoding](Settings.max_body_size))
+
+        return decoders
+
+    @staticmethod
+    def decode(decoders: List[Decoder], data: bytes, final: bool = False) -> bytes:
+        """ Pass the data through each of the decoders """
+        for decoder in decoders:
+            data = decoder.decompress(data)
+            if final:
+                data += decoder.flush()
+
+        return data
 
     async def body(self) -> bytes:
         """ Override the original body method """
         if not hasattr(self, "_body"):
-            body = await super().body()
-            if "gzip" in self.headers.getlist("Content-Encoding"):
-                body = gzip.decompress(body)
-            elif "deflate" in self.headers.getlist("Content-Encoding"):
-                body = zlib.decompress(body)
-            setattr(self, "_body", body)
+            decoders = self.decoders()
+            content_length = int(self.headers.get("Content-Length", 0))
+
+            try:
+                size = 0
+                received = 0
+                chunks: List[bytes] = []
+                async for chunk in self.stream():
+                    final = not chunk
+                    if decoders:
+                        # Chunked uploads do not have a Content-Length, so also count
+                        # the bytes actually received when deciding to use a thread
+                        received += len(chunk)
+                        compressed_size = max(content_length, received)
+                        if compressed_size > Settings.max_inline_decode_size:
+                            chunk = await run_in_threadpool(
+                                self.decode, decoders, chunk, final
+                            )
+                        else:
+                            chunk = self.decode(decoders, chunk, final)
+
+                    size += len(chunk)
+                    if size > Settings.max_body_size:
+                        raise BodyTooLargeError()
+
+                    chunks.append(chunk)
+            except BodyTooLargeError:
+                raise HTTPException(
+                    HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail="Request body too large"
+                )
+            except tuple(DECODE_ERRORS):
+                raise HTTPException(
+                    HTTP_400_BAD_REQUEST, detail="Invalid compressed request body"
+                )
+
+            setattr(self, "_body", b"".join(chunks))
 
         return self._body
 
 
 class CompressibleRoute(APIRoute):
-    """ An APIRoute which supports gzip/zlib compressed body """
+    """ An APIRoute which supports compressed request bodies """
 
     def get_route_handler(self) -> Callable:
         """ Override the original get route handler to return out custom handler """
@@ -22,6 +22,11 @@ class _DevSettings(BaseSettings):
     )
 
     access_token: Optional[SecretStr] = Field(None, description="API access token")
+    api_key_refresh_interval: int = Field(
+        60,
+        description="How often (in seconds) to reload the api keys from the db and "
+        "record their request counts",
+    )
     session_token: SecretStr = Field("secret", description="Session cookie token")
 
     dataset: str = Field(None, description="Filename for the dataset")
@@ -31,6 +36,11 @@ class _DevSettings(BaseSettings):
     oauth_client_secret: str = Field(None, description="The oauth client secret")
 
     cache_url: str = Field("memory://", description="The URL for the cache")
+    state_cache_ttl: int = Field(
+        10,
+        description="How long (in seconds) to cache frequently polled state, like the "
+        "status of a story, when the cache is shared",
+    )
     broker_url: str = Field(
         "sqla+sqlite:///task_queue.db", description="The URL for the task broker"
     )
@@ -38,6 +48,36 @@ class _DevSettings(BaseSettings):
         "sqlite:///woolgatherer.db", description="The URL for the DB connection"
     )
 
+    story_cleanup_interval: int = Field(
+        5 * 60, description="How often (in seconds) to cleanup superseded stories"
+    )
+    story_cleanup_batch_size: int = Field(
+        50,
+        description="How many superseded stories to delete per transaction when "
+        "cleaning up stories",
+    )
+
+    max_body_size: int = Field(
+        64 * 2 ** 20, description="Maximum size of a (decompressed) request body"
+    )
+    max_inline_decode_size: int = Field(
+        2 ** 20,
+        description="Compressed request bodies larger than this are decompressed "
+        "in a thread, rather than blocking the event loop",
+    )
+
+    suggestion_rate: float = Field(
+        1.0, description="Suggestions per second each client can sustainably create"
+    )
+    suggestion_burst: int = Field(
+        20, description="Suggestions each client can create in a burst"
+    )
+    max_pending_suggestions: int = Field(
+        200,
+        description="Stop accepting suggestion requests when this many suggestions "
+        "are pending (a negative value disables the limit)",
+    )
+
     trusted_hosts: str = Field(
         "127.0.0.1",
         env="FORWARDED_ALLOW_IPS",
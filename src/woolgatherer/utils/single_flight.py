@@ -0,0 +1,50 @@
+"""
+Coalesce concurrent calls for the same key into a single call
+"""
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """
+    Ensure only one call for a given key is in flight at a time. Concurrent callers for
+    the same key wait for, and share, the result of the call already in flight. The
+    result can optionally continue to be shared for a grace period after the call
+    completes. Failed or cancelled calls are never shared after they complete, so the
+    next caller retries.
+
+    The call runs as its own task in a fresh context, rather than as part of whichever
+    caller started it. Cancelling a caller therefore does not cancel the call, and the
+    call gets its own db connection, so it never shares a request's transaction which
+    might yet be rolled back.
+    """
+
+    def __init__(self, grace_period: float = 0):
+        self.grace_period = grace_period
+        self.calls: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """ Run the call unless a call for the same key is already in flight """
+        future = self.calls.get(key)
+        if future is None:
+            future = self.calls[key] = contextvars.Context().run(
+                asyncio.ensure_future, call()
+            )
+            future.add_done_callback(lambda done: self.completed(key, done))
+
+        return await asyncio.shield(future)
+
+    def completed(self, key: Hashable, future: "asyncio.Future[Any]"):
+        """ Stop sharing the result of the call, unless it has a grace period """
+        if future.cancelled() or future.exception() or not self.grace_period:
+            self.forget(key, future)
+        else:
+            asyncio.get_event_loop().call_later(
+                self.grace_period, self.forget, key, future
+            )
+
+    def forget(self, key: Hashable, future: "asyncio.Future[Any]"):
+        """ Stop sharing the result of the call """
+        if self.calls.get(key) is future:
+            del self.calls[key]
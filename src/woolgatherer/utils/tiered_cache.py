@@ -0,0 +1,272 @@
+"""
+A two-tier cache: a small in process LRU cache in front of redis. Reads which hit the
+in process tier avoid the round-trip to redis. Every write to redis publishes the keys
+it touched, so each process can evict its stale copies. This module requires the redis
+extra.
+"""
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, List, Optional, Tuple
+
+import aioredis
+from aiocache import RedisCache
+from aiocache.backends.redis import conn
+
+from woolgatherer.utils.logging import get_logger
+
+
+logger = get_logger()
+
+# The pub/sub channel on which writes announce the keys they touched
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+# Announced on the invalidation channel when the whole cache is cleared
+CLEAR_ALL = "*"
+
+# How long (in seconds) to wait before resubscribing after losing the subscription
+RESUBSCRIBE_DELAY = 5.0
+
+
+class LocalCache:
+    """ A bounded LRU cache whose entries expire after a time to live """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        """ Get the value for the key, or None if it is missing or expired """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires, value = entry
+        if time.monotonic() >= expires:
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """
+        Set the value for the key, evicting the least recently used entry. The entry
+        expires after ttl seconds if it is shorter than the time to live of the cache.
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def discard(self, keys: Iterable[str]):
+        """ Remove the keys from the cache """
+        for key in keys:
+            if key == CLEAR_ALL:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        """ Remove all the entries """
+        self.entries.clear()
+
+
+def remaining_ttl(pttl: int) -> Optional[float]:
+    """ Convert the result of the redis PTTL command to seconds, if the key expires """
+    return pttl / 1000 if pttl >= 0 else None
+
+
+class TieredRedisCache(RedisCache):
+    """
+    A redis cache with an in process tier. The in process tier holds the serialized
+    values, such that each read deserializes its own copy of the value.
+
+    The in process tier is only used while subscribed to the invalidation channel,
+    otherwise there is no way to learn of writes from other processes. Pub/sub does not
+    guarantee delivery, so the in process tier is cleared whenever the subscription is
+    lost, and its entries expire after local_ttl seconds regardless. Entries also never
+    outlive the value in redis, so when an invalidation is missed, the time to live of
+    the value still bounds how stale it can be.
+
+    Rather than each write making a round-trip to publish the keys it touched, the
+    keys are published in the background, batching those of concurrent writes.
+    """
+
+    def __init__(self, local_max_size: int = 1024, local_ttl: float = 60, **kwargs):
+        super().__init__(**kwargs)
+        self.local = LocalCache(int(local_max_size), float(local_ttl))
+        self.subscribed = False
+        self.generation = 0
+        self.listener: Optional[asyncio.Future] = None
+        self.resubscribe_at = 0.0
+        self.unpublished: List[str] = []
+        self.publisher: Optional[asyncio.Future] = None
+
+    def __repr__(self):  # pragma: no cover
+        return "TieredRedisCache ({}:{})".format(self.endpoint, self.port)
+
+    def start_listener(self):
+        """ Subscribe to the invalidation channel in the background if needed """
+        if self.listener and not self.listener.done():
+            return
+
+        if time.monotonic() >= self.resubscribe_at:
+            self.resubscribe_at = time.monotonic() + RESUBSCRIBE_DELAY
+            self.listener = asyncio.ensure_future(self.listen())
+
+    async def listen(self):
+        """ Evict the keys announced on the invalidation channel """
+        try:
+            redis = await aioredis.create_redis(
+                (self.endpoint, self.port), db=self.db, password=self.password
+            )
+        except (OSError, aioredis.RedisError):
+            logger.warning("Unable to subscribe to cache invalidations")
+            return
+
+        try:
+            (channel,) = await redis.subscribe(INVALIDATION_CHANNEL)
+            self.subscribed = True
+            async for message in channel.iter():
+                self.invalidate_local(json.loads(message))
+        except (OSError, aioredis.RedisError):
+            logger.warning("Lost the subscription to cache invalidations")
+        finally:
+            self.subscribed = False
+            self.local.clear()
+            redis.close()
+            await redis.wait_closed()
+
+    def invalidate_local(self, keys: List[str]):
+        """ Evict the keys from the in process tier """
+        # Reads which were in flight may have raced the write, so they must not
+        # populate the in process tier with what could now be a stale value
+        self.generation += 1
+        self.local.discard(keys)
+
+    def publish(self, keys: List[str]):
+        """ Announce the keys which were written to every process """
+        self.invalidate_local(keys)
+        self.unpublished.extend(keys)
+        if not self.publisher or self.publisher.done():
+            self.publisher = asyncio.ensure_future(self.publish_unpublished())
+
+    async def publish_unpublished(self):
+        """ Publish the keys written since the last publish in a single message """
+        # Yield to allow concurrent writes to add their keys to the batch
+        await asyncio.sleep(0)
+        while self.unpublished:
+            keys, self.unpublished = self.unpublished, []
+            try:
+                await self._raw("publish", INVALIDATION_CHANNEL, json.dumps(keys))
+            except (OSError, aioredis.RedisError):
+                logger.warning("Unable to publish cache invalidations")
+
+    async def _get(self, key, encoding="utf-8", _conn=None):
+        """ Get the serialized value, preferring the in process tier """
+        self.start_listener()
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        generation = self.generation
+        value, pttl = await self._get_with_ttl(key, encoding=encoding, _conn=_conn)
+        if value is not None and self.subscribed and generation == self.generation:
+            self.local.set(key, value, remaining_ttl(pttl))
+
+        return value
+
+    async def _multi_get(self, keys, encoding="utf-8", _conn=None):
+        """ Get the serialized values, only fetching those missing locally """
+        self.start_listener()
+        values = [self.local.get(key) for key in keys]
+        missing = [idx for idx, value in enumerate(values) if value is None]
+        if not missing:
+            return values
+
+        generation = self.generation
+        fetched, pttls = await self._multi_get_with_ttl(
+            [keys[idx] for idx in missing], encoding=encoding, _conn=_conn
+        )
+        cacheable = self.subscribed and generation == self.generation
+        for idx, value, pttl in zip(missing, fetched, pttls):
+            values[idx] = value
+            if value is not None and cacheable:
+                self.local.set(keys[idx], value, remaining_ttl(pttl))
+
+        return values
+
+    @conn
+    async def _get_with_ttl(self, key, encoding="utf-8", _conn=None) -> Tuple[Any, int]:
+        """ Get the value along with its time to live, in a single round-trip """
+        transaction = _conn.multi_exec()
+        value = transaction.get(key, encoding=encoding)
+        pttl = transaction.pttl(key)
+        await transaction.execute()
+
+        return await value, await pttl
+
+    @conn
+    async def _multi_get_with_ttl(
+        self, keys, encoding="utf-8", _conn=None
+    ) -> Tuple[List[Any], List[int]]:
+        """ Get the values along with their time to live, in a single round-trip """
+        transaction = _conn.multi_exec()
+        values = transaction.mget(*keys, encoding=encoding)
+        pttls = [transaction.pttl(key) for key in keys]
+        await transaction.execute()
+
+        return await values, [await pttl for pttl in pttls]
+
+    async def _set(self, key, value, ttl=None, _cas_token=None, _conn=None):
+        result = await super()._set(
+            key, value, ttl=ttl, _cas_token=_cas_token, _conn=_conn
+        )
+        self.publish([key])
+        return result
+
+    async def _multi_set(self, pairs, ttl=None, _conn=None):
+        result = await super()._multi_set(pairs, ttl=ttl, _conn=_conn)
+        self.publish([key for key, _ in pairs])
+        return result
+
+    async def _add(self, key, value, ttl=None, _conn=None):
+        result = await super()._add(key, value, ttl=ttl, _conn=_conn)
+        self.publish([key])
+        return result
+
+    async def _increment(self, key, delta, _conn=None):
+        result = await super()._increment(key, delta, _conn=_conn)
+        self.publish([key])
+        return result
+
+    async def _expire(self, key, ttl, _conn=None):
+        result = await super()._expire(key, ttl, _conn=_conn)
+        self.publish([key])
+        return result
+
+    async def _delete(self, key, _conn=None):
+        result = await super()._delete(key, _conn=_conn)
+        self.publish([key])
+        return result
+
+    async def _clear(self, namespace=None, _conn=None):
+        result = await super()._clear(namespace=namespace, _conn=_conn)
+        self.publish([CLEAR_ALL])
+        return result
+
+    async def _close(self, *args, **kwargs):
+        if self.publisher:
+            # Make sure the writes made before closing are announced
+            await self.publisher
+            self.publisher = None
+
+        if self.listener:
+            self.listener.cancel()
+            self.listener = None
+
+        await super()._close(*args, **kwargs)
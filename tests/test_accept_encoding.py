@@ -0,0 +1,55 @@
+"""
+Test negotiating the content encoding of responses from the Accept-Encoding header
+"""
+import pytest
+from starlette.datastructures import Headers
+
+from woolgatherer.utils.compression import accepted_encodings, negotiate_encoding
+
+
+ENCODINGS = ("br", "zstd", "gzip")
+
+
+def accept(value: str) -> Headers:
+    """ Request headers with the given Accept-Encoding """
+    return Headers({"accept-encoding": value})
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        ("", []),
+        ("identity", []),
+        ("gzip", ["gzip"]),
+        ("gzip, br", ["br", "gzip"]),
+        ("GZIP , Br", ["br", "gzip"]),
+        ("gzip, br;q=0.5", ["gzip", "br"]),
+        ("gzip;q=0.5, br;q=0.5, zstd;q=0.5", ["br", "zstd", "gzip"]),
+        ("gzip;q=0.8, br;q=0.9, zstd;q=1.0", ["zstd", "br", "gzip"]),
+        ("gzip;q=1.0;foo=bar, br ; q=0.1", ["gzip", "br"]),
+        ("gzip;q=0, br", ["br"]),
+        ("gzip;q=0.000, br;q=0.001", ["br"]),
+        ("gzip;q=invalid, br", ["br"]),
+        ("gzip;q=nan, br", ["br"]),
+        ("*", ["br", "zstd", "gzip"]),
+        ("*;q=0.5, gzip", ["gzip", "br", "zstd"]),
+        ("*, br;q=0", ["zstd", "gzip"]),
+        ("*;q=0, gzip", ["gzip"]),
+        ("deflate, compress", []),
+        (",,gzip,;q=1,", ["gzip"]),
+    ],
+)
+def test_accepted_encodings(value, expected):
+    """ Encodings are ordered by quality, with ties kept in the server's order """
+    assert accepted_encodings(accept(value), ENCODINGS) == expected
+
+
+def test_accepted_encodings_without_header():
+    """ Without an Accept-Encoding header no encoding is accepted """
+    assert accepted_encodings(Headers({}), ENCODINGS) == []
+
+
+def test_negotiate_encoding():
+    """ The most preferred encoding is used, if any """
+    assert negotiate_encoding(accept("gzip, zstd;q=0.5"), ENCODINGS) == "gzip"
+    assert negotiate_encoding(accept("identity"), ENCODINGS) is None
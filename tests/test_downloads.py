@@ -0,0 +1,291 @@
+"""
+Test conditional and byte range requests when downloading files
+"""
+import asyncio
+import os
+from email.utils import formatdate
+
+import pytest
+from fastapi import FastAPI
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+from woolgatherer.utils.downloads import (
+    download_file,
+    download_media_type,
+    etag_matches,
+    is_not_modified,
+    parse_range,
+    precondition_failed,
+    range_applies,
+)
+
+
+CONTENT = bytes(range(256)) * 4
+ETAG = '"abc"'
+LAST_MODIFIED = formatdate(1000000, usegmt=True)
+EARLIER = formatdate(999999, usegmt=True)
+
+
+def run(coro):
+    """ Run the coroutine in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 1023)),
+        ("bytes=1000-2000", (1000, 1023)),
+        ("bytes=-100", (924, 1023)),
+        ("bytes=-2000", (0, 1023)),
+        ("Bytes = 5-5", (5, 5)),
+    ],
+)
+def test_parse_range(header, expected):
+    """ Open ended, suffix, and overlong ranges are limited to the file """
+    assert parse_range(header, 1024) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["bytes=0-1,5-6", "bytes=10-5", "items=0-1", "bytes=a-b", "bytes=-", "bytes=1-x"],
+)
+def test_parse_range_ignored(header):
+    """ Malformed, inverted, and multiple ranges are ignored """
+    assert parse_range(header, 1024) is None
+
+
+@pytest.mark.parametrize(
+    "header,size", [("bytes=1024-", 1024), ("bytes=-0", 1024), ("bytes=-10", 0)]
+)
+def test_parse_range_unsatisfiable(header, size):
+    """ Ranges which select no bytes of the file cannot be satisfied """
+    with pytest.raises(ValueError):
+        parse_range(header, size)
+
+
+@pytest.mark.parametrize(
+    "header,weak,expected",
+    [
+        ('"abc"', True, True),
+        ('"xyz", "abc"', True, True),
+        ('W/"abc"', True, True),
+        ('W/"abc"', False, False),
+        ("*", False, True),
+        ('"xyz"', True, False),
+        ("abc", True, False),
+    ],
+)
+def test_etag_matches(header, weak, expected):
+    """ Etags match exactly, or weakly if allowed, or by wildcard """
+    assert etag_matches(header, ETAG, weak=weak) == expected
+
+
+RESPONSE_HEADERS = Headers({"etag": ETAG, "last-modified": LAST_MODIFIED})
+
+
+@pytest.mark.parametrize(
+    "request_headers,expected",
+    [
+        ({}, False),
+        ({"if-none-match": ETAG}, True),
+        ({"if-none-match": 'W/"abc"'}, True),
+        ({"if-none-match": '"xyz"'}, False),
+        ({"if-modified-since": LAST_MODIFIED}, True),
+        ({"if-modified-since": EARLIER}, False),
+        ({"if-modified-since": "yesterday"}, False),
+        ({"if-none-match": '"xyz"', "if-modified-since": LAST_MODIFIED}, False),
+    ],
+)
+def test_is_not_modified(request_headers, expected):
+    """ If-None-Match takes precedence over If-Modified-Since """
+    assert is_not_modified(RESPONSE_HEADERS, Headers(request_headers)) == expected
+
+
+@pytest.mark.parametrize(
+    "request_headers,expected",
+    [
+        ({}, False),
+        ({"if-match": ETAG}, False),
+        ({"if-match": "*"}, False),
+        ({"if-match": 'W/"abc"'}, True),
+        ({"if-match": '"xyz"'}, True),
+        ({"if-unmodified-since": LAST_MODIFIED}, False),
+        ({"if-unmodified-since": EARLIER}, True),
+        ({"if-unmodified-since": "yesterday"}, False),
+        ({"if-match": ETAG, "if-unmodified-since": EARLIER}, False),
+    ],
+)
+def test_precondition_failed(request_headers, expected):
+    """ If-Match uses strong comparison and takes precedence over If-Unmodified-Since """
+    assert precondition_failed(RESPONSE_HEADERS, Headers(request_headers)) == expected
+
+
+@pytest.mark.parametrize(
+    "request_headers,expected",
+    [
+        ({}, True),
+        ({"if-range": ETAG}, True),
+        ({"if-range": 'W/"abc"'}, False),
+        ({"if-range": '"xyz"'}, False),
+        ({"if-range": LAST_MODIFIED}, True),
+        ({"if-range": EARLIER}, False),
+    ],
+)
+def test_range_applies(request_headers, expected):
+    """ If-Range requires a strong etag or the exact modification date """
+    assert range_applies(RESPONSE_HEADERS, Headers(request_headers)) == expected
+
+
+@pytest.mark.parametrize(
+    "filename,media_type",
+    [
+        ("data.jsonl", "application/x-ndjson"),
+        ("data.parquet", "application/vnd.apache.parquet"),
+        ("data.json", "application/json"),
+        ("data.tar.gz", "application/gzip"),
+        ("data.unknown", "application/octet-stream"),
+    ],
+)
+def test_download_media_type(filename, media_type):
+    """ Compressed files are typed by their compression """
+    assert download_media_type(filename) == media_type
+
+
+@pytest.fixture(name="client")
+def fixture_client(tmp_path):
+    """ A client for an app which downloads a single file """
+    path = os.path.join(str(tmp_path), "data.bin")
+    with open(path, "wb") as data_file:
+        data_file.write(CONTENT)
+
+    app = FastAPI()
+
+    @app.api_route("/{filename}", methods=["GET", "HEAD"])
+    async def download(request: Request, filename: str):
+        return await download_file(
+            request, os.path.join(str(tmp_path), filename), filename
+        )
+
+    return TestClient(app)
+
+
+def test_download(client):
+    """ The whole file is sent along with its validators """
+    response = client.get("/data.bin")
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == str(len(CONTENT))
+    assert response.headers["etag"].startswith('"')
+    assert "last-modified" in response.headers
+
+
+def test_download_head(tmp_path):
+    """ HEAD requests only send the headers """
+    path = os.path.join(str(tmp_path), "data.bin")
+    with open(path, "wb") as data_file:
+        data_file.write(CONTENT)
+
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def main():
+        request = Request({"type": "http", "method": "HEAD", "headers": []})
+        response = await download_file(request, path, "data.bin")
+        await response({"type": "http"}, None, send)
+
+    run(main())
+    start, body = messages
+    assert start["status"] == 200
+    assert (b"content-length", str(len(CONTENT)).encode()) in start["headers"]
+    assert body == {"type": "http.response.body"}
+
+
+def test_download_missing(client):
+    """ Missing files are not found """
+    assert client.get("/missing.bin").status_code == 404
+
+
+def test_download_not_modified(client):
+    """ A current cached copy is not sent again """
+    etag = client.get("/data.bin").headers["etag"]
+    response = client.get("/data.bin", headers={"if-none-match": etag})
+
+    assert response.status_code == 304
+    assert not response.content
+    assert response.headers["etag"] == etag
+
+
+@pytest.mark.parametrize(
+    "header,first,last",
+    [("bytes=10-19", 10, 19), ("bytes=1000-", 1000, 1023), ("bytes=-4", 1020, 1023)],
+)
+def test_download_range(client, header, first, last):
+    """ A byte range of the file can be downloaded """
+    response = client.get("/data.bin", headers={"range": header})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[first : last + 1]
+    assert response.headers["content-length"] == str(last - first + 1)
+    assert response.headers["content-range"] == f"bytes {first}-{last}/{len(CONTENT)}"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,4-5", "bytes=20-10"])
+def test_download_range_ignored(client, header):
+    """ Ranges which are ignored send the whole file """
+    response = client.get("/data.bin", headers={"range": header})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_download_range_not_satisfiable(client):
+    """ Ranges past the end of the file cannot be satisfied """
+    response = client.get("/data.bin", headers={"range": "bytes=1024-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_download_range_changed(client):
+    """ The whole file is sent if it changed since the client's partial copy """
+    response = client.get(
+        "/data.bin", headers={"range": "bytes=0-9", "if-range": '"stale"'}
+    )
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_download_resume(client):
+    """ A range is sent when the client's partial copy is current """
+    etag = client.get("/data.bin").headers["etag"]
+    response = client.get(
+        "/data.bin",
+        headers={"range": "bytes=512-", "if-range": etag, "if-match": etag},
+    )
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[512:]
+
+
+@pytest.mark.parametrize(
+    "headers", [{"if-match": '"stale"'}, {"if-unmodified-since": EARLIER}]
+)
+def test_download_precondition_failed(client, headers):
+    """ Nothing is sent if the file changed since the client last saw it """
+    response = client.get("/data.bin", headers=dict(headers, range="bytes=0-9"))
+
+    assert response.status_code == 412
+    assert not response.content
@@ -0,0 +1,161 @@
+"""
+Test exporting partitions in chunks, and resuming from the manifest
+"""
+import asyncio
+import json
+import os
+
+import pytest
+
+from woolgatherer.models.exports import (
+    ExportFormat,
+    ExportKind,
+    ExportManifest,
+    ExportPartition,
+)
+from woolgatherer.ops import exports
+
+
+NAME = "test"
+MODEL_NAME = "model/v1"
+
+
+def run(coro):
+    """ Run the coroutine in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class Rows:
+    """ Stands in for the db, returning the rows the export query would select """
+
+    def __init__(self, count: int, fail_after: int = -1):
+        self.rows = [
+            {"id": i, "record": json.dumps({"id": i})} for i in range(1, count + 1)
+        ]
+        self.fetches = []
+        self.fail_after = fail_after
+
+    async def fetch_all(self, query, values):
+        """ Fetch the rows after the last exported id """
+        assert query == "export"
+        assert values["model_name"] == MODEL_NAME
+        if len(self.fetches) == self.fail_after:
+            raise ConnectionError("Lost the connection")
+
+        self.fetches.append(values["after"])
+        rows = [row for row in self.rows if row["id"] > values["after"]]
+        return rows[: values["limit"]]
+
+
+@pytest.fixture(name="manifest")
+def fixture_manifest(monkeypatch, tmp_path):
+    """ A new export manifest with a single partition """
+
+    async def load_query(filename):  # pylint:disable=unused-argument
+        return "export"
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(exports, "load_query", load_query)
+    os.makedirs(exports.export_path(NAME))
+
+    manifest = ExportManifest(
+        kind=ExportKind.finalized_suggestions,
+        format=ExportFormat.jsonl,
+        status=["active"],
+        chunk_size=2,
+        partitions={MODEL_NAME: ExportPartition(model_name=MODEL_NAME)},
+    )
+    exports.save_manifest(NAME, manifest)
+    return manifest
+
+
+def export_partition(manifest: ExportManifest, db: Rows):
+    """ Export the only partition of the manifest """
+    partition = manifest.partitions[MODEL_NAME]
+    run(
+        exports.export_partition(
+            NAME, manifest, partition, db=db, semaphore=asyncio.Semaphore(1)
+        )
+    )
+    return partition
+
+
+def exported_ids(partition: ExportPartition):
+    """ The ids of the rows in each file of the partition """
+    ids = []
+    for filename in partition.files:
+        with open(os.path.join(exports.export_path(NAME), filename), "rt") as file:
+            ids.append([json.loads(line)["id"] for line in file])
+
+    return ids
+
+
+def test_export_in_chunks(manifest):
+    """ Each chunk is written to its own file, and recorded in the manifest """
+    db = Rows(5)
+    partition = export_partition(manifest, db)
+
+    assert partition.complete
+    assert partition.rows == 5
+    assert partition.last_id == 5
+    assert partition.files == [
+        f"finalized_suggestions-model_v1-{i:05d}.jsonl" for i in range(3)
+    ]
+    assert exported_ids(partition) == [[1, 2], [3, 4], [5]]
+    assert db.fetches == [0, 2, 4]
+    assert exports.load_manifest(NAME) == manifest
+
+
+def test_export_exact_chunks(manifest):
+    """ An empty final chunk completes the partition without writing a file """
+    db = Rows(4)
+    partition = export_partition(manifest, db)
+
+    assert partition.complete
+    assert exported_ids(partition) == [[1, 2], [3, 4]]
+    assert db.fetches == [0, 2, 4]
+
+
+def test_resume_after_interruption(manifest):
+    """ An interrupted export resumes from the last chunk saved in the manifest """
+    with pytest.raises(ConnectionError):
+        export_partition(manifest, Rows(5, fail_after=1))
+
+    saved = exports.load_manifest(NAME)
+    partition = saved.partitions[MODEL_NAME]
+    assert not partition.complete
+    assert (partition.rows, partition.last_id) == (2, 2)
+    assert exported_ids(partition) == [[1, 2]]
+
+    db = Rows(5)
+    partition = export_partition(saved, db)
+
+    assert partition.complete
+    assert partition.rows == 5
+    assert db.fetches == [2, 4]
+    assert exported_ids(partition) == [[1, 2], [3, 4], [5]]
+    assert not any(
+        filename.endswith(".tmp") for filename in os.listdir(exports.export_path(NAME))
+    )
+
+
+def test_complete_partition_is_not_exported(manifest):
+    """ Resuming a complete partition does not query the db again """
+    export_partition(manifest, Rows(1))
+
+    db = Rows(1)
+    partition = export_partition(exports.load_manifest(NAME), db)
+
+    assert not db.fetches
+    assert exported_ids(partition) == [[1]]
+
+
+@pytest.mark.parametrize("name", ["../test", ".test", "a/b"])
+def test_invalid_export_name(name):
+    """ Exports cannot be written outside of the export directory """
+    with pytest.raises(exports.InvalidOperationError):
+        exports.export_path(name)
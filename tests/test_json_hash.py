@@ -0,0 +1,46 @@
+"""
+Test that the canonical JSON encoders produce identical bytes, since the hashes of
+stories and contexts must not depend on which encoder is installed
+"""
+from datetime import datetime
+
+import pytest
+
+from woolgatherer.db import utils
+
+pytest.importorskip("orjson")
+
+
+OBJECTS = [
+    {"b": 1, "a": {"z": [1, 2, 3], "y": None, "x": True}},
+    {"text": 'quote " backslash \\ newline \n tab \t control \x00\x1f\x7f'},
+    {"unicode": "é 😀   ￿", "ä": 1, "Z": 2, "😀": 3},
+    {"floats": [0.0, -0.0, 0.1, 2.5, 1e-4, 123456789.125, 1e15, 9999999999999998.0]},
+    {"exponent": [1e-05, 1.5e-7, 1e16, 1e22, -3.2e100]},
+    {"nonfinite": [float("nan"), float("inf"), float("-inf")]},
+    {"big": 2 ** 70, "negative": -(2 ** 63) - 1},
+    {"nested": [[{"deep": [1.0, {"float": 1e-10}]}]]},
+    {"tuple": (1, 2.5, "three")},
+    {"created": datetime(2020, 1, 2, 3, 4, 5, 6)},
+    {1: "int key", 10: "sorted numerically", 2: "by the standard library"},
+    {},
+]
+
+
+@pytest.mark.parametrize("json_obj", OBJECTS)
+def test_encoders_match(json_obj):
+    """ The orjson encoder must produce the same bytes as the standard library """
+    expected = utils.CANONICAL_JSON_ENCODERS["json"].encode(json_obj)
+    assert utils.CANONICAL_JSON_ENCODERS["orjson"].encode(json_obj) == expected
+
+
+@pytest.mark.parametrize("json_obj", OBJECTS)
+def test_digests_match(json_obj):
+    """ json_digest must match json_hash regardless of the encoder """
+    try:
+        expected = utils.json_hash(json_obj)[1]
+        for name in utils.CANONICAL_JSON_ENCODERS:
+            utils.set_canonical_json_encoder(name)
+            assert utils.json_digest(json_obj) == expected
+    finally:
+        utils.set_canonical_json_encoder("orjson")
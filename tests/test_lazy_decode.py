@@ -0,0 +1,122 @@
+"""
+Test that models constructed from the db only decode their JSON fields upon access
+"""
+import json
+from uuid import uuid4
+
+import pytest
+
+from woolgatherer.db_models.suggestion import Suggestion
+from woolgatherer.models.storium import SceneEntry
+from woolgatherer.models.suggestion import SuggestionStatus, SuggestionType
+
+
+CONTEXT = {"seq_id": "context", "description": "Once upon a time"}
+GENERATED = {"seq_id": "generated", "description": "There was a story"}
+
+
+def db_row(**kwargs):
+    """ A suggestion row as loaded from the db, with the JSON columns still encoded """
+    row = {
+        "id": 1,
+        "type": SuggestionType.scene_entry.value,
+        "uuid": uuid4(),
+        "context_hash": "hash",
+        "story_hash": "story",
+        "status": SuggestionStatus.done.value,
+        "context": json.dumps(CONTEXT),
+        "generated": json.dumps(GENERATED),
+        "finalized": None,
+    }
+    row.update(kwargs)
+    return row
+
+
+def test_decoded_upon_access():
+    """ JSON fields are only decoded when first accessed """
+    suggestion = Suggestion.db_construct(db_row())
+
+    assert set(suggestion._undecoded) == {"context", "generated"}
+    assert "context" not in suggestion.__dict__
+
+    context = suggestion.context
+    assert isinstance(context, SceneEntry)
+    assert context.description == CONTEXT["description"]
+    assert set(suggestion._undecoded) == {"generated"}
+    assert suggestion.context is context
+
+
+def test_null_fields_are_not_deferred():
+    """ Null JSON fields have nothing to decode """
+    suggestion = Suggestion.db_construct(db_row())
+
+    assert "finalized" not in suggestion._undecoded
+    assert suggestion.finalized is None
+
+
+def test_not_lazy():
+    """ All fields can be decoded upfront """
+    suggestion = Suggestion.db_construct(db_row(), lazy=False)
+
+    assert not suggestion._undecoded
+    assert isinstance(suggestion.__dict__["generated"], SceneEntry)
+
+
+def test_dict_decodes_all():
+    """ Converting to a dict decodes every field """
+    suggestion = Suggestion.db_construct(db_row())
+    suggestion_dict = suggestion.dict(include={"context", "generated", "status"})
+
+    assert not suggestion._undecoded
+    assert suggestion_dict["context"]["description"] == CONTEXT["description"]
+    assert suggestion_dict["generated"]["description"] == GENERATED["description"]
+    assert suggestion_dict["status"] == SuggestionStatus.done
+
+
+def test_copy_decodes_all():
+    """ A copy has every field decoded, and does not share the undecoded fields """
+    suggestion = Suggestion.db_construct(db_row())
+    duplicate = suggestion.copy()
+
+    assert not suggestion._undecoded
+    assert not duplicate._undecoded
+    assert duplicate.context == suggestion.context
+    assert duplicate.generated.description == GENERATED["description"]
+
+
+def test_iteration_decodes_all():
+    """ Iterating over the fields decodes every field """
+    suggestion = Suggestion.db_construct(db_row())
+    fields = dict(suggestion)
+
+    assert isinstance(fields["context"], SceneEntry)
+    assert not suggestion._undecoded
+
+
+def test_set_before_decoding():
+    """ Setting a field discards its undecoded value and marks it modified """
+    suggestion = Suggestion.db_construct(db_row())
+    suggestion.generated = SceneEntry.construct(description="Replaced")
+
+    assert "generated" not in suggestion._undecoded
+    assert suggestion.generated.description == "Replaced"
+    values = suggestion.db_dict(modified_only=True)
+    assert list(values) == ["generated"]
+    assert values["generated"]["description"] == "Replaced"
+
+
+@pytest.mark.parametrize("name", ["missing", "_missing"])
+def test_unknown_attribute(name):
+    """ Attributes which are not undecoded fields are still missing """
+    suggestion = Suggestion.db_construct(db_row())
+
+    with pytest.raises(AttributeError):
+        getattr(suggestion, name)
+
+
+def test_partial_columns():
+    """ Only the selected columns are set """
+    suggestion = Suggestion.db_construct({"uuid": uuid4(), "context": json.dumps({})})
+
+    assert suggestion.__fields_set__ == {"uuid", "context"}
+    assert isinstance(suggestion.context, SceneEntry)
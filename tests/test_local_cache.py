@@ -0,0 +1,106 @@
+"""
+Test the in process tier of the tiered cache
+"""
+import pytest
+
+pytest.importorskip("aioredis")
+
+# pylint:disable=wrong-import-position
+from woolgatherer.utils import tiered_cache
+from woolgatherer.utils.tiered_cache import CLEAR_ALL, LocalCache, remaining_ttl
+
+
+class Clock:
+    """ A clock which only moves when told to """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture(name="clock")
+def fixture_clock(monkeypatch):
+    """ Control the time seen by the cache """
+    clock = Clock()
+    monkeypatch.setattr(tiered_cache.time, "monotonic", clock)
+    return clock
+
+
+def test_get_and_set(clock):  # pylint:disable=unused-argument
+    """ Values can be read back until they are replaced """
+    cache = LocalCache(max_size=2, ttl=60)
+
+    assert cache.get("a") is None
+    cache.set("a", b"1")
+    assert cache.get("a") == b"1"
+    cache.set("a", b"2")
+    assert cache.get("a") == b"2"
+
+
+def test_lru_eviction(clock):  # pylint:disable=unused-argument
+    """ The least recently used entry is evicted once full """
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+
+    # Reading an entry makes it the most recently used
+    assert cache.get("a") == b"1"
+    cache.set("c", b"3")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+
+    # As does replacing an entry
+    cache.set("a", b"4")
+    cache.set("d", b"5")
+
+    assert cache.get("c") is None
+    assert list(cache.entries) == ["a", "d"]
+
+
+def test_ttl_expiry(clock):
+    """ Entries expire after the time to live of the cache """
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.set("a", b"1")
+
+    clock.now += 59.9
+    assert cache.get("a") == b"1"
+
+    clock.now += 0.1
+    assert cache.get("a") is None
+    assert not cache.entries
+
+
+@pytest.mark.parametrize("ttl,expected", [(10, 10), (None, 60), (600, 60)])
+def test_value_ttl(clock, ttl, expected):
+    """ Entries never outlive their value's time to live, nor that of the cache """
+    cache = LocalCache(max_size=2, ttl=60)
+    cache.set("a", b"1", ttl)
+
+    clock.now += expected - 0.1
+    assert cache.get("a") == b"1"
+
+    clock.now += 0.1
+    assert cache.get("a") is None
+
+
+def test_discard(clock):  # pylint:disable=unused-argument
+    """ Discarding removes the given keys, or every key """
+    cache = LocalCache(max_size=3, ttl=60)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.encode())
+
+    cache.discard(["a", "missing"])
+    assert list(cache.entries) == ["b", "c"]
+
+    cache.discard([CLEAR_ALL])
+    assert not cache.entries
+
+
+@pytest.mark.parametrize("pttl,expected", [(1500, 1.5), (0, 0), (-1, None), (-2, None)])
+def test_remaining_ttl(pttl, expected):
+    """ Keys without an expiry, or which no longer exist, have no time to live """
+    assert remaining_ttl(pttl) == expected
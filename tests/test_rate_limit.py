@@ -0,0 +1,85 @@
+"""
+Test the in process token buckets used for rate limiting
+"""
+import pytest
+
+from woolgatherer.utils import rate_limit
+from woolgatherer.utils.rate_limit import TokenBucket
+
+
+def test_take_until_empty():
+    """ A full bucket allows a burst of capacity requests """
+    bucket = TokenBucket("test", rate=1, capacity=3)
+
+    assert [bucket.take_local("key", 100)[0] for _ in range(4)] == [
+        True,
+        True,
+        True,
+        False,
+    ]
+
+
+def test_retry_after():
+    """ An empty bucket reports how long until the next token """
+    bucket = TokenBucket("test", rate=2, capacity=1)
+
+    assert bucket.take_local("key", 100) == (True, 0)
+    allowed, retry_after = bucket.take_local("key", 100)
+    assert not allowed
+    assert retry_after == pytest.approx(0.5)
+
+    allowed, retry_after = bucket.take_local("key", 100.25)
+    assert not allowed
+    assert retry_after == pytest.approx(0.25)
+
+    assert bucket.take_local("key", 100.5)[0]
+
+
+def test_refill():
+    """ Tokens refill at rate per second, up to the capacity """
+    bucket = TokenBucket("test", rate=1, capacity=2)
+    for _ in range(2):
+        bucket.take_local("key", 100)
+
+    assert bucket.take_local("key", 101)[0]
+    assert not bucket.take_local("key", 101)[0]
+
+    # Idling for longer than needed to refill does not exceed the capacity
+    assert [bucket.take_local("key", 1000)[0] for _ in range(3)] == [
+        True,
+        True,
+        False,
+    ]
+
+
+def test_clock_going_backwards():
+    """ Time going backwards does not add or remove tokens """
+    bucket = TokenBucket("test", rate=1, capacity=1)
+
+    assert bucket.take_local("key", 100)[0]
+    assert not bucket.take_local("key", 50)[0]
+    assert bucket.take_local("key", 51)[0]
+
+
+def test_keys_are_independent():
+    """ Each key has its own bucket """
+    bucket = TokenBucket("test", rate=1, capacity=1)
+
+    assert bucket.take_local("a", 100)[0]
+    assert not bucket.take_local("a", 100)[0]
+    assert bucket.take_local("b", 100)[0]
+
+
+def test_prune_idle_buckets(monkeypatch):
+    """ Buckets idle long enough to have refilled are pruned """
+    monkeypatch.setattr(rate_limit, "MAX_LOCAL_BUCKETS", 2)
+    bucket = TokenBucket("test", rate=1, capacity=2)
+    for key in ("idle", "busy", "new"):
+        bucket.take_local(key, 100 if key == "idle" else 101.5)
+
+    bucket.take_local("other", 102.5)
+    assert set(bucket.buckets) == {"busy", "new", "other"}
+
+    # A pruned bucket starts full again
+    assert bucket.take_local("idle", 102.5) == (True, 0)
+    assert bucket.buckets["idle"] == (1, 102.5)
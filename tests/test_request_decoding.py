@@ -0,0 +1,180 @@
+"""
+Test decoding compressed request bodies, in particular that decompression bombs cannot
+decompress past the maximum body size
+"""
+import gzip
+import zlib
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.testclient import TestClient
+
+from woolgatherer.utils import routing
+from woolgatherer.utils.settings import Settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+MAX_SIZE = 64 * 1024
+
+BODY = b'{"story": "' + b"Once upon a time. " * 1000 + b'"}'
+
+# Highly compressible bodies which decompress to far more than the max size
+BOMB = b"\0" * (64 * MAX_SIZE)
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    """ Compress the data with the given content encoding """
+    if encoding == "gzip":
+        return gzip.compress(data)
+
+    if encoding == "deflate":
+        return zlib.compress(data)
+
+    if encoding == "br":
+        if not brotli:
+            pytest.skip("brotli is not installed")
+
+        return brotli.compress(data)
+
+    if not zstandard:
+        pytest.skip("zstandard is not installed")
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+ENCODINGS = ["gzip", "deflate", "br", "zstd"]
+
+
+@pytest.fixture(name="client")
+def fixture_client(monkeypatch):
+    """ A client for an app which echoes the decoded request body """
+    monkeypatch.setattr(Settings, "max_body_size", MAX_SIZE)
+    monkeypatch.setattr(Settings, "max_inline_decode_size", 1024)
+
+    router = APIRouter()
+    router.route_class = routing.CompressibleRoute
+
+    @router.post("/echo")
+    async def echo(request: Request):  # pylint:disable=unused-variable
+        return Response(await request.body(), media_type="application/octet-stream")
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_decoder_max_size(encoding):
+    """ A decoder never produces more than max_size bytes before raising """
+    data = compress(encoding, BOMB)
+    decoder = routing.DECODERS[encoding](MAX_SIZE)
+
+    output = []
+    with pytest.raises(routing.BodyTooLargeError):
+        for idx in range(0, len(data), 1024):
+            output.append(decoder.decompress(data[idx : idx + 1024]))
+            assert sum(len(chunk) for chunk in output) <= MAX_SIZE
+
+        decoder.flush()
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_decoder_exact_size(encoding):
+    """ A body of exactly max_size bytes is allowed """
+    data = b"x" * MAX_SIZE
+    decoder = routing.DECODERS[encoding](MAX_SIZE)
+
+    assert decoder.decompress(compress(encoding, data)) + decoder.flush() == data
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_compressed_body(client, encoding):
+    """ A compressed body is decoded """
+    response = client.post(
+        "/echo", data=compress(encoding, BODY), headers={"Content-Encoding": encoding},
+    )
+
+    assert response.status_code == 200
+    assert response.content == BODY
+
+
+def test_multiple_encodings(client):
+    """ Encodings are decoded in the reverse order they were applied """
+    response = client.post(
+        "/echo",
+        data=zlib.compress(gzip.compress(BODY)),
+        headers={"Content-Encoding": "gzip, identity, deflate"},
+    )
+
+    assert response.status_code == 200
+    assert response.content == BODY
+
+
+def test_multiple_gzip_members(client):
+    """ A gzip body can consist of multiple members """
+    response = client.post(
+        "/echo",
+        data=gzip.compress(BODY[:100]) + gzip.compress(BODY[100:]),
+        headers={"Content-Encoding": "gzip"},
+    )
+
+    assert response.status_code == 200
+    assert response.content == BODY
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_decompression_bomb(client, encoding):
+    """ A body which decompresses past the max size is rejected """
+    response = client.post(
+        "/echo", data=compress(encoding, BOMB), headers={"Content-Encoding": encoding}
+    )
+
+    assert response.status_code == 413
+
+
+def test_uncompressed_body_too_large(client):
+    """ The max size also applies to uncompressed bodies """
+    response = client.post("/echo", data=b"x" * (MAX_SIZE + 1))
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_corrupt_body(client, encoding):
+    """ A corrupt body is a bad request """
+    data = bytearray(compress(encoding, BODY))
+    data[len(data) // 2 :] = b"\xff" * (len(data) - len(data) // 2)
+    response = client.post(
+        "/echo", data=bytes(data), headers={"Content-Encoding": encoding}
+    )
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "deflate", "br"])
+def test_truncated_body(client, encoding):
+    """ A truncated body is a bad request """
+    data = compress(encoding, BODY)
+    response = client.post(
+        "/echo", data=data[: len(data) // 2], headers={"Content-Encoding": encoding}
+    )
+
+    assert response.status_code == 400
+
+
+def test_unsupported_encoding(client):
+    """ An unknown encoding is an unsupported media type """
+    response = client.post("/echo", data=BODY, headers={"Content-Encoding": "lzma"})
+
+    assert response.status_code == 415
@@ -0,0 +1,134 @@
+"""
+Test coalescing concurrent calls with SingleFlight
+"""
+import asyncio
+
+import pytest
+
+from woolgatherer.utils.single_flight import SingleFlight
+
+
+def run(coro):
+    """ Run the coroutine in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class Counter:
+    """ A call which counts how many times it ran """
+
+    def __init__(self, delay: float = 0.01, error: bool = False):
+        self.calls = 0
+        self.delay = delay
+        self.error = error
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise ValueError("failed")
+
+        return self.calls
+
+
+def test_coalesce_concurrent_calls():
+    """ Concurrent callers for the same key share a single call """
+
+    async def main():
+        flights = SingleFlight()
+        counter = Counter()
+        results = await asyncio.gather(*[flights.run("key", counter) for _ in range(5)])
+
+        assert results == [1] * 5
+        assert counter.calls == 1
+        assert not flights.calls
+
+    run(main())
+
+
+def test_different_keys():
+    """ Calls for different keys are not coalesced """
+
+    async def main():
+        flights = SingleFlight()
+        counter = Counter()
+        await asyncio.gather(flights.run("a", counter), flights.run("b", counter))
+
+        assert counter.calls == 2
+
+    run(main())
+
+
+def test_sequential_calls():
+    """ Without a grace period, the result is not shared once the call completes """
+
+    async def main():
+        flights = SingleFlight()
+        counter = Counter()
+
+        assert await flights.run("key", counter) == 1
+        assert await flights.run("key", counter) == 2
+
+    run(main())
+
+
+def test_grace_period():
+    """ The result is shared for the grace period after the call completes """
+
+    async def main():
+        flights = SingleFlight(grace_period=0.05)
+        counter = Counter()
+
+        assert await flights.run("key", counter) == 1
+        assert await flights.run("key", counter) == 1
+
+        await asyncio.sleep(0.1)
+        assert not flights.calls
+        assert await flights.run("key", counter) == 2
+
+    run(main())
+
+
+def test_failures_are_not_shared_after_completing():
+    """ All waiting callers see the failure, but the next caller retries """
+
+    async def main():
+        flights = SingleFlight(grace_period=10)
+        counter = Counter(error=True)
+        results = await asyncio.gather(
+            flights.run("key", counter),
+            flights.run("key", counter),
+            return_exceptions=True,
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert counter.calls == 1
+
+        counter.error = False
+        assert await flights.run("key", counter) == 2
+
+    run(main())
+
+
+def test_cancelling_a_caller():
+    """ Cancelling the caller which started the call does not cancel the call """
+
+    async def main():
+        flights = SingleFlight()
+        counter = Counter(delay=0.05)
+        first = asyncio.ensure_future(flights.run("key", counter))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flights.run("key", counter))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        assert await second == 1
+        assert counter.calls == 1
+
+    run(main())
@@ -0,0 +1,114 @@
+"""
+Test the statements the models cache for each query shape
+"""
+import asyncio
+import os
+
+import pytest
+import sqlalchemy as sa
+from databases import Database
+from sqlalchemy.dialects import sqlite
+
+from woolgatherer.db_models.storium import Story, StoryStatus
+
+
+pytest.importorskip("aiosqlite")
+
+
+def run(coro):
+    """ Run the coroutine in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def sql(query) -> str:
+    """ The SQL of the query compiled for sqlite """
+    return " ".join(query.compile(sqlite.dialect()).string.split())
+
+
+def test_statement_reused_for_shape():
+    """ Queries of the same shape share a statement, but have their own params """
+    first = Story._select_query("status", {"hash": "a"})
+    second = Story._select_query(("status",), {"hash": "b"})
+
+    assert first.statement is second.statement
+    assert first.params == {"where_hash": "a"}
+    assert second.params == {"where_hash": "b"}
+
+
+@pytest.mark.parametrize(
+    "where,other",
+    [
+        ({"game_pid": None}, {"game_pid": "game"}),
+        ({"hash": "a"}, {"hash": "a", "game_pid": "game"}),
+        ({"hash": "a", "game_pid": None}, {"hash": "a", "game_pid": "game"}),
+    ],
+)
+def test_statement_shape_includes_null(where, other):
+    """ Comparing to null is a different shape than comparing to a value """
+    assert (
+        Story._select_query("hash", where).statement
+        is not Story._select_query("hash", other).statement
+    )
+
+
+def test_statement_where_null():
+    """ Null values are compared using IS NULL """
+    query = Story._select_query("hash", {"game_pid": None, "hash": "a"})
+
+    assert sql(query).endswith("WHERE story.game_pid IS NULL AND story.hash = ?")
+
+
+def test_statement_where_order():
+    """ The order of the where clause does not change the shape """
+    first = Story._select_query("hash", {"hash": "a", "game_pid": "game"})
+    second = Story._select_query("hash", {"game_pid": "game", "hash": "a"})
+
+    assert first.statement is second.statement
+
+
+def test_statement_operations_differ():
+    """ The operation is part of the shape """
+    select = Story._query("select", columns=("status",), where={"hash": "a"})
+    update = Story._query("update", values={"status": "ready"}, where={"hash": "a"})
+    delete = Story._query("delete", where={"hash": "a"})
+
+    assert sql(select).startswith("SELECT story.status FROM story")
+    assert sql(update).startswith("UPDATE story SET status=?")
+    assert sql(delete).startswith("DELETE FROM story")
+
+
+def test_statement_unknown_operation():
+    """ Only select, update, and delete statements can be built """
+    with pytest.raises(ValueError):
+        Story._query("insert", where={"hash": "a"})
+
+
+def test_statements_execute(tmp_path):
+    """ The same statement returns the rows matching each query's values """
+    path = os.path.join(str(tmp_path), "test.db")
+    Story.__metadata__.create_all(sa.create_engine(f"sqlite:///{path}"))
+
+    async def main():
+        async with Database(f"sqlite:///{path}") as db:
+            for story_hash, game_pid in (("a", None), ("b", "game"), ("c", "game")):
+                await Story(story={}, hash=story_hash, game_pid=game_pid).insert(db)
+
+            story = await Story.select(db, "status", {"hash": "b"})
+            story.status = StoryStatus.ready
+            await story.update(db, where={"hash": "b"})
+
+            async def hashes(where):
+                return sorted(
+                    story.hash for story in await Story.select_all(db, "hash", where)
+                )
+
+            assert await hashes({"game_pid": None}) == ["a"]
+            assert await hashes({"game_pid": "game"}) == ["b", "c"]
+            assert await hashes({"game_pid": "game", "status": "ready"}) == ["b"]
+            assert await hashes({"game_pid": "other"}) == []
+
+    run(main())
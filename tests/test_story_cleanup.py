@@ -0,0 +1,160 @@
+"""
+Test cleaning up the stories superseded by newer exports of the same game
+"""
+import asyncio
+import os
+from uuid import uuid4
+
+import pytest
+import sqlalchemy as sa
+from databases import Database
+
+from woolgatherer.db_models import (
+    DBBaseModel,
+    LatestStory,
+    Story,
+    StoryChunk,
+    Suggestion,
+)
+from woolgatherer.ops import stories as story_ops
+from woolgatherer.ops import storage as storage_ops
+
+
+pytest.importorskip("aiosqlite")
+
+
+def run(coro):
+    """ Run the coroutine in a new event loop """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+async def add_story(game_pid: str, index: int, *, db: Database) -> str:
+    """ Add the index'th export of the game, returning its hash """
+    story_dict = {
+        "game_pid": game_pid,
+        "exported_at": f"2020-01-{index + 1:02d} 10:00:00 UTC",
+        "characters": [{"name": "Hero"}],
+        "scenes": [{"entries": [{"description": str(i)} for i in range(index + 1)]}],
+    }
+    story_hash = f"{game_pid}-{index}"
+    manifest, chunks = storage_ops.split_story(story_dict)
+    await storage_ops.store_chunks(story_hash, chunks, db=db)
+
+    story = Story(
+        story=manifest,
+        hash=story_hash,
+        chunked=True,
+        game_pid=game_pid,
+        exported_at=story_ops.story_export_time(story_dict),
+    )
+    await story.insert(db)
+    await story_ops.record_latest_story(story, db=db)
+    return story_hash
+
+
+async def add_suggestion(story_hash: str, *, db: Database):
+    """ Add a suggestion which references the story """
+    await db.execute(
+        Suggestion.__table__.insert().values(
+            uuid=uuid4(),
+            type="scene_entry",
+            status="done",
+            context_hash="context",
+            story_hash=story_hash,
+            context={},
+            generated=None,
+        )
+    )
+
+
+async def story_hashes(db: Database):
+    """ The hashes of all the stories """
+    return sorted(row["hash"] for row in await db.fetch_all("SELECT hash FROM story"))
+
+
+async def versions(db: Database):
+    """ The version and cleaned version of each game """
+    return {
+        row["game_pid"]: (row["version"], row["cleaned_version"])
+        for row in await db.fetch_all(LatestStory.__table__.select())
+    }
+
+
+@pytest.fixture(name="database_url")
+def fixture_database_url(tmp_path):
+    """ A sqlite database with two games, each with five exports """
+    path = os.path.join(str(tmp_path), "test.db")
+    DBBaseModel.__metadata__.create_all(sa.create_engine(f"sqlite:///{path}"))
+
+    async def populate():
+        async with Database(f"sqlite:///{path}") as db:
+            for game_pid in ("g1", "g2"):
+                for index in range(5):
+                    await add_story(game_pid, index, db=db)
+
+            await add_suggestion("g1-1", db=db)
+
+    run(populate())
+    return f"sqlite:///{path}"
+
+
+def test_batch_size(database_url):
+    """ A batch deletes at most batch_size stories """
+
+    async def main():
+        async with Database(database_url) as db:
+            assert await versions(db) == {"g1": (5, 1), "g2": (5, 1)}
+            assert await story_ops.cleanup_stories_batch(3, db=db) == 2
+
+            hashes = await story_hashes(db)
+            assert len(hashes) == 7
+            assert {"g1-1", "g1-4", "g2-4"} <= set(hashes)
+
+            # The games still have superseded stories left to delete
+            assert await versions(db) == {"g1": (5, 1), "g2": (5, 1)}
+
+    run(main())
+
+
+def test_cleanup_until_done(database_url):
+    """ Only the latest and referenced stories, and the chunks they use, remain """
+
+    async def main():
+        async with Database(database_url) as db:
+            while await story_ops.cleanup_stories_batch(3, db=db):
+                pass
+
+            assert await story_hashes(db) == ["g1-1", "g1-4", "g2-4"]
+            assert await versions(db) == {"g1": (5, 5), "g2": (5, 5)}
+
+            used = set()
+            for story in await Story.select_all(db, "story"):
+                used.update(storage_ops.manifest_hashes(story.story))
+
+            chunk_hashes = await db.fetch_all(sa.select([StoryChunk.__table__.c.hash]))
+            assert {row["hash"] for row in chunk_hashes} == used
+
+    run(main())
+
+
+def test_only_pending_games(database_url):
+    """ Games without new stories since their last cleanup are skipped """
+
+    async def main():
+        async with Database(database_url) as db:
+            await story_ops.cleanup_stories_batch(10, db=db)
+            assert await versions(db) == {"g1": (5, 5), "g2": (5, 5)}
+            assert await story_ops.cleanup_stories_batch(10, db=db) == 0
+
+            await add_story("g2", 5, db=db)
+            assert await versions(db) == {"g1": (5, 5), "g2": (6, 5)}
+
+            assert await story_ops.cleanup_stories_batch(10, db=db) == 1
+            assert await story_hashes(db) == ["g1-1", "g1-4", "g2-5"]
+            assert await versions(db) == {"g1": (5, 5), "g2": (6, 6)}
+
+    run(main())
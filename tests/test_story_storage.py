@@ -0,0 +1,104 @@
+"""
+Test splitting stories into content-addressed chunks, and applying story deltas
+"""
+import copy
+
+import pytest
+
+from woolgatherer.errors import InvalidStoryDeltaError
+from woolgatherer.models.stories import StoryDelta
+from woolgatherer.ops.stories import apply_story_delta
+from woolgatherer.ops.storage import assemble_story, manifest_hashes, split_story
+
+
+STORY = {
+    "game_pid": "game",
+    "exported_at": "2020-01-02 03:04:05 UTC",
+    "characters": [{"character_seq_id": "c1"}, {"character_seq_id": "c2"}],
+    "scenes": [
+        {
+            "scene_seq_id": "s1",
+            "entries": [{"seq_id": "e1", "description": "Once"}, {"seq_id": "e2"}],
+        },
+        {"scene_seq_id": "s2", "entries": [{"seq_id": "e1", "description": "Once"}]},
+        {"scene_seq_id": "s3"},
+    ],
+}
+
+
+@pytest.mark.parametrize(
+    "story_dict",
+    [STORY, {"game_pid": "empty"}, {"scenes": []}, {"characters": [{"name": "x"}]}],
+)
+def test_split_story_round_trip(story_dict):
+    """ Assembling the manifest and chunks of a story must return the same story """
+    original = copy.deepcopy(story_dict)
+    manifest, chunks = split_story(story_dict)
+
+    assert story_dict == original
+    assert assemble_story(manifest, chunks) == original
+
+
+def test_split_story_deduplicates_chunks():
+    """ Identical entries are stored as a single chunk """
+    manifest, chunks = split_story(STORY)
+
+    hashes = manifest_hashes(manifest)
+    assert set(hashes) == set(chunks)
+    assert len(hashes) == 2 + 3 + 3
+    assert len(chunks) == len(hashes) - 1
+    assert manifest["scenes"][0]["entries"][0] == manifest["scenes"][1]["entries"][0]
+    assert "entries" not in manifest["scenes"][2]
+
+
+def test_split_story_unchanged_chunks_keep_their_hash():
+    """ Appending to a story only adds chunks for the new and changed content """
+    manifest, chunks = split_story(STORY)
+    delta = StoryDelta(entries=[{"seq_id": "e3"}], scenes=[{"scene_seq_id": "s4"}])
+    new_manifest, new_chunks = split_story(
+        apply_story_delta(copy.deepcopy(STORY), delta)
+    )
+
+    assert new_manifest["characters"] == manifest["characters"]
+    assert new_manifest["scenes"][:2] == manifest["scenes"][:2]
+    assert set(new_chunks) - set(chunks) == set(
+        new_manifest["scenes"][2]["entries"] + [new_manifest["scenes"][3]["scene"]]
+    )
+
+
+def test_apply_story_delta():
+    """ Entries go to the last scene, before the new scenes are appended """
+    delta = StoryDelta(
+        entries=[{"seq_id": "e3"}],
+        scenes=[{"scene_seq_id": "s4", "entries": []}],
+        exported_at="2020-01-03 00:00:00 UTC",
+    )
+    story_dict = apply_story_delta(copy.deepcopy(STORY), delta)
+
+    assert story_dict["exported_at"] == "2020-01-03 00:00:00 UTC"
+    assert [scene["scene_seq_id"] for scene in story_dict["scenes"]] == [
+        "s1",
+        "s2",
+        "s3",
+        "s4",
+    ]
+    assert story_dict["scenes"][2]["entries"] == [{"seq_id": "e3"}]
+    assert story_dict["scenes"][:2] == STORY["scenes"][:2]
+
+
+def test_apply_story_delta_keeps_export_time():
+    """ A delta without an export time keeps that of the base story """
+    delta = StoryDelta(scenes=[{"scene_seq_id": "s4"}])
+    story_dict = apply_story_delta(copy.deepcopy(STORY), delta)
+
+    assert story_dict["exported_at"] == STORY["exported_at"]
+
+
+@pytest.mark.parametrize("story_dict", [{}, {"scenes": []}])
+def test_apply_story_delta_entries_without_scene(story_dict):
+    """ Entries cannot be added to a story without any scenes """
+    with pytest.raises(InvalidStoryDeltaError):
+        apply_story_delta(story_dict, StoryDelta(entries=[{"seq_id": "e1"}]))
+
+    story_dict = apply_story_delta(story_dict, StoryDelta(scenes=[{"seq_id": "s1"}]))
+    assert story_dict["scenes"] == [{"seq_id": "s1"}]